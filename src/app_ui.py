@@ -11,6 +11,7 @@ if str(SRC_DIR) not in sys.path:
     sys.path.append(str(SRC_DIR))
 
 from cloudru_agent.orchestrator.orchestrator import AgentOrchestrator  # noqa: E402
+from cloudru_agent.llm.ledger import CallLedger  # noqa: E402
 from cloudru_agent.analyzers.coverage_analyzer import CoverageAnalyzer  # noqa: E402
 from cloudru_agent.analyzers.standards_checker import StandardsChecker  # noqa: E402
 from cloudru_agent.analyzers.ui_locators_checker import UiLocatorsChecker  # noqa: E402
@@ -428,6 +429,9 @@ def main() -> None:
         st.session_state["ui_generated"] = False
     if "api_generated" not in st.session_state:
         st.session_state["api_generated"] = False
+    # журнал вызовов LLM за сессию (для вкладки аналитики)
+    if "llm_ledger" not in st.session_state:
+        st.session_state["llm_ledger"] = CallLedger()
 
     inject_cloudru_css()
 
@@ -526,13 +530,19 @@ def main() -> None:
                     st.error("Введите требования или загрузите файл.")
                 else:
                     with st.spinner("Генерируем тест-кейсы и автотесты для UI..."):
+                        # транспорт LLM — только при генерации, не при старте приложения
+                        from cloudru_agent.llm.transport import run_async
+
                         orchestrator = AgentOrchestrator(
                             ui_base_url=ui_base_url,
                             ui_feature_name=ui_feature_name,
+                            ledger=st.session_state["llm_ledger"],
                         )
-                        orchestrator.generate_ui_from_text(
-                            ui_text,
-                            str(GENERATED_UI_DIR),
+                        run_async(
+                            orchestrator.agenerate_ui_from_text(
+                                ui_text,
+                                str(GENERATED_UI_DIR),
+                            )
                         )
                     st.session_state["ui_generated"] = True
                     st.success("Готово! UI-тесты сгенерированы.")
@@ -613,10 +623,14 @@ def main() -> None:
                     with st.spinner(
                             "Разбираем OpenAPI и генерируем API-тесты (manual + pytest)..."
                     ):
-                        orchestrator = AgentOrchestrator()
-                        orchestrator.generate_api_from_openapi_text(
-                            openapi_text,
-                            str(GENERATED_API_DIR),
+                        from cloudru_agent.llm.transport import run_async
+
+                        orchestrator = AgentOrchestrator(ledger=st.session_state["llm_ledger"])
+                        run_async(
+                            orchestrator.agenerate_api_from_openapi_text(
+                                openapi_text,
+                                str(GENERATED_API_DIR),
+                            )
                         )
                     st.session_state["api_generated"] = True
                     st.success("Готово! API-тесты сгенерированы.")
@@ -804,6 +818,30 @@ def main() -> None:
 """
         st.markdown(summary_html, unsafe_allow_html=True)
 
+        # --- Вызовы LLM за сессию ---
+        ledger: CallLedger = st.session_state["llm_ledger"]
+        ledger_rows = ledger.summary()
+        if ledger_rows:
+            st.markdown("### Вызовы LLM")
+            st.dataframe(pd.DataFrame(ledger_rows), use_container_width=True, hide_index=True)
+
+            ledger_df = pd.DataFrame([vars(e) for e in ledger.entries])
+            col_json, col_csv = st.columns(2)
+            with col_json:
+                st.download_button(
+                    "Скачать журнал (JSON)",
+                    data=ledger_df.to_json(orient="records", force_ascii=False, indent=2),
+                    file_name="llm_ledger.json",
+                    mime="application/json",
+                )
+            with col_csv:
+                st.download_button(
+                    "Скачать журнал (CSV)",
+                    data=ledger_df.to_csv(index=False),
+                    file_name="llm_ledger.csv",
+                    mime="text/csv",
+                )
+
         if not has_any:
             st.info(
                 "Пока нет данных для анализа. "
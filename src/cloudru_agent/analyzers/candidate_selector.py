@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from cloudru_agent.analyzers.static_review import StaticReviewGate
+
+if TYPE_CHECKING:
+    # UiLocatorsChecker тянет playwright: нужен только если проверка локаторов включена
+    from cloudru_agent.analyzers.ui_locators_checker import UiLocatorsChecker
+
+
+@dataclass
+class CandidateScore:
+    """Оценка одного варианта теста: чем меньше key, тем лучше."""
+
+    index: int
+    syntax_error: bool
+    static_findings: int
+    locator_issues: Optional[int] = None
+
+    @property
+    def key(self) -> Tuple[bool, int, int, int]:
+        # при равенстве выигрывает более ранний кандидат (первый — обычный запрос)
+        return (self.syntax_error, self.static_findings, self.locator_issues or 0, self.index)
+
+
+class CandidateSelector:
+    """
+    Выбор лучшего из нескольких сгенерированных вариантов теста без LLM:
+    сначала StaticReviewGate (компиляция, заглушки, несуществующие API, AAA),
+    затем — для UI и только среди статически чистых вариантов, если их больше
+    одного — прогон локаторов UiLocatorsChecker (один браузер на все требования).
+
+    stats: requirements — сколько требований выбиралось, switched — сколько раз
+    победил не первый вариант, clean — сколько выбранных вариантов статически чистые.
+    """
+
+    def __init__(self, kind: str = "ui", locator_checker: Optional[UiLocatorsChecker] = None) -> None:
+        self.kind = kind
+        self.gate = StaticReviewGate(kind)
+        self.locator_checker = locator_checker if kind == "ui" else None
+        self.stats: Counter = Counter()
+
+    def score(self, candidates: Dict[str, List[str]]) -> Dict[str, List[CandidateScore]]:
+        """
+        candidates: id требования -> варианты кода теста.
+        """
+        scores: Dict[str, List[CandidateScore]] = {}
+        for req_id, codes in candidates.items():
+            scores[req_id] = []
+            for index, code in enumerate(codes):
+                findings = self.gate.check(code).findings
+                scores[req_id].append(
+                    CandidateScore(
+                        index=index,
+                        syntax_error=any(f.code == "syntax" for f in findings),
+                        static_findings=len(findings),
+                    )
+                )
+
+        if self.locator_checker is not None:
+            self._score_locators(candidates, scores)
+        return scores
+
+    def select(self, candidates: Dict[str, List[str]]) -> Dict[str, str]:
+        """
+        Лучший вариант кода по каждому требованию.
+        """
+        chosen: Dict[str, str] = {}
+        for req_id, req_scores in self.score(candidates).items():
+            best = min(req_scores, key=lambda s: s.key)
+            chosen[req_id] = candidates[req_id][best.index]
+            if len(req_scores) > 1:
+                self.stats["requirements"] += 1
+                self.stats["switched"] += int(best.index != 0)
+                self.stats["clean"] += int(best.static_findings == 0)
+        return chosen
+
+    def _score_locators(
+        self,
+        candidates: Dict[str, List[str]],
+        scores: Dict[str, List[CandidateScore]],
+    ) -> None:
+        # браузер нужен, только если статика не смогла выбрать (несколько чистых вариантов)
+        ties = {
+            req_id: [s for s in req_scores if s.static_findings == 0]
+            for req_id, req_scores in scores.items()
+        }
+        ties = {req_id: clean for req_id, clean in ties.items() if len(clean) > 1}
+        if not ties:
+            return
+
+        with tempfile.TemporaryDirectory(prefix="ui_candidates_") as tmp:
+            files: Dict[str, CandidateScore] = {}
+            for n, (req_id, clean) in enumerate(ties.items()):
+                for s in clean:
+                    name = f"test_ui_candidate_{n}_{s.index}.py"
+                    (Path(tmp) / name).write_text(candidates[req_id][s.index], encoding="utf-8")
+                    files[name] = s
+                    s.locator_issues = 0
+
+            report = self.locator_checker.analyze_dir(tmp)
+            for issue in report.issues:
+                if issue.file in files:
+                    files[issue.file].locator_issues += 1
+        self.stats["locator_checked"] += sum(len(clean) for clean in ties.values())
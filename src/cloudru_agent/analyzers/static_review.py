@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import ast
+import io
+import re
+import tokenize
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# === известные API ===
+
+# Page / Locator / BrowserContext / Keyboard / Mouse: для цепочек от page
+# проверяем, что каждое имя в цепочке есть хотя бы в одном из наборов.
+_PLAYWRIGHT_ATTRS = {
+    # page
+    "goto", "reload", "go_back", "go_forward", "close", "bring_to_front", "pause",
+    "wait_for_load_state", "wait_for_selector", "wait_for_timeout", "wait_for_url",
+    "wait_for_function", "wait_for_event", "expect_navigation", "expect_response",
+    "expect_request", "expect_popup", "expect_download", "expect_file_chooser",
+    "set_viewport_size", "set_default_timeout", "set_default_navigation_timeout",
+    "set_content", "set_extra_http_headers", "emulate_media", "add_init_script",
+    "add_script_tag", "add_style_tag", "route", "unroute", "on", "once",
+    "query_selector", "query_selector_all", "evaluate", "evaluate_handle",
+    "screenshot", "pdf", "content", "title", "url", "frames", "main_frame",
+    "frame", "frame_locator", "viewport_size", "video", "request", "context",
+    "keyboard", "mouse", "touchscreen", "is_closed", "opener",
+    # фабрики локаторов
+    "locator", "get_by_role", "get_by_text", "get_by_label", "get_by_placeholder",
+    "get_by_test_id", "get_by_alt_text", "get_by_title",
+    # locator (и устаревшие действия page.click(selector) и т.п.)
+    "all", "all_inner_texts", "all_text_contents", "and_", "or_", "blur",
+    "bounding_box", "check", "uncheck", "set_checked", "clear", "click", "dblclick",
+    "count", "dispatch_event", "drag_to", "drag_and_drop", "evaluate_all", "fill",
+    "filter", "first", "last", "nth", "focus", "get_attribute", "highlight", "hover",
+    "inner_html", "inner_text", "input_value", "is_checked", "is_disabled",
+    "is_editable", "is_enabled", "is_hidden", "is_visible", "press",
+    "press_sequentially", "scroll_into_view_if_needed", "select_option",
+    "select_text", "set_input_files", "tap", "text_content", "type", "wait_for",
+    "content_frame", "element_handle", "element_handles", "page",
+    # keyboard / mouse
+    "down", "up", "insert_text", "move", "wheel",
+    # context
+    "new_page", "pages", "cookies", "add_cookies", "clear_cookies",
+    "grant_permissions", "clear_permissions", "storage_state", "browser",
+}
+
+# методы, возвращающие обычные значения (строки, списки, dict):
+# что идёт после них в цепочке, уже не Playwright
+_PLAYWRIGHT_VALUE_METHODS = {
+    "evaluate", "evaluate_all", "all_inner_texts", "all_text_contents", "text_content",
+    "inner_text", "inner_html", "get_attribute", "input_value", "bounding_box",
+    "title", "content", "count", "url", "cookies", "storage_state", "viewport_size",
+    "is_checked", "is_disabled", "is_editable", "is_enabled", "is_hidden", "is_visible",
+}
+
+# свойства с обычными значениями (page.url — строка, page.viewport_size — dict)
+_PLAYWRIGHT_VALUE_PROPERTIES = {"url", "viewport_size"}
+
+_EXPECT_ASSERTIONS = {
+    "to_be_attached", "to_be_checked", "to_be_disabled", "to_be_editable",
+    "to_be_empty", "to_be_enabled", "to_be_focused", "to_be_hidden",
+    "to_be_in_viewport", "to_be_visible", "to_be_ok", "to_contain_text",
+    "to_have_accessible_description", "to_have_accessible_name", "to_have_attribute",
+    "to_have_class", "to_have_count", "to_have_css", "to_have_id",
+    "to_have_js_property", "to_have_role", "to_have_text", "to_have_title",
+    "to_have_url", "to_have_value", "to_have_values",
+}
+_EXPECT_ASSERTIONS |= {"not_" + name for name in _EXPECT_ASSERTIONS}
+
+_REQUESTS_ATTRS = {
+    "get", "post", "put", "patch", "delete", "head", "options", "request",
+    "Session", "session", "Request", "Response", "PreparedRequest",
+    "exceptions", "codes", "status_codes", "adapters", "auth", "utils", "structures",
+    "RequestException", "HTTPError", "ConnectionError", "Timeout", "ConnectTimeout",
+    "ReadTimeout", "TooManyRedirects", "JSONDecodeError",
+}
+
+_RESPONSE_ATTRS = {
+    "status_code", "ok", "reason", "json", "text", "content", "headers", "cookies",
+    "url", "elapsed", "history", "encoding", "apparent_encoding", "request", "raw",
+    "raise_for_status", "iter_content", "iter_lines", "links", "is_redirect",
+    "is_permanent_redirect", "next", "close",
+}
+
+_SESSION_ATTRS = {
+    "get", "post", "put", "patch", "delete", "head", "options", "request", "send",
+    "headers", "auth", "cookies", "params", "proxies", "verify", "cert", "mount",
+    "close", "hooks", "stream", "trust_env", "max_redirects", "prepare_request",
+}
+
+_HTTP_CALLS = {"get", "post", "put", "patch", "delete", "head", "options", "request"}
+
+_AAA_PHASES = ("arrange", "act", "assert")
+_STUB_COMMENT_RE = re.compile(r"\b(TODO|FIXME)\b")
+
+
+# === модели отчёта ===
+@dataclass
+class StaticFinding:
+    """Одна проблема, найденная без LLM."""
+
+    code: str
+    message: str
+    line: Optional[int] = None
+
+    def __str__(self) -> str:
+        return f"строка {self.line}: {self.message}" if self.line else self.message
+
+
+@dataclass
+class StaticReviewResult:
+    """Итог статической проверки одного файла автотеста."""
+
+    findings: List[StaticFinding] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.findings
+
+    def as_review(self) -> dict:
+        """
+        В формате ответа ревизора-модели: {"ok": bool, "problems": [...]}.
+        """
+        return {"ok": self.ok, "problems": [str(f) for f in self.findings]}
+
+
+class StaticReviewGate:
+    """
+    Детерминированная проверка сгенерированного автотеста перед LLM-ревью:
+
+    - код компилируется;
+    - нет заглушек (pass / ... вместо шага, raise NotImplementedError, TODO/FIXME);
+    - вызываются только существующие методы Playwright (page / locator / expect)
+      и requests (модуль, Session, Response);
+    - в тесте есть проверки (assert / expect), и они не тривиальные (assert True);
+    - шаги оформлены как with allure.step("Arrange/Act/Assert: ..."), по порядку,
+      в шаге Assert есть проверка.
+
+    kind: "ui" — Playwright, "api" — requests.
+    """
+
+    def __init__(self, kind: str = "ui") -> None:
+        self.kind = kind
+
+    def check(self, code: str) -> StaticReviewResult:
+        result = StaticReviewResult()
+        try:
+            tree = ast.parse(code)
+            compile(tree, "<generated test>", "exec")
+        except SyntaxError as e:
+            result.findings.append(
+                StaticFinding("syntax", f"код не компилируется: {e.msg}", e.lineno)
+            )
+            return result
+
+        tests = [
+            node for node in ast.walk(tree)
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test")
+        ]
+        if not tests:
+            result.findings.append(StaticFinding("no_test", "в файле нет тестовой функции test_*"))
+            return result
+
+        for test in tests:
+            result.findings.extend(self._stubs(test))
+            result.findings.extend(self._stub_comments(code, test))
+            result.findings.extend(self._asserts(test))
+            result.findings.extend(self._aaa_structure(test))
+        result.findings.extend(self._unknown_apis(tree))
+        return result
+
+    # --- заглушки ---
+
+    @staticmethod
+    def _stubs(test: ast.AST) -> Iterator[StaticFinding]:
+        for node in ast.walk(test):
+            body = getattr(node, "body", None)
+            # pass / ... — заглушка, только если это единственная инструкция шага или функции
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.With)) and isinstance(body, list):
+                if len(body) == 1 and _is_placeholder(body[0]):
+                    yield StaticFinding("stub", "шаг не реализован (заглушка pass / ...)", body[0].lineno)
+            if isinstance(node, ast.Raise) and node.exc is not None:
+                exc = node.exc.func if isinstance(node.exc, ast.Call) else node.exc
+                if isinstance(exc, ast.Name) and exc.id == "NotImplementedError":
+                    yield StaticFinding("stub", "raise NotImplementedError вместо реализации", node.lineno)
+
+    @staticmethod
+    def _stub_comments(code: str, test: ast.AST) -> Iterator[StaticFinding]:
+        # только комментарии внутри теста: шапка REVIEW над файлом не считается
+        start, end = test.lineno, getattr(test, "end_lineno", None) or test.lineno
+        try:
+            tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+        except (tokenize.TokenError, SyntaxError):
+            return
+        for tok in tokens:
+            if tok.type == tokenize.COMMENT and start <= tok.start[0] <= end:
+                if _STUB_COMMENT_RE.search(tok.string):
+                    yield StaticFinding("stub", f"заглушка в комментарии: {tok.string.strip()}", tok.start[0])
+
+    # --- проверки ---
+
+    @staticmethod
+    def _asserts(test: ast.AST) -> Iterator[StaticFinding]:
+        checks = 0
+        for node in ast.walk(test):
+            if isinstance(node, ast.Assert):
+                checks += 1
+                if isinstance(node.test, ast.Constant) and node.test.value:
+                    yield StaticFinding("trivial_assert", "проверка assert с константой ничего не проверяет", node.lineno)
+            elif _is_expect_assertion(node):
+                checks += 1
+        if not checks:
+            yield StaticFinding("no_assert", "в тесте нет ни одной проверки (assert / expect)", test.lineno)
+
+    @staticmethod
+    def _aaa_structure(test: ast.AST) -> Iterator[StaticFinding]:
+        phases: List[Tuple[str, ast.With]] = []
+        for node in test.body:
+            if isinstance(node, ast.With):
+                phase = _step_phase(node)
+                if phase:
+                    phases.append((phase, node))
+
+        names = [phase for phase, _ in phases]
+        missing = [p for p in _AAA_PHASES if p not in names]
+        if missing:
+            yield StaticFinding(
+                "aaa",
+                "нет шагов allure.step: " + ", ".join(p.capitalize() for p in missing),
+                test.lineno,
+            )
+        else:
+            ordered = [p for p in names if p in _AAA_PHASES]
+            if ordered != sorted(ordered, key=_AAA_PHASES.index):
+                yield StaticFinding("aaa", "шаги Arrange / Act / Assert идут не по порядку", test.lineno)
+
+        for phase, node in phases:
+            if phase == "assert" and not any(
+                isinstance(n, ast.Assert) or _is_expect_assertion(n) for n in ast.walk(node)
+            ):
+                yield StaticFinding("aaa", "в шаге Assert нет проверок", node.lineno)
+
+    # --- неизвестные API ---
+
+    def _unknown_apis(self, tree: ast.AST) -> Iterator[StaticFinding]:
+        kinds = self._variable_kinds(tree)
+        seen = set()
+
+        for node in ast.walk(tree):
+            finding = None
+            if isinstance(node, ast.Attribute) and _is_expect_call(node.value):
+                if node.attr not in _EXPECT_ASSERTIONS:
+                    finding = StaticFinding("unknown_api", f"неизвестная проверка Playwright: expect(...).{node.attr}", node.lineno)
+            elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+                kind = kinds.get(node.value.id)
+                name = node.value.id
+                if kind == "requests" and node.attr not in _REQUESTS_ATTRS:
+                    finding = StaticFinding("unknown_api", f"неизвестный API requests: {name}.{node.attr}", node.lineno)
+                elif kind == "response" and node.attr not in _RESPONSE_ATTRS:
+                    finding = StaticFinding("unknown_api", f"у Response нет атрибута: {name}.{node.attr}", node.lineno)
+                elif kind == "session" and node.attr not in _SESSION_ATTRS:
+                    finding = StaticFinding("unknown_api", f"у requests.Session нет атрибута: {name}.{node.attr}", node.lineno)
+
+            if isinstance(node, ast.Attribute) and not finding:
+                root, attrs = _playwright_chain(node)
+                if root is not None and kinds.get(root) == "page" and attrs and attrs[-1] not in _PLAYWRIGHT_ATTRS:
+                    finding = StaticFinding("unknown_api", f"неизвестный метод Playwright: {root}...{attrs[-1]}", node.lineno)
+
+            if finding and (finding.line, finding.message) not in seen:
+                seen.add((finding.line, finding.message))
+                yield finding
+
+    def _variable_kinds(self, tree: ast.AST) -> Dict[str, str]:
+        """
+        Какие имена указывают на Playwright-объекты (page, локаторы),
+        модуль requests, Session или Response.
+        """
+        kinds: Dict[str, str] = {"requests": "requests"} if self.kind == "api" else {}
+        if self.kind == "ui":
+            kinds["page"] = "page"
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                for arg in node.args.args:
+                    if isinstance(arg.annotation, ast.Name) and arg.annotation.id in ("Page", "Locator"):
+                        kinds[arg.arg] = "page"
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.name == "requests":
+                        kinds[alias.asname or "requests"] = "requests"
+
+        # несколько проходов: присваивания могут ссылаться друг на друга
+        for _ in range(3):
+            for node in ast.walk(tree):
+                if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+                    continue
+                target = node.targets[0]
+                if isinstance(target, ast.Name):
+                    kind = _value_kind(node.value, kinds)
+                    if kind:
+                        kinds[target.id] = kind
+        return kinds
+
+
+# === вспомогательные функции ===
+
+def _is_placeholder(stmt: ast.stmt) -> bool:
+    if isinstance(stmt, ast.Pass):
+        return True
+    return isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and stmt.value.value is Ellipsis
+
+
+def _is_expect_call(node: ast.AST) -> bool:
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "expect"
+
+
+def _is_expect_assertion(node: ast.AST) -> bool:
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and _is_expect_call(node.func.value)
+    )
+
+
+def _step_phase(node: ast.With) -> Optional[str]:
+    """
+    "arrange" / "act" / "assert" для with allure.step("Arrange: ..."), иначе None.
+    """
+    for item in node.items:
+        call = item.context_expr
+        if not (
+            isinstance(call, ast.Call)
+            and isinstance(call.func, ast.Attribute)
+            and call.func.attr == "step"
+            and isinstance(call.func.value, ast.Name)
+            and call.func.value.id == "allure"
+            and call.args
+        ):
+            continue
+        title = call.args[0]
+        if isinstance(title, ast.JoinedStr):
+            title = next((v for v in title.values if isinstance(v, ast.Constant)), None)
+        if isinstance(title, ast.Constant) and isinstance(title.value, str):
+            head = title.value.strip().lower()
+            for phase in _AAA_PHASES:
+                if head.startswith(phase):
+                    return phase
+            return "other"
+    return None
+
+
+def _playwright_chain(node: ast.Attribute) -> Tuple[Optional[str], List[str]]:
+    """
+    Имя в корне цепочки page.locator(...).first.click и имена атрибутов по порядку.
+    Если по пути встретился метод или свойство, возвращающие обычное значение
+    (text_content(), evaluate(), url, ...), корень не возвращается: дальше не Playwright.
+    """
+    attrs: List[str] = []
+    current: ast.AST = node
+    while True:
+        if isinstance(current, ast.Attribute):
+            if current.attr in _PLAYWRIGHT_VALUE_PROPERTIES and attrs:
+                return None, []
+            attrs.append(current.attr)
+            current = current.value
+        elif isinstance(current, ast.Call):
+            func = current.func
+            if isinstance(func, ast.Attribute) and func.attr in _PLAYWRIGHT_VALUE_METHODS and attrs:
+                return None, []
+            current = func
+        elif isinstance(current, ast.Name):
+            attrs.reverse()
+            return current.id, attrs
+        else:
+            return None, []
+
+
+def _value_kind(value: ast.AST, kinds: Dict[str, str]) -> Optional[str]:
+    if isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute) and value.func.attr in _PLAYWRIGHT_VALUE_METHODS:
+        return None
+    if isinstance(value, ast.Attribute) and value.attr in _PLAYWRIGHT_VALUE_PROPERTIES:
+        return None
+    if isinstance(value, ast.Attribute) or (isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute)):
+        node = value if isinstance(value, ast.Attribute) else value.func
+        root, attrs = _playwright_chain(node)
+        if root is not None and kinds.get(root) == "page":
+            return "page"
+
+    if isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute):
+        base = value.func.value
+        base_kind = kinds.get(base.id) if isinstance(base, ast.Name) else None
+        attr = value.func.attr
+        if base_kind == "requests" and attr in ("Session", "session"):
+            return "session"
+        if base_kind in ("requests", "session") and attr in _HTTP_CALLS:
+            return "response"
+    return None
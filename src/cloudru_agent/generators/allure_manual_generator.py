@@ -1,9 +1,21 @@
+from __future__ import annotations
+
+import asyncio
 from pathlib import Path
 from jinja2 import Template
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from cloudru_agent.models.requirements import (
+    UiRequirementsDocument,
+    UiRequirement,
+    ApiRequirementsDocument,
+    ApiRequirement,
+)
 
-from cloudru_agent.models.requirements import UiRequirementsDocument, ApiRequirementsDocument
-from cloudru_agent.llm.evolution_client import EvolutionClient
+if TYPE_CHECKING:
+    # клиенты LLM тянут за собой openai: импортируем их только для аннотаций
+    from cloudru_agent.llm.evolution_client import EvolutionClient
+    from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
 
 # --- шаблон для UI ---
 UI_MANUAL_TEMPLATE = Template(
@@ -78,77 +90,226 @@ class {{ class_name }}:
 class AllureManualGenerator:
     """
     Генерирует Python-файлы с тест-кейсами в формате Allure TestOps as Code.
+
+    batch_aaa=True — шаги AAA запрашиваются у LLM пачками (UI — по block,
+    API — по section, не больше max_batch_size требований в запросе).
+    Требования, для которых пакетный ответ пустой или битый, догенерируются поштучно.
     """
 
+    def __init__(self, batch_aaa: bool = False, max_batch_size: int = 20) -> None:
+        self.batch_aaa = batch_aaa
+        self.max_batch_size = max(1, max_batch_size)
+
+    def _batches(self, requirements: list, key: Callable) -> List[list]:
+        """
+        Группирует требования по ключу (block / section) и режет группы на пачки.
+        Одиночные требования не возвращаются — для них пакетный запрос не нужен.
+        """
+        groups: Dict[str, list] = {}
+        for req in requirements:
+            groups.setdefault(key(req), []).append(req)
+
+        batches = []
+        for group in groups.values():
+            for i in range(0, len(group), self.max_batch_size):
+                chunk = group[i:i + self.max_batch_size]
+                if len(chunk) > 1:
+                    batches.append(chunk)
+        return batches
+
+    @staticmethod
+    def _prepared_steps(prepared: Optional[Dict[str, dict]]) -> Dict[str, dict]:
+        return {req_id: result["steps"] for req_id, result in (prepared or {}).items() if result.get("steps")}
+
+    def _batch_steps(self, requirements: list, key: Callable, batch_fn: Callable) -> Dict[str, dict]:
+        steps: Dict[str, dict] = {}
+        for batch in self._batches(requirements, key):
+            try:
+                steps.update(batch_fn(batch))
+            except Exception:
+                # весь пакет догенерируется поштучно
+                pass
+        return steps
+
+    async def _abatch_steps(self, requirements: list, key: Callable, batch_fn: Callable) -> Dict[str, dict]:
+        results = await asyncio.gather(
+            *(batch_fn(batch) for batch in self._batches(requirements, key)),
+            return_exceptions=True,
+        )
+        steps: Dict[str, dict] = {}
+        for result in results:
+            if isinstance(result, dict):
+                steps.update(result)
+        return steps
+
     def generate_ui_tests(
             self,
             doc: UiRequirementsDocument,
             output_dir: str,
             llm: Optional[EvolutionClient] = None,
+            prepared: Optional[Dict[str, dict]] = None,
     ) -> None:
+        """
+        prepared — уже готовые результаты ui_steps_and_code по req.id
+        (совмещённая генерация в оркестраторе): для них LLM не вызывается.
+        """
         out = Path(output_dir)
         out.mkdir(parents=True, exist_ok=True)
 
+        ready_steps = self._prepared_steps(prepared)
+        if llm is not None and self.batch_aaa:
+            pending = [r for r in doc.requirements if r.id not in ready_steps]
+            ready_steps.update(self._batch_steps(pending, lambda r: r.block, llm.ui_aaa_batch))
+
         for req in doc.requirements:
             # генерим AAA через LLM
-            if llm is not None:
+            steps = ready_steps.get(req.id)
+            if llm is not None and steps is None:
                 steps = llm.ui_aaa_for_requirement(req)
-                arrange_step = steps["arrange"]
-                act_step = steps["act"]
-                assert_step = steps["assert"]
-            else:
-                arrange_step = "описать предусловия"
-                act_step = "выполнить действия пользователя"
-                assert_step = "проверить ожидаемый результат"
-
-            class_name = f"{req.block.title().replace('_', '')}Tests"
-            content = UI_MANUAL_TEMPLATE.render(
-                feature=doc.feature,
-                block_name=req.block,
-                class_name=class_name,
-                requirement=req,
-                arrange_step=arrange_step,
-                act_step=act_step,
-                assert_step=assert_step,
-            )
-            file_path = out / f"test_{req.id.lower()}.py"
-            file_path.write_text(content, encoding="utf-8")
-
-    def generate_api_tests(self, doc: ApiRequirementsDocument, output_dir: str, llm: Optional[EvolutionClient] = None) -> None:
+            self._write_ui_test(doc, req, out, steps)
+
+    async def agenerate_ui_tests(
+            self,
+            doc: UiRequirementsDocument,
+            output_dir: str,
+            llm: Optional[AsyncEvolutionClient] = None,
+            prepared: Optional[Dict[str, dict]] = None,
+    ) -> None:
+        """
+        Асинхронный вариант generate_ui_tests: запросы AAA по всем требованиям
+        уходят параллельно (ограничение — лимит AsyncEvolutionClient).
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+
+        ready_steps = self._prepared_steps(prepared)
+        if llm is not None and self.batch_aaa:
+            pending = [r for r in doc.requirements if r.id not in ready_steps]
+            ready_steps.update(await self._abatch_steps(pending, lambda r: r.block, llm.ui_aaa_batch))
+
+        async def _one(req: UiRequirement) -> None:
+            steps = ready_steps.get(req.id)
+            if llm is not None and steps is None:
+                steps = await llm.ui_aaa_for_requirement(req)
+            self._write_ui_test(doc, req, out, steps)
+
+        await asyncio.gather(*(_one(req) for req in doc.requirements))
+
+    def _write_ui_test(
+            self,
+            doc: UiRequirementsDocument,
+            req: UiRequirement,
+            out: Path,
+            steps: Optional[dict],
+    ) -> None:
+        if steps is not None:
+            arrange_step = steps["arrange"]
+            act_step = steps["act"]
+            assert_step = steps["assert"]
+        else:
+            arrange_step = "описать предусловия"
+            act_step = "выполнить действия пользователя"
+            assert_step = "проверить ожидаемый результат"
+
+        class_name = f"{req.block.title().replace('_', '')}Tests"
+        content = UI_MANUAL_TEMPLATE.render(
+            feature=doc.feature,
+            block_name=req.block,
+            class_name=class_name,
+            requirement=req,
+            arrange_step=arrange_step,
+            act_step=act_step,
+            assert_step=assert_step,
+        )
+        file_path = out / f"test_{req.id.lower()}.py"
+        file_path.write_text(content, encoding="utf-8")
+
+    def generate_api_tests(
+            self,
+            doc: ApiRequirementsDocument,
+            output_dir: str,
+            llm: Optional[EvolutionClient] = None,
+            prepared: Optional[Dict[str, dict]] = None,
+    ) -> None:
         """
         Генерирует ручные API-тест-кейсы (Allure TestOps as Code).
         Если передан llm — шаги Arrange/Act/Assert берём из Evolution FM.
+        prepared — уже готовые результаты api_steps_and_code по req.id.
         """
         out = Path(output_dir)
         out.mkdir(parents=True, exist_ok=True)
 
+        ready_steps = self._prepared_steps(prepared)
+        if llm is not None and self.batch_aaa:
+            pending = [r for r in doc.requirements if r.id not in ready_steps]
+            ready_steps.update(self._batch_steps(pending, lambda r: r.section, llm.api_aaa_batch))
+
         for req in doc.requirements:
-            # дефолтные шаги, если LLM не сработает
-            arrange_step = f"подготовить авторизованный запрос к {req.method} {req.path}"
-            act_step = f"отправить запрос {req.method} {req.path}"
-            assert_step = (
-                f"получить HTTP {req.success_code} и проверить тело ответа по спецификации"
-            )
-
-            if llm is not None:
+            steps = ready_steps.get(req.id)
+            if llm is not None and steps is None:
                 try:
                     steps = llm.api_aaa_steps(req)
-                    arrange_step = steps.get("arrange", arrange_step)
-                    act_step = steps.get("act", act_step)
-                    assert_step = steps.get("assert", assert_step)
                 except Exception:
                     pass
+            self._write_api_test(doc, req, out, steps)
+
+    async def agenerate_api_tests(
+            self,
+            doc: ApiRequirementsDocument,
+            output_dir: str,
+            llm: Optional[AsyncEvolutionClient] = None,
+            prepared: Optional[Dict[str, dict]] = None,
+    ) -> None:
+        """
+        Асинхронный вариант generate_api_tests.
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+
+        ready_steps = self._prepared_steps(prepared)
+        if llm is not None and self.batch_aaa:
+            pending = [r for r in doc.requirements if r.id not in ready_steps]
+            ready_steps.update(await self._abatch_steps(pending, lambda r: r.section, llm.api_aaa_batch))
+
+        async def _one(req: ApiRequirement) -> None:
+            steps = ready_steps.get(req.id)
+            if llm is not None and steps is None:
+                try:
+                    steps = await llm.api_aaa_steps(req)
+                except Exception:
+                    pass
+            self._write_api_test(doc, req, out, steps)
+
+        await asyncio.gather(*(_one(req) for req in doc.requirements))
+
+    def _write_api_test(
+            self,
+            doc: ApiRequirementsDocument,
+            req: ApiRequirement,
+            out: Path,
+            steps: Optional[dict],
+    ) -> None:
+        # дефолтные шаги, если LLM не сработает
+        arrange_step = f"подготовить авторизованный запрос к {req.method} {req.path}"
+        act_step = f"отправить запрос {req.method} {req.path}"
+        assert_step = (
+            f"получить HTTP {req.success_code} и проверить тело ответа по спецификации"
+        )
 
-            class_name = f"{req.section}ApiTests"
-            content = API_MANUAL_TEMPLATE.render(
-                feature=doc.feature,
-                requirement=req,
-                class_name=class_name,
-                arrange_step=arrange_step,
-                act_step=act_step,
-                assert_step=assert_step,
-            )
+        if steps is not None:
+            arrange_step = steps.get("arrange", arrange_step)
+            act_step = steps.get("act", act_step)
+            assert_step = steps.get("assert", assert_step)
 
-            file_path = out / f"test_{req.id.lower()}.py"
-            file_path.write_text(content, encoding="utf-8")
+        class_name = f"{req.section}ApiTests"
+        content = API_MANUAL_TEMPLATE.render(
+            feature=doc.feature,
+            requirement=req,
+            class_name=class_name,
+            arrange_step=arrange_step,
+            act_step=act_step,
+            assert_step=assert_step,
+        )
 
+        file_path = out / f"test_{req.id.lower()}.py"
+        file_path.write_text(content, encoding="utf-8")
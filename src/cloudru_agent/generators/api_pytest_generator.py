@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, List
 
 from jinja2 import Template
 
-from cloudru_agent.models.requirements import ApiRequirementsDocument
+from cloudru_agent.analyzers.candidate_selector import CandidateSelector
+from cloudru_agent.models.requirements import ApiRequirement, ApiRequirementsDocument
 
 
 API_PYTEST_TEMPLATE = Template(
@@ -46,84 +48,199 @@ class ApiPytestGenerator:
     Если передан llm, то:
     - текст шагов Arrange/Act/Assert берётся из LLM (api_aaa_steps),
     - реальный Python-код шагов берётся из LLM (api_requests_code).
+
+    fused=True — текст и код запрашиваются одним вызовом api_steps_and_code.
+
+    candidates > 1 — вариантов кода на требование несколько (api_requests_code_candidates),
+    в файл попадает лучший по StaticReviewGate (CandidateSelector).
     """
 
+    def __init__(self, fused: bool = False, candidates: int = 1) -> None:
+        self.fused = fused
+        self.candidates = max(1, candidates)
+        self.selector = CandidateSelector("api")
+
     def generate_api_tests(
         self,
         doc: ApiRequirementsDocument,
         output_dir: str,
         llm: Any | None = None,
+        prepared: Dict[str, dict] | None = None,
     ) -> None:
+        """
+        prepared — уже готовые результаты api_steps_and_code по req.id
+        (совмещённая генерация в оркестраторе): для них LLM не вызывается.
+        """
         out = Path(output_dir)
         out.mkdir(parents=True, exist_ok=True)
 
         for req in doc.requirements:
-            # --- Текстовые шаги (AAA) для подписи allure.step ---
-            arrange_step = (
-                f"подготовить url, заголовки и (при необходимости) тело запроса для "
-                f"{req.method} {req.path}"
-            )
-            act_step = f"отправить запрос {req.method} {req.path}"
-            assert_step = (
-                f"убедиться, что код ответа {req.success_code} и тело соответствует схеме"
-            )
-
-            # --- Дефолтный код, если LLM не сработает ---
-            arrange_code_lines = [
-                f'url = BASE_URL + "{req.path}"',
-                'headers = {"Authorization": f"Bearer {userPlaneApiToken}"}',
-            ]
-            act_code_lines = [
-                f"response = requests.{req.method.lower()}(",
-                "    url,",
-                "    headers=headers,",
-                ")",
-            ]
-            assert_code_lines = [
-                f"assert response.status_code == {req.success_code}",
-            ]
-
-            if llm is not None:
+            steps = None
+            code_steps = None
+            code_options = None
+
+            if prepared and req.id in prepared:
+                steps = prepared[req.id].get("steps")
+                code_steps = prepared[req.id].get("code")
+            elif llm is not None and self.fused:
+                try:
+                    fused = llm.api_steps_and_code(doc.feature, req)
+                    steps = fused.get("steps")
+                    code_steps = fused.get("code")
+                except Exception:
+                    pass
+            elif llm is not None:
                 # 1) текстовые шаги AAA
                 try:
                     steps = llm.api_aaa_steps(req)
-                    arrange_step = steps.get("arrange", arrange_step)
-                    act_step = steps.get("act", act_step)
-                    assert_step = steps.get("assert", assert_step)
                 except Exception:
                     pass
 
-                # 2) реальный Python-код для requests
+                # 2) реальный Python-код для requests (1..n вариантов)
+                try:
+                    if self.candidates > 1:
+                        code_options = llm.api_requests_code_candidates(doc.feature, req, self.candidates)
+                    else:
+                        code_steps = llm.api_requests_code(doc.feature, req)
+                except Exception:
+                    pass
+
+            self._write_test(doc, req, out, steps, code_steps, code_options)
+
+    async def agenerate_api_tests(
+        self,
+        doc: ApiRequirementsDocument,
+        output_dir: str,
+        llm: Any | None = None,
+        prepared: Dict[str, dict] | None = None,
+    ) -> None:
+        """
+        Асинхронный вариант generate_api_tests (llm — AsyncEvolutionClient).
+        Требования обрабатываются параллельно, шаги AAA и код одного
+        требования тоже запрашиваются одновременно.
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+
+        async def _one(req: ApiRequirement) -> None:
+            steps = None
+            code_steps = None
+            code_options = None
+
+            if prepared and req.id in prepared:
+                steps = prepared[req.id].get("steps")
+                code_steps = prepared[req.id].get("code")
+            elif llm is not None and self.fused:
                 try:
-                    code_steps = llm.api_requests_code(doc.feature, req)
-                    arr = code_steps.get("arrange")
-                    act = code_steps.get("act")
-                    ass = code_steps.get("assert")
-
-                    if arr:
-                        arrange_code_lines = arr
-                    if act:
-                        act_code_lines = act
-                    if ass:
-                        assert_code_lines = ass
+                    fused = await llm.api_steps_and_code(doc.feature, req)
+                    steps = fused.get("steps")
+                    code_steps = fused.get("code")
                 except Exception:
                     pass
+            elif llm is not None and self.candidates > 1:
+                steps, code_options = await asyncio.gather(
+                    llm.api_aaa_steps(req),
+                    llm.api_requests_code_candidates(doc.feature, req, self.candidates),
+                    return_exceptions=True,
+                )
+                if isinstance(steps, Exception):
+                    steps = None
+                if isinstance(code_options, Exception):
+                    code_options = None
+            elif llm is not None:
+                steps, code_steps = await asyncio.gather(
+                    llm.api_aaa_steps(req),
+                    llm.api_requests_code(doc.feature, req),
+                    return_exceptions=True,
+                )
+                if isinstance(steps, Exception):
+                    steps = None
+                if isinstance(code_steps, Exception):
+                    code_steps = None
+
+            self._write_test(doc, req, out, steps, code_steps, code_options)
+
+        await asyncio.gather(*(_one(req) for req in doc.requirements))
+
+    def _write_test(
+        self,
+        doc: ApiRequirementsDocument,
+        req: ApiRequirement,
+        out: Path,
+        steps: dict | None,
+        code_steps: dict | None,
+        code_options: List[dict] | None = None,
+    ) -> None:
+        """
+        code_options — несколько вариантов кода: в файл идёт лучший по CandidateSelector.
+        """
+        codes = [self._render_test(doc, req, steps, option) for option in (code_options or [code_steps])]
+        content = codes[0] if len(codes) == 1 else self.selector.select({req.id: codes})[req.id]
 
-            arrange_code = "\n        ".join(arrange_code_lines)
-            act_code = "\n        ".join(act_code_lines)
-            assert_code = "\n        ".join(assert_code_lines)
-
-            content = API_PYTEST_TEMPLATE.render(
-                base_url=doc.base_url,
-                feature=doc.feature,
-                requirement=req,
-                arrange_step=arrange_step,
-                act_step=act_step,
-                assert_step=assert_step,
-                arrange_code=arrange_code,
-                act_code=act_code,
-                assert_code=assert_code,
-            )
-
-            file_path = out / f"test_{req.id.lower()}.py"
-            file_path.write_text(content, encoding="utf-8")
+        file_path = out / f"test_{req.id.lower()}.py"
+        file_path.write_text(content, encoding="utf-8")
+
+    def _render_test(
+        self,
+        doc: ApiRequirementsDocument,
+        req: ApiRequirement,
+        steps: dict | None,
+        code_steps: dict | None,
+    ) -> str:
+        # --- Текстовые шаги (AAA) для подписи allure.step ---
+        arrange_step = (
+            f"подготовить url, заголовки и (при необходимости) тело запроса для "
+            f"{req.method} {req.path}"
+        )
+        act_step = f"отправить запрос {req.method} {req.path}"
+        assert_step = (
+            f"убедиться, что код ответа {req.success_code} и тело соответствует схеме"
+        )
+
+        # --- Дефолтный код, если LLM не сработает ---
+        arrange_code_lines = [
+            f'url = BASE_URL + "{req.path}"',
+            'headers = {"Authorization": f"Bearer {userPlaneApiToken}"}',
+        ]
+        act_code_lines = [
+            f"response = requests.{req.method.lower()}(",
+            "    url,",
+            "    headers=headers,",
+            ")",
+        ]
+        assert_code_lines = [
+            f"assert response.status_code == {req.success_code}",
+        ]
+
+        if steps is not None:
+            arrange_step = steps.get("arrange", arrange_step)
+            act_step = steps.get("act", act_step)
+            assert_step = steps.get("assert", assert_step)
+
+        if code_steps is not None:
+            arr = code_steps.get("arrange")
+            act = code_steps.get("act")
+            ass = code_steps.get("assert")
+
+            if arr:
+                arrange_code_lines = arr
+            if act:
+                act_code_lines = act
+            if ass:
+                assert_code_lines = ass
+
+        arrange_code = "\n        ".join(arrange_code_lines)
+        act_code = "\n        ".join(act_code_lines)
+        assert_code = "\n        ".join(assert_code_lines)
+
+        return API_PYTEST_TEMPLATE.render(
+            base_url=doc.base_url,
+            feature=doc.feature,
+            requirement=req,
+            arrange_step=arrange_step,
+            act_step=act_step,
+            assert_step=assert_step,
+            arrange_code=arrange_code,
+            act_code=act_code,
+            assert_code=assert_code,
+        )
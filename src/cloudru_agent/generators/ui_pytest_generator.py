@@ -1,10 +1,21 @@
+from __future__ import annotations
+
+import asyncio
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from jinja2 import Template
 
-from cloudru_agent.models.requirements import UiRequirementsDocument
-from cloudru_agent.llm.evolution_client import EvolutionClient
+from cloudru_agent.models.requirements import UiRequirementsDocument, UiRequirement
+from cloudru_agent.analyzers.candidate_selector import CandidateSelector
+from cloudru_agent.analyzers.static_review import StaticReviewGate
+
+if TYPE_CHECKING:
+    # клиенты LLM тянут за собой openai, проверка локаторов — playwright:
+    # импортируем их только для аннотаций
+    from cloudru_agent.llm.evolution_client import EvolutionClient
+    from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
+    from cloudru_agent.analyzers.ui_locators_checker import UiLocatorsChecker
 
 UI_PYTEST_TEMPLATE = Template(
     '''import allure
@@ -40,84 +51,254 @@ class UiPytestGenerator:
 
     Если передан llm (EvolutionClient), то шаги Arrange/Act/Assert
     генерируются моделью + проверяются ревизором.
+
+    fused=True — код и текст шагов (для подписей allure.step) запрашиваются
+    одним вызовом ui_steps_and_code.
+
+    candidates > 1 — на требование запрашивается несколько вариантов кода,
+    лучший выбирается локально (CandidateSelector: статика, а с locator_checker —
+    ещё и прогон локаторов) и только он идёт к ревизору.
+
+    Перед ревизором тест проходит StaticReviewGate: находки сразу попадают
+    в REVIEW WARNING, а чистый тест при static_gate=True ревизору не отправляется.
+    review_batch=True — ревизор-модель генератор не вызывает: тесты проверяет
+    оркестратор пакетами (review_ui_batch).
     """
 
-    def __init__(self, base_url: str = "https://cloud.ru/calculator") -> None:
+    def __init__(
+        self,
+        base_url: str = "https://cloud.ru/calculator",
+        fused: bool = False,
+        static_gate: bool = True,
+        candidates: int = 1,
+        locator_checker: Optional[UiLocatorsChecker] = None,
+        review_batch: bool = False,
+    ) -> None:
         self.base_url = base_url
+        self.fused = fused
+        self.static_gate = static_gate
+        self.candidates = max(1, candidates)
+        self.selector = CandidateSelector("ui", locator_checker)
+        self.review_batch = review_batch
 
     def generate(
         self,
         doc: UiRequirementsDocument,
         output_dir: str,
         llm: Optional[EvolutionClient] = None,
+        prepared: Optional[Dict[str, dict]] = None,
     ) -> None:
+        """
+        prepared — уже готовые результаты ui_steps_and_code по req.id
+        (совмещённая генерация в оркестраторе): для них генератор не вызывается.
+        """
         out = Path(output_dir)
         out.mkdir(parents=True, exist_ok=True)
 
+        # === 1. Генератор: просим Evolution FM сгенерировать код Playwright (1..n вариантов) ===
+        rendered = {req.id: self._render_candidates(doc, req, llm, prepared) for req in doc.requirements}
+        chosen = self._choose(rendered)
+
         for req in doc.requirements:
-            # Текстовые описания шагов (AAA)
-            arrange_text = getattr(req, "arrange", None) or "открыть страницу продукта"
-            act_text = getattr(req, "act", None) or "выполнить действия пользователя"
-            assert_text = getattr(req, "assert_", None) or "проверить ожидаемый результат"
-
-            # Дефолтный код, если LLM вдруг не сработает
-            arrange_code = "page.goto(CALC_URL)"
-            act_code = "pass  # FIXME: добавить шаги взаимодействия с UI"
-            assert_code = "pass  # FIXME: добавить проверки"
-            title_literal = repr(req.title or req.id)
-
-            # === 1. Генератор: просим Evolution FM сгенерировать код Playwright ===
-            if llm is not None:
-                try:
-                    steps = llm.ui_playwright_steps(doc.feature, req)
-                    arrange_lines = steps.get("arrange") or []
-                    act_lines = steps.get("act") or []
-                    assert_lines = steps.get("assert") or []
+            test_code = chosen[req.id]
 
-                    if arrange_lines:
-                        arrange_code = "\n        ".join(arrange_lines)
-                    else:
-                        arrange_code = "page.goto(CALC_URL)"
+            # === 2. Ревизор: статическая проверка, затем (если нужно) модель ===
+            static_review = self._static_review(test_code)
+            if static_review is not None:
+                test_code = self._with_review_warning(test_code, static_review)
+            elif llm is not None and not self.review_batch:
+                try:
+                    review = llm.review_ui_test(req.title, test_code)
+                    test_code = self._with_review_warning(test_code, review)
+                except Exception:
+                    pass
 
-                    if act_lines:
-                        act_code = "\n        ".join(act_lines)
+            file_name = f"test_ui_{req.id.lower()}.py"
+            (out / file_name).write_text(test_code, encoding="utf-8")
 
-                    if assert_lines:
-                        assert_code = "\n        ".join(assert_lines)
+    async def agenerate(
+        self,
+        doc: UiRequirementsDocument,
+        output_dir: str,
+        llm: Optional[AsyncEvolutionClient] = None,
+        prepared: Optional[Dict[str, dict]] = None,
+    ) -> None:
+        """
+        Асинхронный вариант generate: генерация и ревью по каждому требованию
+        идут параллельно (ограничение — лимит AsyncEvolutionClient).
 
-                except Exception:
-                    arrange_code = "page.goto(CALC_URL)"
-                    act_code = "pass  # LLM error, требуется доработка шага"
-                    assert_code = "pass  # LLM error, требуется доработка проверки"
-
-            # Рендерим сам тест
-            test_code = UI_PYTEST_TEMPLATE.render(
-                base_url=self.base_url,
-                feature=doc.feature,
-                block_name=req.block,
-                requirement=req,
-                title_literal=title_literal,
-                arrange_text=arrange_text,
-                act_text=act_text,
-                assert_text=assert_text,
-                arrange_code=arrange_code,
-                act_code=act_code,
-                assert_code=assert_code,
-            )
+        С проверкой локаторов варианты сначала собираются по всем требованиям:
+        браузер для выбора запускается один раз, а не на каждое требование.
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
 
-            # === 2. Ревизор: даём модели проверить сгенерированный тест ===
-            if llm is not None:
+        async def _review_and_write(req: UiRequirement, test_code: str) -> None:
+            static_review = self._static_review(test_code)
+            if static_review is not None:
+                test_code = self._with_review_warning(test_code, static_review)
+            elif llm is not None and not self.review_batch:
                 try:
-                    review = llm.review_ui_test(req.title, test_code)
-                    if not review.get("ok", True):
-                        problems = review.get("problems") or []
-                        comment = "# REVIEW WARNING: ревизор нашёл проблемы:\n"
-                        for p in problems:
-                            comment += f"# - {p}\n"
-                        comment += "\n"
-                        test_code = comment + test_code
+                    review = await llm.review_ui_test(req.title, test_code)
+                    test_code = self._with_review_warning(test_code, review)
                 except Exception:
                     pass
 
             file_name = f"test_ui_{req.id.lower()}.py"
             (out / file_name).write_text(test_code, encoding="utf-8")
+
+        if self.candidates > 1 and self.selector.locator_checker is not None:
+            codes = await asyncio.gather(
+                *(self._arender_candidates(doc, req, llm, prepared) for req in doc.requirements)
+            )
+            rendered = {req.id: req_codes for req, req_codes in zip(doc.requirements, codes)}
+            # sync Playwright нельзя запускать внутри event loop
+            chosen = await asyncio.to_thread(self._choose, rendered)
+            await asyncio.gather(*(_review_and_write(req, chosen[req.id]) for req in doc.requirements))
+            return
+
+        async def _one(req: UiRequirement) -> None:
+            req_codes = await self._arender_candidates(doc, req, llm, prepared)
+            await _review_and_write(req, self._choose({req.id: req_codes})[req.id])
+
+        await asyncio.gather(*(_one(req) for req in doc.requirements))
+
+    # --- варианты кода ---
+
+    def _sampling(self, req: UiRequirement, llm: Any, prepared: Optional[Dict[str, dict]]) -> bool:
+        return self.candidates > 1 and llm is not None and not self.fused and not (prepared and req.id in prepared)
+
+    def _render_candidates(
+        self,
+        doc: UiRequirementsDocument,
+        req: UiRequirement,
+        llm: Optional[EvolutionClient],
+        prepared: Optional[Dict[str, dict]],
+    ) -> List[str]:
+        steps: Optional[dict] = None
+        titles: Optional[dict] = None
+        llm_failed = False
+        if prepared and req.id in prepared:
+            titles, steps = prepared[req.id].get("steps"), prepared[req.id].get("code")
+        elif llm is not None:
+            try:
+                if self._sampling(req, llm, prepared):
+                    options = llm.ui_playwright_steps_candidates(doc.feature, req, self.candidates)
+                    return [self._render_test(doc, req, option) for option in options]
+                if self.fused:
+                    fused = llm.ui_steps_and_code(doc.feature, req)
+                    titles, steps = fused.get("steps"), fused.get("code")
+                else:
+                    steps = llm.ui_playwright_steps(doc.feature, req)
+            except Exception:
+                llm_failed = True
+        return [self._render_test(doc, req, steps, llm_failed, titles)]
+
+    async def _arender_candidates(
+        self,
+        doc: UiRequirementsDocument,
+        req: UiRequirement,
+        llm: Optional[AsyncEvolutionClient],
+        prepared: Optional[Dict[str, dict]],
+    ) -> List[str]:
+        steps: Optional[dict] = None
+        titles: Optional[dict] = None
+        llm_failed = False
+        if prepared and req.id in prepared:
+            titles, steps = prepared[req.id].get("steps"), prepared[req.id].get("code")
+        elif llm is not None:
+            try:
+                if self._sampling(req, llm, prepared):
+                    options = await llm.ui_playwright_steps_candidates(doc.feature, req, self.candidates)
+                    return [self._render_test(doc, req, option) for option in options]
+                if self.fused:
+                    fused = await llm.ui_steps_and_code(doc.feature, req)
+                    titles, steps = fused.get("steps"), fused.get("code")
+                else:
+                    steps = await llm.ui_playwright_steps(doc.feature, req)
+            except Exception:
+                llm_failed = True
+        return [self._render_test(doc, req, steps, llm_failed, titles)]
+
+    def _choose(self, rendered: Dict[str, List[str]]) -> Dict[str, str]:
+        """
+        По одному коду теста на требование: из нескольких вариантов — лучший по CandidateSelector.
+        """
+        chosen = {req_id: codes[0] for req_id, codes in rendered.items()}
+        multiple = {req_id: codes for req_id, codes in rendered.items() if len(codes) > 1}
+        if multiple:
+            chosen.update(self.selector.select(multiple))
+        return chosen
+
+    def _render_test(
+        self,
+        doc: UiRequirementsDocument,
+        req: UiRequirement,
+        steps: Optional[dict],
+        llm_failed: bool = False,
+        titles: Optional[dict] = None,
+    ) -> str:
+        # Текстовые описания шагов (AAA): из совмещённой генерации, если есть
+        titles = titles or {}
+        arrange_text = titles.get("arrange") or getattr(req, "arrange", None) or "открыть страницу продукта"
+        act_text = titles.get("act") or getattr(req, "act", None) or "выполнить действия пользователя"
+        assert_text = titles.get("assert") or getattr(req, "assert_", None) or "проверить ожидаемый результат"
+
+        # Дефолтный код, если LLM вдруг не сработает
+        arrange_code = "page.goto(CALC_URL)"
+        act_code = "pass  # FIXME: добавить шаги взаимодействия с UI"
+        assert_code = "pass  # FIXME: добавить проверки"
+        title_literal = repr(req.title or req.id)
+
+        if llm_failed or (steps is not None and not isinstance(steps, dict)):
+            act_code = "pass  # LLM error, требуется доработка шага"
+            assert_code = "pass  # LLM error, требуется доработка проверки"
+        elif steps is not None:
+            arrange_lines = steps.get("arrange") or []
+            act_lines = steps.get("act") or []
+            assert_lines = steps.get("assert") or []
+
+            if arrange_lines:
+                arrange_code = "\n        ".join(arrange_lines)
+
+            if act_lines:
+                act_code = "\n        ".join(act_lines)
+
+            if assert_lines:
+                assert_code = "\n        ".join(assert_lines)
+
+        # Рендерим сам тест
+        return UI_PYTEST_TEMPLATE.render(
+            base_url=self.base_url,
+            feature=doc.feature,
+            block_name=req.block,
+            requirement=req,
+            title_literal=title_literal,
+            arrange_text=arrange_text,
+            act_text=act_text,
+            assert_text=assert_text,
+            arrange_code=arrange_code,
+            act_code=act_code,
+            assert_code=assert_code,
+        )
+
+    def _static_review(self, test_code: str) -> Optional[dict]:
+        """
+        Вердикт без модели: ревью с находками, {"ok": True} для чистого теста
+        при static_gate, иначе None — нужен ревизор-модель.
+        """
+        result = StaticReviewGate("ui").check(test_code)
+        if not result.ok or self.static_gate:
+            return result.as_review()
+        return None
+
+    @staticmethod
+    def _with_review_warning(test_code: str, review: dict) -> str:
+        if review.get("ok", True):
+            return test_code
+        problems = review.get("problems") or []
+        comment = "# REVIEW WARNING: ревизор нашёл проблемы:\n"
+        for p in problems:
+            comment += f"# - {p}\n"
+        comment += "\n"
+        return comment + test_code
@@ -0,0 +1,481 @@
+import asyncio
+import contextlib
+import time
+from dataclasses import replace
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List
+
+from openai import AsyncOpenAI
+
+from cloudru_agent.llm.cassette import Cassette
+from cloudru_agent.llm.chunking import RequirementMerger
+from cloudru_agent.llm.completion_cache import CompletionCache
+from cloudru_agent.llm.concurrency import AimdLimiter, ConcurrencyController, is_throttle, retry_after_seconds
+from cloudru_agent.llm.evolution_client import BaseEvolutionClient, ChatCall
+from cloudru_agent.llm.exemplars import ExemplarIndex
+from cloudru_agent.llm.hedging import HedgePolicy
+from cloudru_agent.llm.json_stream import JsonArrayStream
+from cloudru_agent.llm.ledger import CallLedger
+from cloudru_agent.llm.output_budget import OutputBudget
+from cloudru_agent.llm.quota import SharedQuota
+from cloudru_agent.llm.routing import RoutingTable
+from cloudru_agent.llm.single_flight import single_flight
+from cloudru_agent.llm.transport import transports
+from cloudru_agent.models.requirements import UiRequirementsDocument, UiRequirement
+
+
+class AsyncEvolutionClient(BaseEvolutionClient):
+    """
+    Асинхронный клиент Evolution Foundation Models (AsyncOpenAI).
+
+    Промпты и разбор ответов те же, что у EvolutionClient,
+    но методы — корутины. Число одновременных запросов к каждой модели
+    ограничено адаптивным лимитом (ConcurrencyController): стартует с max_concurrency
+    (по умолчанию EVOLUTION_MAX_CONCURRENCY или 8), растёт, пока эндпоинт отвечает,
+    и снижается на 429/503, поэтому генераторы могут запускать запросы по всем
+    требованиям сразу.
+
+    Соединения берутся из общего пула event loop (llm/transport.py); чтобы пул
+    переживал запуски, флоу запускают через run_async, а не asyncio.run.
+
+    hedging (EVOLUTION_HEDGE=1) — дублировать запросы, которые отвечают дольше
+    перцентиля задержки своего метода (см. HedgePolicy).
+    """
+
+    def __init__(
+        self,
+        gen_model: str | None = None,
+        review_model: str | None = None,
+        max_concurrency: int | None = None,
+        cache: CompletionCache | None = None,
+        cache_bypass: bool = False,
+        ledger: CallLedger | None = None,
+        max_retries: int = 2,
+        concurrency: ConcurrencyController | None = None,
+        routing: RoutingTable | None = None,
+        base_url: str | None = None,
+        hedging: HedgePolicy | None = None,
+        structured_outputs: bool | None = None,
+        refine_edits: bool | None = None,
+        output_budget: OutputBudget | None = None,
+        exemplars: ExemplarIndex | None = None,
+        cassette: Cassette | None = None,
+        quota: SharedQuota | None = None,
+    ) -> None:
+        super().__init__(
+            gen_model=gen_model,
+            review_model=review_model,
+            cache=cache,
+            cache_bypass=cache_bypass,
+            ledger=ledger,
+            max_retries=max_retries,
+            concurrency=concurrency or ConcurrencyController.from_env(initial=max_concurrency),
+            routing=routing,
+            base_url=base_url,
+            structured_outputs=structured_outputs,
+            refine_edits=refine_edits,
+            output_budget=output_budget,
+            exemplars=exemplars,
+            cassette=cassette,
+            quota=quota,
+        )
+
+        # пул соединений общий для клиентов в этом event loop (llm/transport.py)
+        self.client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            max_retries=0,
+            http_client=transports.async_http_client(self.base_url, self.api_key, self.pool_size),
+        )
+
+        self.max_concurrency = self.concurrency.initial
+        # None — без хеджирования
+        self.hedging = hedging if hedging is not None else HedgePolicy.from_env()
+
+    # --- базовый чат-запрос ---
+
+    async def _complete(self, call: ChatCall) -> str | None:
+        content = await self._request(call)
+        retry = self._schema_retry_call(call, content)
+        return content if retry is None else await self._request(retry)
+
+    async def _request(self, call: ChatCall) -> str | None:
+        cassette_key = self._cassette_key(call) if self.cassette is not None else None
+        if self._replaying():
+            entry = self._cassette_take(cassette_key)
+            delay = self.cassette.delay(entry)
+            if delay:
+                await asyncio.sleep(delay)
+            call = replace(cassette_key, model=entry.model)
+            self._record(call, entry.content, source="replay", response=entry.response(), latency_s=delay)
+            return entry.content
+
+        call = self.routing.apply(call, self.ledger)
+
+        cached = self._cache_get(call)
+        if cached is not None:
+            self._record(call, cached, source="cache")
+            return cached
+
+        # одинаковый запрос уже отправлен другой задачей / потоком — ждём его ответ
+        content, shared = await single_flight.arun(
+            self._flight_key(call), lambda: self._fetch(call, cassette_key), call.method
+        )
+        if shared:
+            self._record(call, content, source="coalesced")
+        return content
+
+    async def _fetch(self, call: ChatCall, cassette_key: ChatCall | None = None) -> str | None:
+        state = self._fetch_state(call, cassette_key)
+        try:
+            while True:
+                cost = self._attempt_cost(state)
+                if cost is not None:
+                    await self.quota.aacquire(state.call.model, cost)
+                # слот держим только на время запроса, не на время паузы перед ретраем
+                await state.limiter.aacquire()
+                self._attempt_sent(state)
+                try:
+                    response = await self._send(state.call, state.limiter)
+                except BaseException as e:
+                    delay = self._attempt_failed(state, e)
+                    if delay:
+                        await asyncio.sleep(delay)
+                    continue
+                if self._attempt_succeeded(state, response):
+                    return self._fetch_result(state, response)
+        finally:
+            self._quota_refund(state)
+
+    async def _send(self, call: ChatCall, limiter: AimdLimiter) -> Any:
+        """
+        Запрос к chat.completions. С хеджированием: если ответа нет дольше порога
+        метода и есть свободный слот и бюджет дублей — шлём дубль, берём первый ответ.
+        """
+        kwargs = call.create_kwargs()
+        if self.hedging is None:
+            return await self.client.chat.completions.create(**kwargs)
+
+        started = time.perf_counter()
+        delay = self.hedging.delay_for(call.method, call.model)
+        primary = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                # дубль тратит квоту, общую с другими процессами: при квоте на модель не хеджируем
+                if not done and self._quota_cost(call) is None and limiter.try_acquire():
+                    if self.hedging.admit():
+                        return await self._hedged(call, kwargs, limiter, primary, delay, started)
+                    limiter.release()
+            response = await primary
+        finally:
+            if not primary.done():
+                primary.cancel()
+        self.hedging.observe(call.method, call.model, time.perf_counter() - started)
+        return response
+
+    async def _hedged(
+        self,
+        call: ChatCall,
+        kwargs: Dict[str, Any],
+        limiter: AimdLimiter,
+        primary: "asyncio.Future[Any]",
+        delay: float,
+        started: float,
+    ) -> Any:
+        """
+        Гонка основного запроса и дубля (дубль уже занял слот limiter).
+        Ошибка одного — ждём второй; упали оба — ошибка основного.
+        """
+        hedge_sent = time.perf_counter()
+        hedge = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # exception() у всех завершённых: иначе asyncio ругается на непрочитанные ошибки
+                succeeded = [task for task in (primary, hedge) if task in done and task.exception() is None]
+                winner = succeeded[0] if succeeded else None
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+            self._release_hedge(limiter, hedge, hedge_sent)
+
+        if winner is None:
+            raise primary.exception()
+
+        elapsed = time.perf_counter() - started
+        if winner is hedge:
+            self.hedging.record_win(call.method, call.model, delay, elapsed)
+        self.hedging.observe(call.method, call.model, elapsed)
+        return winner.result()
+
+    @staticmethod
+    def _release_hedge(limiter: AimdLimiter, hedge: "asyncio.Future[Any]", sent: float) -> None:
+        if not hedge.done() or hedge.cancelled():
+            limiter.release()
+        elif hedge.exception() is None:
+            limiter.release(latency_s=time.perf_counter() - sent)
+        else:
+            error = hedge.exception()
+            limiter.release(throttled=is_throttle(error), retry_after=retry_after_seconds(error))
+
+    async def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        """
+        Асинхронный вариант EvolutionClient.chat.
+        """
+        return await self._complete(self._chat_call(messages, **kwargs)) or ""
+
+    # =====================================================================
+    # UI: требования + AAA + Playwright
+    # =====================================================================
+
+    async def ui_requirements_from_text(
+        self,
+        text: str,
+        feature: str | None = None,
+    ) -> UiRequirementsDocument:
+        calls = self._ui_requirements_calls(text, feature)
+        contents = await asyncio.gather(*(self._complete(call) for call in calls))
+        return self._ui_requirements_merged(feature, list(contents))
+
+    async def ui_requirements_stream(
+        self,
+        text: str,
+        feature: str | None = None,
+    ) -> AsyncIterator[UiRequirement]:
+        """
+        Требования из текста по одному, по мере того как модель их выписывает
+        (stream=True): генерацию тестов можно начинать, не дожидаясь конца ответа.
+        Куски длинного текста идут параллельно, требования склеиваются
+        так же, как в ui_requirements_from_text (RequirementMerger).
+        """
+        calls = self._ui_requirements_calls(text, feature)
+        queue: "asyncio.Queue[UiRequirement | None]" = asyncio.Queue()
+
+        async def produce(call: ChatCall) -> None:
+            try:
+                async for req in self._stream_requirements(call):
+                    queue.put_nowait(req)
+            finally:
+                # конец куска (в том числе с ошибкой) — ошибка поднимется из задачи ниже
+                queue.put_nowait(None)
+
+        tasks = [asyncio.ensure_future(produce(call)) for call in calls]
+        merger = RequirementMerger()
+        try:
+            running = len(tasks)
+            while running:
+                req = await queue.get()
+                if req is None:
+                    running -= 1
+                    continue
+                req = merger.add(req)
+                if req is not None:
+                    yield req
+            for task in tasks:
+                task.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _stream_requirements(self, call: ChatCall) -> AsyncIterator[UiRequirement]:
+        """
+        Требования одного запроса. Кэш, кассета и ошибка потока — обычный запрос
+        (_complete) целиком; в конце ответ всё равно разбирается полностью:
+        требования, не разобранные по ходу, добавятся, повторы отбросит RequirementMerger.
+        """
+        content = None
+        streamed = 0
+        if not self._replaying():
+            routed = self.routing.apply(call, self.ledger)
+            cassette_key = self._cassette_key(call) if self.cassette is not None else None
+            content = self._cache_get(routed)
+            if content is not None:
+                self._record(routed, content, source="cache")
+            else:
+                stream = JsonArrayStream("requirements")
+                try:
+                    # aclosing: если потребитель перестал читать, слот лимита вернётся сразу, а не при сборке мусора
+                    async with contextlib.aclosing(self._fetch_stream(routed, stream, cassette_key)) as items:
+                        async for item in items:
+                            if not isinstance(item, dict):
+                                continue
+                            try:
+                                req = UiRequirement(**item)
+                            except (TypeError, ValueError):
+                                continue
+                            streamed += 1
+                            yield req
+                    content = stream.text
+                except Exception:
+                    content = None
+
+        if content is None:
+            content = await self._complete(call)
+        try:
+            doc = self._ui_requirements_result(content)
+        except ValueError:
+            if streamed:
+                return
+            # ответ потока не разобрался и требований из него нет — обычный запрос с повтором по схеме
+            doc = self._ui_requirements_result(await self._complete(call))
+        for req in doc.requirements:
+            yield req
+
+    async def _fetch_stream(
+        self,
+        call: ChatCall,
+        stream: JsonArrayStream,
+        cassette_key: ChatCall | None = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Запрос с stream=True: объекты массива из ответа отдаются по мере закрытия.
+        Без ретраев и хеджирования — при ошибке вызывающий переходит на обычный запрос.
+        """
+        state = self._fetch_state(call, cassette_key)
+        # лимит бюджета к потоку не применяется, длина ответа идёт в историю метода
+        state.budgeted = True
+        try:
+            cost = self._attempt_cost(state)
+            if cost is not None:
+                await self.quota.aacquire(state.call.model, cost)
+            await state.limiter.aacquire()
+            self._attempt_sent(state)
+            usage = None
+            finish_reason = None
+            try:
+                response = await self.client.chat.completions.create(
+                    **state.call.create_kwargs(),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async with response:
+                    async for chunk in response:
+                        usage = getattr(chunk, "usage", None) or usage
+                        for choice in chunk.choices or []:
+                            finish_reason = choice.finish_reason or finish_reason
+                            delta = getattr(choice.delta, "content", None)
+                            if delta:
+                                for item in stream.feed(delta):
+                                    yield item
+            except BaseException as e:
+                # включая CancelledError и GeneratorExit; без повторов — вызывающий перейдёт на обычный запрос
+                self._attempt_failed(state, e, retry=False)
+
+            response = SimpleNamespace(
+                usage=usage,
+                choices=[SimpleNamespace(finish_reason=finish_reason, message=SimpleNamespace(content=stream.text))],
+            )
+            self._attempt_succeeded(state, response)
+            self._fetch_result(state, response)
+        finally:
+            # в том числе поток, закрытый вызывающим до ответа
+            self._quota_refund(state)
+
+    async def ui_aaa_for_requirement(self, requirement: UiRequirement) -> dict:
+        call = self._ui_aaa_call(requirement)
+        return self._ui_aaa_result(requirement, await self._complete(call))
+
+    async def ui_aaa_batch(self, requirements: List[UiRequirement]) -> Dict[str, dict]:
+        call = self._ui_aaa_batch_call(requirements)
+        return self._aaa_batch_result(requirements, await self._complete(call))
+
+    async def ui_playwright_steps(self, feature: str, requirement) -> dict:
+        call = self._ui_playwright_steps_call(feature, requirement)
+        return self._ui_playwright_steps_result(await self._complete(call))
+
+    async def ui_playwright_steps_candidates(self, feature: str, requirement, n: int) -> List[dict]:
+        calls = self._candidate_calls(self._ui_playwright_steps_call(feature, requirement), n)
+        contents = await asyncio.gather(*(self._complete(call) for call in calls), return_exceptions=True)
+        return self._candidate_results(
+            [c if isinstance(c, BaseException) else self._ui_playwright_steps_result(c) for c in contents]
+        )
+
+    async def ui_steps_and_code(self, feature: str, requirement: UiRequirement) -> dict:
+        call = self._fused_call(self._ui_playwright_steps_call(feature, requirement), "ui_steps_and_code")
+        return self._ui_steps_and_code_result(requirement, await self._complete(call))
+
+    async def review_ui_test(self, requirement_title: str, test_code: str) -> dict:
+        call = self._review_ui_test_call(requirement_title, test_code)
+        return self._review_result(await self._complete(call))
+
+    async def review_ui_batch(self, items: List[tuple]) -> Dict[str, dict]:
+        calls = {req.id: self._review_ui_test_call(req.title, code) for req, code in items}
+        return await self._review_batches(self._review_batch_calls("review_ui_batch", calls))
+
+    async def _review_batches(self, batches: List[tuple[List[str], ChatCall]]) -> Dict[str, dict]:
+        contents = await asyncio.gather(*(self._complete(call) for _, call in batches), return_exceptions=True)
+        result: Dict[str, dict] = {}
+        for (ids, _), content in zip(batches, contents):
+            if not isinstance(content, BaseException):
+                result.update(self._review_batch_result(ids, content))
+        return result
+
+    async def refine_ui_test_with_feedback(
+        self,
+        feature: str,
+        requirement: UiRequirement,
+        old_code: str,
+        review: dict,
+    ) -> str:
+        if self.refine_edits:
+            call = self._refine_ui_test_call(feature, requirement, old_code, review, edits=True)
+            code = self._refine_edits_result(old_code, await self._complete(call))
+            if code is not None:
+                return code
+        call = self._refine_ui_test_call(feature, requirement, old_code, review)
+        return await self._complete(call) or ""
+
+    # =====================================================================
+    # API: AAA (текст) + код requests + ревью
+    # =====================================================================
+
+    async def api_aaa_steps(self, requirement) -> dict:
+        call = self._api_aaa_call(requirement)
+        return self._api_aaa_result(requirement, await self._complete(call))
+
+    async def api_aaa_batch(self, requirements: list) -> Dict[str, dict]:
+        call = self._api_aaa_batch_call(requirements)
+        return self._aaa_batch_result(requirements, await self._complete(call))
+
+    async def api_requests_code(self, feature: str, requirement) -> dict:
+        call = self._api_requests_code_call(feature, requirement)
+        return self._api_requests_code_result(requirement, await self._complete(call))
+
+    async def api_requests_code_candidates(self, feature: str, requirement, n: int) -> List[dict]:
+        calls = self._candidate_calls(self._api_requests_code_call(feature, requirement), n)
+        contents = await asyncio.gather(*(self._complete(call) for call in calls), return_exceptions=True)
+        return self._candidate_results(
+            [c if isinstance(c, BaseException) else self._api_requests_code_result(requirement, c) for c in contents]
+        )
+
+    async def api_steps_and_code(self, feature: str, requirement) -> dict:
+        call = self._fused_call(self._api_requests_code_call(feature, requirement), "api_steps_and_code")
+        return self._api_steps_and_code_result(requirement, await self._complete(call))
+
+    async def review_api_test(self, requirement, test_code: str) -> dict:
+        call = self._review_api_test_call(requirement, test_code)
+        return self._review_result(await self._complete(call))
+
+    async def review_api_batch(self, items: List[tuple]) -> Dict[str, dict]:
+        calls = {req.id: self._review_api_test_call(req, code) for req, code in items}
+        return await self._review_batches(self._review_batch_calls("review_api_batch", calls))
+
+    async def refine_api_test_with_feedback(
+        self,
+        requirement,
+        old_code: str,
+        review: dict,
+        base_url: str,
+    ) -> str:
+        if self.refine_edits:
+            call = self._refine_api_test_call(requirement, old_code, review, base_url, edits=True)
+            code = self._refine_edits_result(old_code, await self._complete(call))
+            if code is not None:
+                return code
+        call = self._refine_api_test_call(requirement, old_code, review, base_url)
+        return await self._complete(call) or ""
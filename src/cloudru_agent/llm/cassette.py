@@ -0,0 +1,190 @@
+import atexit
+import gzip
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+
+class CassetteMiss(LookupError):
+    """
+    В кассете нет ответа на запрос: промпт, модель или параметры запроса
+    изменились с момента записи.
+    """
+
+
+@dataclass
+class CassetteEntry:
+    """Записанный ответ модели на запрос с fingerprint key."""
+
+    key: str
+    method: str
+    model: str
+    content: str | None
+    latency_s: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    finish_reason: str | None = None
+
+    def response(self) -> Any:
+        """
+        Минимальный ответ chat.completions для журнала вызовов: usage и finish_reason.
+        """
+        return SimpleNamespace(
+            usage=SimpleNamespace(prompt_tokens=self.prompt_tokens, completion_tokens=self.completion_tokens),
+            choices=[SimpleNamespace(finish_reason=self.finish_reason)],
+        )
+
+
+class Cassette:
+    """
+    Запись и воспроизведение ответов модели для детерминированных офлайн-прогонов.
+
+    mode="record": каждый ответ эндпоинта пишется в файл строкой JSON (jsonl, .gz — сжатый)
+    под fingerprint запроса (модель, сообщения, temperature, response_format) вместе
+    с задержкой и токенами. Файл перезаписывается при открытии.
+
+    mode="replay": ответы отдаются из файла, без сети, кэша и лимитов одновременных
+    запросов. latency_scale — доля записанной задержки: 0 — со скоростью памяти,
+    1 — как при записи. Одинаковые запросы получают записанные ответы по очереди,
+    после последнего — снова последний. Запрос, которого нет в кассете, — CassetteMiss.
+    """
+
+    def __init__(self, path: str | Path, mode: str = "replay", latency_scale: float = 0.0) -> None:
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode!r} (expected 'record' or 'replay')")
+        self.path = Path(path).expanduser()
+        self.mode = mode
+        self.latency_scale = latency_scale
+
+        self.recorded = 0
+        self.replayed = 0
+        self.misses: List[str] = []
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[CassetteEntry]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._file = None
+        if mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self._open("wt")
+        else:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _open(self, mode: str):
+        if self.path.suffix == ".gz":
+            return gzip.open(self.path, mode, encoding="utf-8")
+        return self.path.open(mode, encoding="utf-8")
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        with self._open("rt") as f:
+            for line in f:
+                if line.strip():
+                    entry = CassetteEntry(**json.loads(line))
+                    self._entries.setdefault(entry.key, []).append(entry)
+
+    def put(self, key: str, method: str, model: str, content: str | None, response: Any, latency_s: float) -> None:
+        """
+        Ответ эндпоинта на запрос с fingerprint key (только в режиме записи).
+        """
+        usage = getattr(response, "usage", None)
+        choices = getattr(response, "choices", None) or []
+        entry = CassetteEntry(
+            key=key,
+            method=method,
+            model=model,
+            content=content,
+            latency_s=round(latency_s, 4),
+            prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+            finish_reason=getattr(choices[0], "finish_reason", None) if choices else None,
+        )
+        with self._lock:
+            self._file.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def take(self, key: str, method: str) -> CassetteEntry:
+        """
+        Следующий записанный ответ на запрос с fingerprint key; нет — CassetteMiss.
+        """
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses.append(method)
+                raise CassetteMiss(
+                    f"{method}: запроса {key[:12]} нет в кассете {self.path} — "
+                    "промпт или параметры изменились с момента записи, перезапишите кассету"
+                )
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            self.replayed += 1
+            return entries[min(i, len(entries) - 1)]
+
+    def delay(self, entry: CassetteEntry) -> float:
+        return entry.latency_s * self.latency_scale
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": str(self.path),
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": len(self.misses),
+            }
+
+
+_cassettes: Dict[Path, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def open_cassette(path: str | Path, mode: str = "replay", latency_scale: float = 0.0) -> Cassette:
+    """
+    Кассета на процесс: клиенты одного прогона (sync и async, все флоу) пишут в один файл
+    и читают одну очередь ответов.
+    """
+    key = Path(path).expanduser().resolve()
+    with _cassettes_lock:
+        cassette = _cassettes.get(key)
+        if cassette is None or cassette.mode != mode:
+            if cassette is not None:
+                cassette.close()
+            cassette = _cassettes[key] = Cassette(key, mode=mode, latency_scale=latency_scale)
+            # сжатый файл без закрытия не дочитать: gzip пишет концовку при close
+            atexit.register(cassette.close)
+        cassette.latency_scale = latency_scale
+        return cassette
+
+
+def cassette_from_env() -> Cassette | None:
+    """
+    Кассета по переменным окружения:
+    - EVOLUTION_CASSETTE — путь к файлу (.jsonl или .jsonl.gz); не задан — без кассеты;
+    - EVOLUTION_CASSETTE_MODE — record или replay (по умолчанию replay);
+    - EVOLUTION_CASSETTE_LATENCY — доля записанной задержки при воспроизведении
+      (0 — со скоростью памяти, 1 — как при записи).
+    """
+    path = os.getenv("EVOLUTION_CASSETTE")
+    if not path:
+        return None
+    return open_cassette(
+        path,
+        mode=os.getenv("EVOLUTION_CASSETTE_MODE", "replay").lower(),
+        latency_scale=float(os.getenv("EVOLUTION_CASSETTE_LATENCY", "0")),
+    )
@@ -0,0 +1,113 @@
+import re
+from typing import Iterable, List
+
+from cloudru_agent.models.requirements import UiRequirement, UiRequirementsDocument
+
+
+# Строка-заголовок: markdown (#, ##), «Блок 3.», «Раздел 2», «1.2 Название»
+HEADING_RE = re.compile(
+    r"^\s*(#{1,6}\s+\S|(блок|раздел|глава|экран|block|section|chapter)\s*\d|\d+(\.\d+)*\.?\s+[A-ZА-ЯЁ])",
+    re.IGNORECASE,
+)
+
+
+def split_sections(text: str) -> List[str]:
+    """
+    Делит текст требований на секции: каждая начинается с заголовка
+    (текст до первого заголовка — отдельная секция).
+    """
+    sections: List[List[str]] = [[]]
+    for line in text.splitlines():
+        if HEADING_RE.match(line) and any(s.strip() for s in sections[-1]):
+            sections.append([])
+        sections[-1].append(line)
+    return ["\n".join(lines).strip() for lines in sections if any(s.strip() for s in lines)]
+
+
+def _split_oversized(section: str, max_chars: int) -> List[str]:
+    """
+    Секция больше лимита режется по абзацам, а абзац — по строкам.
+    """
+    parts: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", section):
+        if len(paragraph) <= max_chars:
+            parts.append(paragraph)
+            continue
+        parts.extend(paragraph.splitlines())
+    return parts
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """
+    Упаковывает секции подряд в куски не длиннее max_chars (по возможности):
+    границы кусков проходят по заголовкам блоков, порядок текста сохраняется.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces: List[str] = []
+    for section in split_sections(text):
+        if len(section) <= max_chars:
+            pieces.append(section)
+        else:
+            pieces.extend(_split_oversized(section, max_chars))
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class RequirementMerger:
+    """
+    Склейка требований из нескольких кусков по одному, в порядке поступления.
+
+    Повтор того же требования (id и название совпадают, в том числе с уже
+    переименованным) отбрасывается; если id совпал у разных требований,
+    второму добавляется суффикс _2, _3...
+    """
+
+    def __init__(self) -> None:
+        self.requirements: List[UiRequirement] = []
+        self._titles: dict = {}
+        self._seen: set = set()
+
+    def add(self, req: UiRequirement) -> UiRequirement | None:
+        """
+        Требование для документа (возможно, с новым id) или None — это повтор.
+        """
+        title = req.title.strip().lower()
+        if (req.id, title) in self._seen or self._titles.get(req.id) == title:
+            return None
+        self._seen.add((req.id, title))
+        if req.id in self._titles:
+            n = 2
+            while f"{req.id}_{n}" in self._titles:
+                n += 1
+            req = req.model_copy(update={"id": f"{req.id}_{n}"})
+        self._titles[req.id] = title
+        self.requirements.append(req)
+        return req
+
+
+def merge_requirement_documents(
+    documents: Iterable[UiRequirementsDocument],
+    feature: str | None = None,
+) -> UiRequirementsDocument:
+    """
+    Склеивает документы по кускам в порядке кусков (см. RequirementMerger).
+    """
+    documents = list(documents)
+    merger = RequirementMerger()
+    for doc in documents:
+        for req in doc.requirements:
+            merger.add(req)
+
+    feature_name = feature or next((d.feature for d in documents if d.feature), "UI продукта")
+    return UiRequirementsDocument(feature=feature_name, requirements=merger.requirements)
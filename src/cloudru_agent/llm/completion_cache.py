@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "cloudru_agent" / "completions.sqlite"
+
+
+class CompletionCache:
+    """
+    Дисковый кэш ответов chat.completions (sqlite).
+
+    Ключ — fingerprint запроса (хэш model + messages + temperature + response_format),
+    значение — message.content. Размер ограничен max_bytes: при переполнении
+    удаляются давно не использованные записи (LRU). ttl_seconds — необязательный
+    срок жизни записи.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_CACHE_PATH,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        self.path = Path(path).expanduser()
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions (accessed_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "CompletionCache | None":
+        """
+        Кэш по переменным окружения:
+        - EVOLUTION_CACHE=0 — кэш выключен;
+        - EVOLUTION_CACHE_PATH — путь к sqlite-файлу;
+        - EVOLUTION_CACHE_MAX_MB — лимит размера;
+        - EVOLUTION_CACHE_TTL — срок жизни записи в секундах.
+        """
+        if os.getenv("EVOLUTION_CACHE", "1").lower() in ("0", "false", "no", "off"):
+            return None
+
+        ttl = os.getenv("EVOLUTION_CACHE_TTL")
+        return cls(
+            path=os.getenv("EVOLUTION_CACHE_PATH") or DEFAULT_CACHE_PATH,
+            max_bytes=int(float(os.getenv("EVOLUTION_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            ttl_seconds=float(ttl) if ttl else None,
+        )
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, content, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM completions ORDER BY accessed_at ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict
+
+
+# статусы, на которые эндпоинт отвечает при перегрузке
+THROTTLE_STATUSES = (429, 503)
+
+
+def is_throttle(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) in THROTTLE_STATUSES
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """
+    Пауза из заголовков ответа (retry-after-ms / Retry-After: секунды или HTTP-дата).
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AimdLimiter:
+    """
+    Адаптивный лимит одновременных запросов к одной модели (AIMD).
+
+    Пока запросы проходят и задержка не выше latency_target_s, лимит растёт
+    аддитивно (+1 за «окно» из limit успешных ответов). На 429/503 лимит
+    умножается на backoff_ratio (не чаще раза в decrease_cooldown_s, чтобы
+    пачка отказов одного окна не обнуляла его), а Retry-After приостанавливает
+    выдачу новых слотов по этой модели.
+
+    Слоты берутся из потоков (acquire) и из корутин любого event loop (aacquire).
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff_ratio: float = 0.5,
+        latency_target_s: float | None = None,
+        decrease_cooldown_s: float = 1.0,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.latency_target_s = latency_target_s
+        self.decrease_cooldown_s = decrease_cooldown_s
+
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    # --- выдача слотов ---
+
+    def _take_locked(self) -> float | None:
+        """
+        0.0 — слот выдан; иначе сколько ждать (None — до освобождения слота).
+        """
+        pause = self.blocked_until - time.monotonic()
+        if pause > 0:
+            return pause
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return 0.0
+        return None
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self._take_locked()
+                if wait == 0.0:
+                    return
+                self._cond.wait(timeout=wait)
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                wait = self._take_locked()
+                if wait == 0.0:
+                    return
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def try_acquire(self) -> bool:
+        """
+        Слот без ожидания — для необязательных запросов (дублей при хеджировании).
+        """
+        with self._lock:
+            return self._take_locked() == 0.0
+
+    def _notify_locked(self) -> None:
+        self._cond.notify_all()
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    # --- обратная связь ---
+
+    def release(
+        self,
+        latency_s: float | None = None,
+        throttled: bool = False,
+        retry_after: float | None = None,
+    ) -> None:
+        """
+        Вернуть слот. latency_s — задержка успешного ответа,
+        throttled — ответ 429/503 (retry_after — пауза из заголовков).
+        Прочие ошибки (latency_s=None, throttled=False) лимит не меняют.
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = time.monotonic()
+
+            if throttled:
+                self.throttled += 1
+                if now - self._last_decrease >= self.decrease_cooldown_s:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                    self._last_decrease = now
+                    self.decreases += 1
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+            elif latency_s is not None:
+                self.successes += 1
+                if self.latency_target_s is None or latency_s <= self.latency_target_s:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+            self._notify_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "throttled": self.throttled,
+                "decreases": self.decreases,
+            }
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ConcurrencyController:
+    """
+    Отдельный AimdLimiter на каждую модель (gen_model и review_model
+    упираются в разные квоты). Один контроллер можно отдать
+    и синхронному, и асинхронному клиенту.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target_s: float | None = None,
+    ) -> None:
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_s = latency_target_s
+
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, AimdLimiter] = {}
+
+    @classmethod
+    def from_env(cls, initial: int | None = None) -> "ConcurrencyController":
+        """
+        - EVOLUTION_MAX_CONCURRENCY — стартовый лимит на модель (8);
+        - EVOLUTION_CONCURRENCY_CEILING — до скольки лимит может вырасти (64);
+        - EVOLUTION_LATENCY_TARGET_S — при задержке выше лимит не растёт.
+        """
+        target = os.getenv("EVOLUTION_LATENCY_TARGET_S")
+        return cls(
+            initial=max(1, initial or int(os.getenv("EVOLUTION_MAX_CONCURRENCY", "8"))),
+            max_limit=int(os.getenv("EVOLUTION_CONCURRENCY_CEILING", "64")),
+            latency_target_s=float(target) if target else None,
+        )
+
+    def for_model(self, model: str) -> AimdLimiter:
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = AimdLimiter(
+                    initial=self.initial,
+                    min_limit=self.min_limit,
+                    max_limit=self.max_limit,
+                    latency_target_s=self.latency_target_s,
+                )
+                self._limiters[model] = limiter
+            return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {model: limiter.stats() for model, limiter in limiters.items()}
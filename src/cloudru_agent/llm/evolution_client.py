@@ -1,42 +1,255 @@
+import hashlib
 import json
 import os
-from typing import List, Dict, Any
-
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import List, Dict, Any, Type
+
+import openai
 from openai import OpenAI
 from dotenv import load_dotenv
+from pydantic import BaseModel
+from cloudru_agent.llm.cassette import Cassette, CassetteEntry, CassetteMiss, cassette_from_env
+from cloudru_agent.llm.chunking import chunk_text, merge_requirement_documents
+from cloudru_agent.llm.completion_cache import CompletionCache
+from cloudru_agent.llm.concurrency import AimdLimiter, ConcurrencyController, is_throttle, retry_after_seconds
+from cloudru_agent.llm.exemplars import ExemplarIndex
+from cloudru_agent.llm.json_repair import decode_json, loads as loads_json
+from cloudru_agent.llm.ledger import CallLedger, LedgerEntry
+from cloudru_agent.llm.line_edits import apply_line_edits, numbered
+from cloudru_agent.llm.output_budget import OutputBudget
+from cloudru_agent.llm.quota import SharedQuota
+from cloudru_agent.llm.routing import RoutingTable
+from cloudru_agent.llm.schemas import (
+    AaaSteps,
+    CodeSteps,
+    FusedCodeSteps,
+    RefineEdits,
+    ReviewVerdict,
+    aaa_batch_schema,
+    response_format,
+    review_batch_schema,
+    schema_error,
+    schema_prompt,
+    structured_support,
+)
+from cloudru_agent.llm.single_flight import single_flight
+from cloudru_agent.llm.transport import transports
 from cloudru_agent.models.requirements import UiRequirementsDocument, UiRequirement
 
 
-class EvolutionClient:
+# Ошибки, после которых запрос имеет смысл повторить
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+)
+
+# Так бэкенд отвечает на response_format, который не поддерживает
+SCHEMA_REJECTED_ERRORS = (
+    openai.BadRequestError,
+    openai.UnprocessableEntityError,
+)
+
+
+# Дополнение к промптам генерации кода: просим в том же ответе и текст шагов AAA
+FUSED_TITLES_PROMPT = """
+
+    Дополнительно (в том же JSON-объекте) верни ключ "titles":
+    {
+      "arrange": "что подготовить (коротко, по-русски)",
+      "act": "какое действие выполнить",
+      "assert": "что проверить"
+    }
+    Это названия шагов для allure.step и ручного тест-кейса: одно короткое предложение на шаг,
+    в повелительном наклонении, без кода."""
+
+
+# Дополнение к промптам ревизора для пакетного ревью: несколько тестов в одном запросе
+REVIEW_BATCH_PROMPT = """
+
+    Тебе передают НЕСКОЛЬКО тестов сразу, каждый начинается со строки «=== ID: <ID требования> ===».
+    Оцени каждый тест отдельно, по тем же правилам, и верни JSON, где ключ — ID ровно как во входе:
+    {
+      "<ID>": {"ok": true/false, "problems": ["...", "..."]},
+      ...
+    }
+    Вердикт нужен по КАЖДОМУ ID из входа."""
+
+
+# Дополнение к промптам исправления теста: вместо теста целиком — правки по номерам строк
+REFINE_EDITS_PROMPT = """
+
+    ВМЕСТО переписанного теста целиком верни только правки старого кода по номерам строк
+    (строки пронумерованы как «<номер>| <код>»; номер и «| » в код не входят). Верни JSON:
+    {
+      "edits": [
+        {"start": 12, "end": 14, "lines": ["новая строка 12", "новая строка 13"]}
+      ]
+    }
+    Правка заменяет строки start..end (включительно) на lines, с теми же отступами, что в файле.
+    Вставка перед строкой N: start = N, end = N - 1. Удаление строк: lines = [].
+    Правки не пересекаются; неизменённые строки не повторяй. Указание выше вернуть готовый код
+    к этому ответу не относится."""
+
+# метод полного исправления -> метод исправления правками строк
+REFINE_EDITS_METHODS = {
+    "refine_ui_test_with_feedback": "refine_ui_test_edits",
+    "refine_api_test_with_feedback": "refine_api_test_edits",
+}
+
+
+# Дополнение к запросу кода: тесты, одобренные ревью для похожих требований (ExemplarIndex)
+EXEMPLARS_PROMPT = """
+
+    Примеры тестов, которые ревизор одобрил для похожих требований. Это образец стиля,
+    локаторов и проверок: не копируй их, если требование другое. Формат ответа — прежний.
+
+"""
+
+
+# temperature для кандидатов 2..n: нужны разные варианты, а не копии первого
+CANDIDATE_TEMPERATURE = 0.7
+
+
+@dataclass
+class ChatCall:
+    """
+    Один запрос к chat.completions: что отправить модели
+    и каким методом клиента он порождён (для логов и метрик).
     """
-    Обёртка над Evolution Foundation Models (OpenAI-совместимый API).
 
-    Требует:
-    - переменная окружения API_KEY
-    - base_url: https://foundation-models.api.cloud.ru/v1
+    method: str
+    model: str
+    messages: List[Dict[str, str]]
+    temperature: float | None = None
+    response_format: Dict[str, Any] | None = None
+    max_tokens: int | None = None
+    # номер кандидата при выборке нескольких вариантов ответа (см. _candidate_calls)
+    seed: int | None = None
+    # pydantic-модель ответа: по ней строится response_format и проверяется ответ
+    schema: Type[BaseModel] | None = None
+    # повторный запрос после ответа, не прошедшего проверку схемы
+    schema_retry: bool = False
+
+    def create_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "model": self.model,
+            "messages": self.messages,
+            # имя метода клиента — для трассировки и локального FakeEvolutionServer
+            "extra_headers": {"X-Evolution-Method": self.method},
+        }
+        if self.temperature is not None:
+            kwargs["temperature"] = self.temperature
+        if self.response_format is not None:
+            kwargs["response_format"] = self.response_format
+        if self.max_tokens is not None:
+            kwargs["max_tokens"] = self.max_tokens
+        if self.seed is not None:
+            kwargs["seed"] = self.seed
+        return kwargs
+
+    def fingerprint(self) -> str:
+        """
+        Хэш содержимого запроса — ключ кэша ответов.
+        """
+        data: Dict[str, Any] = {
+            "model": self.model,
+            "messages": self.messages,
+            "temperature": self.temperature,
+            "response_format": self.response_format,
+        }
+        # max_tokens и seed в ключе только если заданы: старые записи кэша остаются валидными
+        if self.max_tokens is not None:
+            data["max_tokens"] = self.max_tokens
+        if self.seed is not None:
+            data["seed"] = self.seed
+        payload = json.dumps(
+            data,
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# параметры chat.completions.create, которые chat() передаёт через ChatCall
+_CHAT_KWARGS = {"model", "temperature", "response_format", "max_tokens", "seed"}
+
+
+@dataclass
+class FetchState:
+    """
+    Состояние отправки одного запроса (с ретраями и повтором по лимиту длины)
+    между общими шагами BaseEvolutionClient: sync и async клиенты различаются
+    только ожиданием квоты, слота и ответа.
     """
 
+    # запрос до замены json_schema -> json_object и лимита длины — ключ кэша
+    key_call: ChatCall
+    call: ChatCall
+    limiter: AimdLimiter
+    # ключ кассеты (см. _cassette_key); None — без записи
+    cassette_key: ChatCall | None = None
+    # None — лимит не от бюджета, "capped" — от бюджета, (лимит, задержка) — повтор
+    budget: str | tuple[int, float] | None = None
+    budgeted: bool = False
+    # оценка токенов попытки для SharedQuota; None — квоты на модель нет
+    cost: int | None = None
+    started: float = 0.0
+    sent: float = 0.0
+    attempt: int = 0
+    # время ответов эндпоинта без очереди и пауз перед ретраями — задержка для кассеты
+    served: float = 0.0
+
+
+class BaseEvolutionClient:
+    """
+    Общая часть синхронного и асинхронного клиентов Evolution Foundation Models:
+    настройки, промпты (_*_call) и разбор ответов (_*_result).
+
+    Транспорт (OpenAI / AsyncOpenAI) задают наследники.
+    """
+
+    base_url = "https://foundation-models.api.cloud.ru/v1"
+
     def __init__(
         self,
         gen_model: str | None = None,
         review_model: str | None = None,
+        cache: CompletionCache | None = None,
+        cache_bypass: bool = False,
+        ledger: CallLedger | None = None,
+        max_retries: int = 2,
+        concurrency: ConcurrencyController | None = None,
+        routing: RoutingTable | None = None,
+        base_url: str | None = None,
+        structured_outputs: bool | None = None,
+        refine_edits: bool | None = None,
+        output_budget: OutputBudget | None = None,
+        exemplars: ExemplarIndex | None = None,
+        cassette: Cassette | None = None,
+        quota: SharedQuota | None = None,
     ) -> None:
 
         load_dotenv()
 
-        base_url = "https://foundation-models.api.cloud.ru/v1"
+        # EVOLUTION_BASE_URL позволяет направить клиента на локальный FakeEvolutionServer
+        self.base_url = base_url or os.getenv("EVOLUTION_BASE_URL") or self.base_url
 
-        api_key = os.getenv("API_KEY")
+        # Запись / воспроизведение ответов (EVOLUTION_CASSETTE); при воспроизведении сеть не нужна
+        self.cassette = cassette if cassette is not None else cassette_from_env()
+        replaying = self.cassette is not None and not self.cassette.recording
+
+        api_key = os.getenv("API_KEY") or ("replay" if replaying else None)
         if not api_key:
             raise RuntimeError(
                 "API key not found. Set EVOLUTION_API_KEY or API_KEY in environment variables/"
                 ".env before running the agent."
             )
-
-        self.client = OpenAI(
-            base_url=base_url,
-            api_key=api_key,
-        )
+        self.api_key = api_key
 
         # Модель для генерации (разбор требований, AAA, Playwright/requests-код)
         self.gen_model = gen_model or os.getenv("EVOLUTION_GEN_MODEL")
@@ -53,34 +266,434 @@ class EvolutionClient:
                 "Review model is not set. Specify EVOLUTION_REVIEW_MODEL or pass review_model to EvolutionClient()."
             )
 
-    # --- базовый чат-запрос ---
+        # Дисковый кэш ответов; cache_bypass — не читать из кэша, но обновлять его
+        self.cache = cache if cache is not None else CompletionCache.from_env()
+        # при записи кассеты каждый ответ должен прийти от эндпоинта, с настоящей задержкой
+        self.cache_bypass = (
+            cache_bypass
+            or os.getenv("EVOLUTION_CACHE_BYPASS", "0") == "1"
+            or (self.cassette is not None and self.cassette.recording)
+        )
 
-    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        # Журнал вызовов: токены, задержки, ретраи, валидность JSON
+        self.ledger = ledger if ledger is not None else CallLedger()
+        # Ретраи делаем сами (у OpenAI-клиента max_retries=0), чтобы их считать
+        self.max_retries = max_retries
+        # Длинный текст требований разбирается кусками по границам блоков (map-reduce)
+        self.requirements_chunk_chars = int(os.getenv("EVOLUTION_REQUIREMENTS_CHUNK_CHARS", "12000"))
+        # Адаптивный лимит одновременных запросов, отдельный на каждую модель
+        self.concurrency = concurrency if concurrency is not None else ConcurrencyController.from_env()
+        # Модель / temperature / max_tokens / SLO по методам (EVOLUTION_ROUTING_PATH)
+        self.routing = routing if routing is not None else RoutingTable.from_env()
+        # Пакетное ревью: сколько символов тестов и сколько тестов в одном запросе к ревизору
+        self.review_batch_chars = int(os.getenv("EVOLUTION_REVIEW_BATCH_CHARS", "60000"))
+        self.review_batch_size = int(os.getenv("EVOLUTION_REVIEW_BATCH_SIZE", "20"))
+        # Соединений в пуле: по потолку лимита на каждую из двух моделей
+        self.pool_size = 2 * self.concurrency.max_limit
+        # Строгая JSON Schema в response_format (EVOLUTION_STRUCTURED_OUTPUT=0 — только json_object);
+        # модели, отклонившие json_schema, дальше получают json_object, ответ проверяется локально
+        if structured_outputs is None:
+            structured_outputs = os.getenv("EVOLUTION_STRUCTURED_OUTPUT", "1").lower() not in ("0", "false", "no", "off")
+        self.structured_outputs = structured_outputs
+        # Исправление теста по замечаниям ревизора правками строк вместо переписывания целиком
+        # (EVOLUTION_REFINE_EDITS=1); правки, которые не применились, — полный refine
+        if refine_edits is None:
+            refine_edits = os.getenv("EVOLUTION_REFINE_EDITS", "0").lower() in ("1", "true", "yes", "on")
+        self.refine_edits = refine_edits
+        self.refine_stats: Counter = Counter()
+        # max_tokens по истории длин ответов метода (EVOLUTION_OUTPUT_BUDGET=0 — без лимита)
+        self.output_budget = output_budget if output_budget is not None else OutputBudget.from_env()
+        # Одобренные ревью тесты из прошлых прогонов — образцы в промптах кода; None — без них
+        self.exemplars = exemplars
+        # Квота запросов / токенов в минуту, общая с другими процессами (EVOLUTION_QUOTA_*)
+        self.quota = quota if quota is not None else SharedQuota.from_env()
+
+    @staticmethod
+    def _retry_delay(attempt: int, error: BaseException) -> float:
         """
-        Простая обёртка вокруг chat.completions.create.
-        Возвращает содержимое message.content первой choice.
-        Использует модель генерации по умолчанию.
+        Пауза перед повтором: экспонента с джиттером, но не меньше Retry-After.
         """
-        response = self.client.chat.completions.create(
-            model=self.gen_model,
-            messages=messages,
-            **kwargs,
+        delay = min(8.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # джиттер сверху, чтобы ожидавшие запросы не вернулись одной пачкой
+            delay = max(delay, retry_after * (1 + random.random() / 4))
+        return delay
+
+    def _record(
+        self,
+        call: ChatCall,
+        content: str | None,
+        source: str = "api",
+        response: Any = None,
+        latency_s: float = 0.0,
+        retries: int = 0,
+        error: BaseException | None = None,
+        wait_s: float = 0.0,
+    ) -> None:
+        json_status = None
+        json_repairs = None
+        if call.response_format is not None and error is None:
+            try:
+                decoded = decode_json(content)
+                json_status = "repaired" if decoded.repaired else "ok"
+                json_repairs = ",".join(decoded.repairs) or None
+            except ValueError:
+                json_status = "invalid"
+            if json_status != "invalid" and call.schema is not None and schema_error(call.schema, content):
+                json_status = "mismatch"
+
+        usage = getattr(response, "usage", None)
+        choices = getattr(response, "choices", None) or []
+        self.ledger.record(
+            LedgerEntry(
+                method=call.method,
+                model=call.model,
+                source=source,
+                prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+                latency_s=round(latency_s, 4),
+                wait_s=round(wait_s, 4),
+                retries=retries,
+                json_status=json_status,
+                json_repairs=json_repairs,
+                schema_retry=call.schema_retry,
+                max_tokens=call.max_tokens,
+                truncated=bool(choices) and getattr(choices[0], "finish_reason", None) == "length",
+                error=type(error).__name__ if error is not None else None,
+            )
+        )
+
+    def _cache_get(self, call: ChatCall) -> str | None:
+        if self.cache is None or self.cache_bypass:
+            return None
+        return self.cache.get(call.fingerprint())
+
+    def _cache_put(self, call: ChatCall, content: str | None) -> None:
+        if self.cache is None or content is None:
+            return
+        self.cache.put(call.fingerprint(), content)
+
+    # --- кассета: запись и воспроизведение ответов ---
+
+    def _replaying(self) -> bool:
+        return self.cassette is not None and not self.cassette.recording
+
+    def _cassette_take(self, call: ChatCall) -> CassetteEntry:
+        """
+        Записанный ответ на запрос; запроса нет в кассете — ошибка в журнале и CassetteMiss.
+        """
+        try:
+            return self.cassette.take(call.fingerprint(), call.method)
+        except CassetteMiss as e:
+            self._record(call, None, source="replay", error=e)
+            raise
+
+    def _cassette_key(self, call: ChatCall) -> ChatCall:
+        """
+        Запрос, под которым ответ лежит в кассете: маршрут из таблицы без переключения
+        на запасную модель по SLO — при воспроизведении задержки другие, и запрос,
+        записанный с запасной моделью, иначе не нашёлся бы.
+        """
+        return self.routing.apply(call, self.ledger, slo_fallback=False)
+
+    def _cassette_put(
+        self,
+        cassette_key: ChatCall | None,
+        call: ChatCall,
+        content: str | None,
+        response: Any,
+        latency_s: float,
+    ) -> None:
+        if self.cassette is None or not self.cassette.recording or cassette_key is None:
+            return
+        # модель — та, что ответила (в том числе запасная)
+        self.cassette.put(cassette_key.fingerprint(), cassette_key.method, call.model, content, response, latency_s)
+
+    # --- квота эндпоинта, общая для процессов ---
+
+    def _quota_cost(self, call: ChatCall) -> int | None:
+        """
+        Оценка токенов запроса для SharedQuota; None — на модель квоты нет.
+        """
+        if self.quota is None or self.quota.quota_for(call.model) is None:
+            return None
+        return self.quota.estimate(call.messages, call.max_tokens)
+
+    def _quota_settle(self, call: ChatCall, cost: int | None, response: Any) -> None:
+        if cost is None:
+            return
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None) or (
+            (getattr(usage, "prompt_tokens", None) or 0) + (getattr(usage, "completion_tokens", None) or 0)
         )
-        return response.choices[0].message.content or ""
+        self.quota.settle(call.model, cost, actual)
+
+    def _quota_refund(self, state: FetchState) -> None:
+        """
+        Вернуть оценку попытки, которая не дошла до ответа. Вызывается и в finally
+        отправки: отмена во время ожидания слота тоже не должна съедать квоту.
+        """
+        if state.cost is not None:
+            cost, state.cost = state.cost, None
+            self.quota.refund(state.call.model, cost)
+
+    def _quota_throttled(self, call: ChatCall, error: BaseException) -> None:
+        if self.quota is not None and is_throttle(error):
+            self.quota.throttled(call.model, retry_after_seconds(error))
+
+    def _flight_key(self, call: ChatCall) -> tuple:
+        """
+        Ключ склейки одинаковых запросов в полёте (llm/single_flight.py):
+        эндпоинт, ключ API (хэш — чужие учётные данные не делят ответы) и fingerprint.
+        """
+        key_hash = hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()
+        return self.base_url, key_hash, call.fingerprint()
+
+    def _chat_call(self, messages: List[Dict[str, str]], **kwargs: Any) -> ChatCall:
+        """
+        Запрос для chat(): через тот же путь, что и методы клиента (журнал, кэш, ретраи, квота).
+        kwargs — параметры chat.completions.create, которые есть в ChatCall.
+        """
+        unknown = set(kwargs) - _CHAT_KWARGS
+        if unknown:
+            raise TypeError(f"chat() got unsupported arguments: {', '.join(sorted(unknown))}")
+        model = kwargs.pop("model", None) or self.gen_model
+        return ChatCall(method="chat", model=model, messages=messages, **kwargs)
+
+    # --- отправка запроса: общие шаги sync и async клиентов ---
+
+    def _fetch_state(self, call: ChatCall, cassette_key: ChatCall | None = None) -> FetchState:
+        structured = self._structured(call)
+        return FetchState(
+            key_call=call,
+            call=structured,
+            limiter=self.concurrency.for_model(structured.model),
+            cassette_key=cassette_key,
+            started=time.perf_counter(),
+        )
+
+    def _attempt_cost(self, state: FetchState) -> int | None:
+        """
+        Квота, общая с другими процессами: её ждут до слота, каждая попытка — запрос.
+        """
+        state.cost = self._quota_cost(state.call)
+        return state.cost
+
+    def _attempt_sent(self, state: FetchState) -> None:
+        """
+        Квота и слот получены, запрос уходит. Лимит длины ставится один раз — по истории
+        на момент первой отправки (а не постановки в очередь), не при повторе после отказа от схемы.
+        """
+        if not state.budgeted:
+            state.call, state.budget = self._budgeted(state.call)
+            state.budgeted = True
+        state.sent = time.perf_counter()
+
+    @staticmethod
+    def _timing(state: FetchState) -> Dict[str, float]:
+        """
+        Задержка для журнала: latency_s — от отправки последней попытки до ответа
+        (по ней считается SLO маршрутизации), wait_s — всё, что было до отправки:
+        очередь квоты и слота, неудачные попытки и паузы перед ретраями.
+        """
+        return {
+            "latency_s": time.perf_counter() - state.sent,
+            "wait_s": state.sent - state.started,
+        }
+
+    def _attempt_failed(self, state: FetchState, error: BaseException, retry: bool = True) -> float:
+        """
+        Ошибка попытки: вернуть слот, записать в журнал. Возвращает паузу перед следующей
+        попыткой (0 — сразу, с json_object вместо отклонённой схемы); если попыток больше нет,
+        поднимает ошибку. retry=False — без повторов (потоковый запрос).
+        """
+        retryable = isinstance(error, RETRYABLE_ERRORS)
+        self._quota_refund(state)
+        if retryable:
+            state.limiter.release(throttled=is_throttle(error), retry_after=retry_after_seconds(error))
+            self._quota_throttled(state.call, error)
+        else:
+            # в том числе CancelledError: слот нужно вернуть в любом случае
+            state.limiter.release()
+        if not isinstance(error, Exception):
+            self._schema_supported(state.call, error)
+            raise error
+
+        if retryable and retry and state.attempt < self.max_retries:
+            delay = self._retry_delay(state.attempt, error)
+            state.attempt += 1
+            return delay
+
+        self._record(
+            state.call,
+            None,
+            retries=state.attempt,
+            **self._timing(state),
+            error=error,
+        )
+        if self._schema_supported(state.call, error) and retry:
+            state.call = self._structured(state.call)
+            return 0.0
+        raise error
+
+    def _attempt_succeeded(self, state: FetchState, response: Any) -> bool:
+        """
+        Ответ попытки. False — ответ оборван лимитом бюджета, нужен один повтор с лимитом больше.
+        """
+        elapsed = time.perf_counter() - state.sent
+        state.limiter.release(latency_s=elapsed)
+        state.served += elapsed
+        self._quota_settle(state.call, state.cost, response)
+        state.cost = None
+        retry = self._budget_retry(state.call, response, elapsed, state.budget)
+        if retry is None:
+            return True
+        content = response.choices[0].message.content
+        self._record(
+            state.call,
+            content,
+            response=response,
+            retries=state.attempt,
+            **self._timing(state),
+        )
+        state.call, state.budget = retry, (state.call.max_tokens, elapsed)
+        state.started, state.attempt = time.perf_counter(), 0
+        return False
+
+    def _fetch_result(self, state: FetchState, response: Any) -> str | None:
+        self._schema_supported(state.call)
+        content = response.choices[0].message.content
+        self._record(
+            state.call,
+            content,
+            response=response,
+            retries=state.attempt,
+            **self._timing(state),
+        )
+        self._cache_put(state.key_call, content)
+        self._cassette_put(state.cassette_key, state.call, content, response, state.served)
+        return content
+
+    # --- лимит длины ответа ---
+
+    def _budgeted(self, call: ChatCall) -> tuple[ChatCall, str | None]:
+        """
+        max_tokens по истории длин ответов метода (OutputBudget), если лимит не задан
+        в промпте или таблице маршрутизации. Ключ кэша считается до этой замены.
+        Второе значение — "capped", если лимит поставил бюджет (см. _budget_retry).
+        """
+        if self.output_budget is None or call.max_tokens is not None:
+            return call, None
+        cap = self.output_budget.cap_for(call.method, call.model)
+        if cap is None:
+            return call, None
+        return replace(call, max_tokens=cap), "capped"
+
+    def _budget_retry(
+        self,
+        call: ChatCall,
+        response: Any,
+        latency_s: float,
+        budget: str | tuple[int, float] | None,
+    ) -> ChatCall | None:
+        """
+        Передаёт длину ответа в OutputBudget и возвращает повтор с лимитом больше,
+        если ответ оборван лимитом бюджета. budget: None — лимит не от бюджета,
+        "capped" — первая попытка, (лимит, задержка) оборванной первой попытки — это повтор.
+        """
+        if self.output_budget is None:
+            return None
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "completion_tokens", None) or 0
+        truncated = response.choices[0].finish_reason == "length"
+        self.output_budget.observe(call.method, call.model, tokens, truncated)
+        if isinstance(budget, tuple):
+            self.output_budget.settle(*budget, tokens=tokens, latency_s=latency_s, truncated=truncated)
+            return None
+        if not truncated or budget is None:
+            return None
+        return replace(call, max_tokens=self.output_budget.extend(call.max_tokens, latency_s))
+
+    # --- structured outputs ---
+
+    @staticmethod
+    def _sends_schema(call: ChatCall) -> bool:
+        return (call.response_format or {}).get("type") == "json_schema"
+
+    def _structured(self, call: ChatCall) -> ChatCall:
+        """
+        json_schema -> json_object, если строгие схемы выключены или модель их не принимает
+        (см. StructuredOutputSupport). Ключ кэша считается до этой замены.
+        """
+        if call.schema is None or not self._sends_schema(call):
+            return call
+        if self.structured_outputs and structured_support.use_schema(self.base_url, call.model):
+            return call
+        return replace(call, response_format={"type": "json_object"})
+
+    def _schema_supported(self, call: ChatCall, error: BaseException | None = None) -> bool:
+        """
+        Запоминает итог запроса с json_schema. True — бэкенд отклонил схему,
+        запрос нужно повторить с json_object.
+        """
+        if not self._sends_schema(call):
+            return False
+        if error is None:
+            structured_support.report(self.base_url, call.model, True)
+            return False
+        rejected = isinstance(error, SCHEMA_REJECTED_ERRORS)
+        structured_support.report(self.base_url, call.model, False if rejected else None)
+        return rejected
+
+    def _schema_retry_call(self, call: ChatCall, content: str | None) -> ChatCall | None:
+        """
+        Один повтор, если ответ не прошёл проверку схемы: модели возвращаются её ответ
+        и список ошибок. None — ответ корректен (или это уже был повтор).
+        """
+        if call.schema is None or call.schema_retry:
+            return None
+        error = schema_error(call.schema, content)
+        if error is None:
+            return None
+        messages = call.messages + [
+            {"role": "assistant", "content": content or ""},
+            {
+                "role": "user",
+                "content": (
+                    "Ответ не соответствует JSON-схеме:\n"
+                    f"{error}\n"
+                    f"Схема: {schema_prompt(call.schema)}\n"
+                    "Верни исправленный JSON-объект целиком, строго по схеме, без пояснений."
+                ),
+            },
+        ]
+        return replace(call, messages=messages, schema_retry=True)
+
 
     # =====================================================================
     # UI: требования + AAA + Playwright
     # =====================================================================
 
-    def ui_requirements_from_text(
-        self,
-        text: str,
-        feature: str | None = None,
-    ) -> UiRequirementsDocument:
+    def _ui_requirements_calls(self, text: str, feature: str | None) -> List[ChatCall]:
         """
-        Из свободного текста требований по любому UI-продукту
-        строит UiRequirementsDocument.
+        Один запрос на весь текст или по запросу на кусок, если текст длиннее
+        requirements_chunk_chars.
         """
+        chunks = chunk_text(text, self.requirements_chunk_chars)
+        if len(chunks) == 1:
+            return [self._ui_requirements_call(text, feature)]
+        return [
+            self._ui_requirements_call(chunk, feature, part=(i, len(chunks)))
+            for i, chunk in enumerate(chunks, start=1)
+        ]
+
+    def _ui_requirements_call(
+        self,
+        text: str,
+        feature: str | None,
+        part: tuple[int, int] | None = None,
+    ) -> ChatCall:
         feature_name = feature or "UI продукта"
 
         system_prompt = (
@@ -107,26 +720,38 @@ class EvolutionClient:
             "Разбей его на отдельные требования:\n\n"
             f"{text}"
         )
-
-        response = self.client.chat.completions.create(
+        if part is not None:
+            user_prompt = (
+                f"Это часть {part[0]} из {part[1]} большого документа. "
+                "Выдели требования только из этой части; "
+                "id делай уникальными, с префиксом по блоку.\n\n"
+            ) + user_prompt
+
+        return ChatCall(
+            method="ui_requirements_from_text",
             model=self.gen_model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             temperature=0.2,
-            response_format={"type": "json_object"},
+            response_format=response_format(UiRequirementsDocument, "ui_requirements"),
+            schema=UiRequirementsDocument,
         )
 
-        raw_content = response.choices[0].message.content
-        data = json.loads(raw_content)
+    def _ui_requirements_result(self, content: str | None) -> UiRequirementsDocument:
+        data = loads_json(content)
         return UiRequirementsDocument(**data)
 
-    def ui_aaa_for_requirement(self, requirement: UiRequirement) -> dict:
-        """
-        Генерирует текст шагов Arrange/Act/Assert для UI-требования.
-        Возвращает словарь: {"arrange": "...", "act": "...", "assert": "..."}.
-        """
+    def _ui_requirements_merged(self, feature: str | None, contents: List[str | None]) -> UiRequirementsDocument:
+        if len(contents) == 1:
+            return self._ui_requirements_result(contents[0])
+        return merge_requirement_documents(
+            (self._ui_requirements_result(content) for content in contents),
+            feature=feature,
+        )
+
+    def _ui_aaa_call(self, requirement: UiRequirement) -> ChatCall:
         system_prompt = (
             "Ты опытный QA-инженер. Для каждого требования по UI продукта "
             "составляй понятные шаги в паттерне Arrange-Act-Assert. "
@@ -147,32 +772,108 @@ class EvolutionClient:
             f"Приоритет: {requirement.priority}\n"
         )
 
-        response = self.client.chat.completions.create(
+        return ChatCall(
+            method="ui_aaa_for_requirement",
             model=self.gen_model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             temperature=0.3,
-            response_format={"type": "json_object"},
+            response_format=response_format(AaaSteps, "aaa_steps"),
+            schema=AaaSteps,
         )
 
-        data = json.loads(response.choices[0].message.content or "{}")
+    def _ui_aaa_result(self, requirement: UiRequirement, content: str | None) -> dict:
+        data = loads_json(content or "{}")
+        return self._ui_aaa_from_data(requirement, data)
+
+    @staticmethod
+    def _ui_aaa_from_data(requirement: UiRequirement, data: dict) -> dict:
         return {
             "arrange": data.get("arrange", "открыть страницу продукта"),
             "act": data.get("act", requirement.title),
             "assert": data.get("assert", f"проверить: {requirement.title}"),
         }
 
+    def _ui_aaa_batch_call(self, requirements: List[UiRequirement]) -> ChatCall:
+        system_prompt = (
+            "Ты опытный QA-инженер. Тебе даётся список требований по UI продукта "
+            "(обычно одного блока/экрана). Для КАЖДОГО требования составь понятные шаги "
+            "в паттерне Arrange-Act-Assert. "
+            "Отвечай СТРОГО JSON без комментариев, где ключ — ID требования ровно как во входе:\n"
+            "{\n"
+            '  "REQ_ID": {"arrange": "...", "act": "...", "assert": "..."},\n'
+            "  ...\n"
+            "}\n"
+            "Шаги должны быть короткими, на русском, в повелительном наклонении."
+        )
+
+        user_prompt = "\n".join(
+            f"Требование ID: {req.id}\n"
+            f"Блок: {req.block}\n"
+            f"Название: {req.title}\n"
+            f"Описание: {req.description}\n"
+            f"Приоритет: {req.priority}\n"
+            for req in requirements
+        )
+        schema = aaa_batch_schema([req.id for req in requirements])
+
+        return ChatCall(
+            method="ui_aaa_batch",
+            model=self.gen_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.3,
+            response_format=response_format(schema, "aaa_batch"),
+            schema=schema,
+        )
+
+    @staticmethod
+    def _batch_data(ids: List[str], content: str | None) -> dict:
+        """
+        Ответ пакетного запроса {"<id>": {...}}; {} — если это не JSON-объект.
+        """
+        try:
+            data = loads_json(content or "{}")
+        except Exception:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+
+        # модель иногда оборачивает ответ: {"steps": {...}} / {"requirements": {...}}
+        if len(data) == 1 and not any(req_id in data for req_id in ids):
+            inner = next(iter(data.values()))
+            if isinstance(inner, dict):
+                data = inner
+        return data
+
+    @classmethod
+    def _aaa_batch_result(cls, requirements: list, content: str | None) -> Dict[str, dict]:
+        """
+        Разбирает ответ пакетного AAA-запроса: {"<id>": {"arrange", "act", "assert"}}.
+        Возвращает только корректные записи; отсутствующие и битые
+        вызывающий код догенерирует поштучно.
+        """
+        data = cls._batch_data([req.id for req in requirements], content)
+
+        result: Dict[str, dict] = {}
+        for req in requirements:
+            steps = data.get(req.id)
+            if not isinstance(steps, dict):
+                continue
+            values = {key: steps.get(key) for key in ("arrange", "act", "assert")}
+            if all(isinstance(v, str) and v.strip() for v in values.values()):
+                result[req.id] = values
+        return result
+
     # =====================================================================
     # API: AAA (текст) + код requests
     # =====================================================================
 
-    def api_aaa_steps(self, requirement) -> dict:
-        """
-        Генерирует Arrange / Act / Assert для одного API-требования.
-        requirement: ApiRequirement
-        """
+    def _api_aaa_call(self, requirement) -> ChatCall:
         system_prompt = """
         Ты опытный QA-инженер по API. 
         Тебе даётся информация об одном HTTP-эндпоинте Evolution Compute.
@@ -195,28 +896,28 @@ class EvolutionClient:
         Успешный код ответа: {requirement.success_code}
         Коды ошибок: {requirement.error_codes}""".strip()
 
-        response = self.client.chat.completions.create(
+        return ChatCall(
+            method="api_aaa_steps",
             model=self.gen_model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             temperature=0.2,
-            response_format={"type": "json_object"},
+            response_format=response_format(AaaSteps, "aaa_steps"),
+            schema=AaaSteps,
         )
 
-        raw = response.choices[0].message.content
-
+    def _api_aaa_result(self, requirement, raw: str | None) -> dict:
         try:
-            data = json.loads(raw)
+            data = loads_json(raw)
         except Exception:
             # запасной вариант, если модель вернула невалидный JSON
-            return {
-                "arrange": f"подготовить авторизованный запрос к {requirement.method} {requirement.path}",
-                "act": f"отправить запрос {requirement.method} {requirement.path}",
-                "assert": f"убедиться, что код ответа {requirement.success_code} и тело соответствует спецификации",
-            }
+            data = {}
+        return self._api_aaa_from_data(requirement, data)
 
+    @staticmethod
+    def _api_aaa_from_data(requirement, data: dict) -> dict:
         arrange = data.get("arrange") or f"подготовить авторизованный запрос к {requirement.method} {requirement.path}"
         act = data.get("act") or f"отправить запрос {requirement.method} {requirement.path}"
         assert_ = data.get("assert") or f"убедиться, что код ответа {requirement.success_code} и тело соответствует спецификации"
@@ -227,11 +928,49 @@ class EvolutionClient:
             "assert": assert_,
         }
 
-    def api_requests_code(self, feature: str, requirement) -> dict:
-        """
-        Генерирует реальные шаги Python+requests для API-теста.
-        Возвращает dict с ключами: arrange, act, assert — списки строк Python-кода.
-        """
+    def _api_aaa_batch_call(self, requirements: list) -> ChatCall:
+        system_prompt = """
+        Ты опытный QA-инженер по API.
+        Тебе даётся список HTTP-эндпоинтов Evolution Compute (обычно одной секции).
+        Для КАЖДОГО эндпоинта придумай понятные пошаговые действия в паттерне AAA.
+
+        Верни JSON, где ключ — ID эндпоинта ровно как во входе:
+        {
+        "API_ID": {
+            "arrange": "что подготовить перед вызовом",
+            "act": "что именно вызвать",
+            "assert": "что проверить в ответе"
+        },
+        ...
+        }
+
+        Пиши по-русски, в одном-двух предложениях на шаг.""".strip()
+
+        user_prompt = "\n\n".join(
+            f"ID: {req.id}\n"
+            f"Секция: {req.section}\n"
+            f"Метод: {req.method}\n"
+            f"Путь: {req.path}\n"
+            f"Краткое описание: {req.summary}\n"
+            f"Успешный код ответа: {req.success_code}\n"
+            f"Коды ошибок: {req.error_codes}"
+            for req in requirements
+        )
+        schema = aaa_batch_schema([req.id for req in requirements])
+
+        return ChatCall(
+            method="api_aaa_batch",
+            model=self.gen_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.2,
+            response_format=response_format(schema, "aaa_batch"),
+            schema=schema,
+        )
+
+    def _api_requests_code_call(self, feature: str, requirement) -> ChatCall:
         system_prompt = """
         Ты Senior QA automation engineer по API.
 
@@ -274,17 +1013,20 @@ class EvolutionClient:
         Коды ошибок: {requirement.error_codes}
         """.strip()
 
-        response = self.client.chat.completions.create(
+        call = ChatCall(
+            method="api_requests_code",
             model=self.gen_model,
             temperature=0.2,
-            response_format={"type": "json_object"},
+            response_format=response_format(CodeSteps, "code_steps"),
+            schema=CodeSteps,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
         )
-        content = response.choices[0].message.content
+        return self._with_exemplars(call, "api", requirement)
 
+    def _api_requests_code_result(self, requirement, content: str | None) -> dict:
         # дефолтный код на случай ошибки
         default_arr = [
             f'url = BASE_URL + "{requirement.path}"',
@@ -301,7 +1043,7 @@ class EvolutionClient:
         ]
 
         try:
-            data = json.loads(content)
+            data = loads_json(content)
         except Exception:
             return {"arrange": default_arr, "act": default_act, "assert": default_assert}
 
@@ -319,11 +1061,7 @@ class EvolutionClient:
             "assert": _norm("assert", default_assert),
         }
 
-    def ui_playwright_steps(self, feature: str, requirement) -> dict:
-        """
-        Генерирует реальные шаги Playwright для UI-теста.
-        Возвращает dict с ключами: arrange, act, assert — списки строк Python-кода.
-        """
+    def _ui_playwright_steps_call(self, feature: str, requirement) -> ChatCall:
         system_prompt = """
     Ты Senior QA automation engineer.
     Нужно сгенерировать МИНИМАЛЬНЫЙ, но РАБОЧИЙ фрагмент автотеста на Python + Playwright (sync).
@@ -389,27 +1127,103 @@ class EvolutionClient:
     Сгенерируй код шагов arrange/act/assert для Playwright под это требование.
     """.strip()
 
-        response = self.client.chat.completions.create(
+        call = ChatCall(
+            method="ui_playwright_steps",
             model=self.gen_model,
             temperature=0.2,
-            response_format={"type": "json_object"},
+            response_format=response_format(CodeSteps, "code_steps"),
+            schema=CodeSteps,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
         )
-        content = response.choices[0].message.content
+        return self._with_exemplars(call, "ui", requirement)
+
+    def _ui_playwright_steps_result(self, content: str | None) -> dict:
         try:
-            return json.loads(content)
+            return loads_json(content)
         except Exception:
             return {"arrange": ["page.goto(CALC_URL)", 'page.wait_for_load_state("domcontentloaded")'], "act": [],
                     "assert": []}
 
-    def review_ui_test(self, requirement_title: str, test_code: str) -> dict:
+    # --- образцы: одобренные тесты похожих требований ---
+
+    def _with_exemplars(self, call: ChatCall, kind: str, requirement) -> ChatCall:
         """
-        Ревизор: проверяет, покрывает ли тест требование.
-        Возвращает JSON: {"ok": bool, "problems": [...]}.
+        Добавляет к запросу кода до top_k похожих одобренных тестов из прошлых прогонов
+        (ExemplarIndex, в пределах бюджета токенов). Кандидаты и совмещённые запросы
+        строятся из этого запроса и получают те же образцы.
+        """
+        if self.exemplars is None:
+            return call
+        found = self.exemplars.search(kind, requirement)
+        if not found:
+            return call
+        examples = "\n\n".join(f"Требование: {e.requirement}\n```python\n{e.code.strip()}\n```" for e in found)
+        messages = [dict(m) for m in call.messages]
+        messages[-1]["content"] += EXEMPLARS_PROMPT + examples
+        return replace(call, messages=messages)
+
+    # --- совмещённая генерация: текст шагов AAA + код одним запросом ---
+
+    @staticmethod
+    def _fused_call(code_call: ChatCall, method: str) -> ChatCall:
+        messages = [dict(m) for m in code_call.messages]
+        messages[0]["content"] += FUSED_TITLES_PROMPT
+        return replace(
+            code_call,
+            method=method,
+            messages=messages,
+            response_format=response_format(FusedCodeSteps, "fused_code_steps"),
+            schema=FusedCodeSteps,
+        )
+
+    @staticmethod
+    def _fused_titles(content: str | None) -> dict:
+        try:
+            titles = loads_json(content).get("titles")
+        except Exception:
+            return {}
+        return titles if isinstance(titles, dict) else {}
+
+    def _api_steps_and_code_result(self, requirement, content: str | None) -> dict:
+        return {
+            "steps": self._api_aaa_from_data(requirement, self._fused_titles(content)),
+            "code": self._api_requests_code_result(requirement, content),
+        }
+
+    def _ui_steps_and_code_result(self, requirement: UiRequirement, content: str | None) -> dict:
+        code = self._ui_playwright_steps_result(content)
+        if isinstance(code, dict):
+            code.pop("titles", None)
+        return {
+            "steps": self._ui_aaa_from_data(requirement, self._fused_titles(content)),
+            "code": code,
+        }
+
+    # --- несколько вариантов кода на требование ---
+
+    @staticmethod
+    def _candidate_calls(call: ChatCall, n: int) -> List[ChatCall]:
+        """
+        n запросов-кандидатов: первый совпадает с обычным запросом (и его кэшем),
+        остальные — с seed и повышенной temperature, чтобы варианты различались.
+        """
+        temperature = max(call.temperature or 0.0, CANDIDATE_TEMPERATURE)
+        return [call] + [replace(call, seed=i, temperature=temperature) for i in range(1, n)]
+
+    @staticmethod
+    def _candidate_results(results: List[Any]) -> List[dict]:
         """
+        Успешные кандидаты по порядку; если упали все — ошибка первого.
+        """
+        ok = [r for r in results if not isinstance(r, BaseException)]
+        if not ok:
+            raise results[0]
+        return ok
+
+    def _review_ui_test_call(self, requirement_title: str, test_code: str) -> ChatCall:
         system_prompt = """
     Ты выступаешь как ревизор автотестов (senior QA lead).
     По требованию и коду теста на Python + Playwright оцени, действительно ли тест проверяет требование.
@@ -438,31 +1252,98 @@ class EvolutionClient:
     ```python
     {test_code}
     ```"""
-        response = self.client.chat.completions.create(
+        return ChatCall(
+            method="review_ui_test",
             model=self.review_model,
             temperature=0,
-            response_format={"type": "json_object"},
+            response_format=response_format(ReviewVerdict, "review_verdict"),
+            schema=ReviewVerdict,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
         )
-        content = response.choices[0].message.content
+
+    def _review_result(self, content: str | None) -> dict:
         try:
-            return json.loads(content)
+            return loads_json(content)
         except Exception:
             return {"ok": True, "problems": []}
 
-    def refine_ui_test_with_feedback(
+    # --- пакетное ревью: несколько тестов в одном запросе к ревизору ---
+
+    def _review_batch_calls(self, method: str, calls: Dict[str, ChatCall]) -> List[tuple[List[str], ChatCall]]:
+        """
+        Раскладывает поштучные запросы ревью (ID требования -> ChatCall) по пакетам
+        в пределах review_batch_chars символов и review_batch_size тестов; на пакет —
+        один запрос с системным промптом поштучного ревью и REVIEW_BATCH_PROMPT.
+        """
+        packs: List[Dict[str, ChatCall]] = []
+        current: Dict[str, ChatCall] = {}
+        size = 0
+        for req_id, call in calls.items():
+            length = len(call.messages[1]["content"])
+            if current and (size + length > self.review_batch_chars or len(current) >= self.review_batch_size):
+                packs.append(current)
+                current, size = {}, 0
+            current[req_id] = call
+            size += length
+        if current:
+            packs.append(current)
+
+        batches = []
+        for pack in packs:
+            first = next(iter(pack.values()))
+            ids = list(pack)
+            user_prompt = "\n\n".join(
+                f"=== ID: {req_id} ===\n{call.messages[1]['content']}" for req_id, call in pack.items()
+            )
+            schema = review_batch_schema(ids)
+            batches.append(
+                (
+                    ids,
+                    replace(
+                        first,
+                        method=method,
+                        messages=[
+                            {"role": "system", "content": first.messages[0]["content"] + REVIEW_BATCH_PROMPT},
+                            {"role": "user", "content": user_prompt},
+                        ],
+                        response_format=response_format(schema, "review_batch"),
+                        schema=schema,
+                    ),
+                )
+            )
+        return batches
+
+    @classmethod
+    def _review_batch_result(cls, ids: List[str], content: str | None) -> Dict[str, dict]:
+        """
+        Вердикты пакетного ревью по ID; отсутствующие и битые вызывающий код
+        проверяет поштучно.
+        """
+        data = cls._batch_data(ids, content)
+        result: Dict[str, dict] = {}
+        for req_id in ids:
+            verdict = data.get(req_id)
+            if isinstance(verdict, dict) and isinstance(verdict.get("ok"), bool):
+                problems = verdict.get("problems")
+                result[req_id] = {
+                    "ok": verdict["ok"],
+                    "problems": [str(p) for p in problems] if isinstance(problems, list) else [],
+                }
+        return result
+
+    def _refine_ui_test_call(
             self,
             feature: str,
             requirement: UiRequirement,
             old_code: str,
             review: dict,
-    ) -> str:
+            edits: bool = False,
+    ) -> ChatCall:
         """
-        Улучшает автотест на основе фидбэка ревизора.
-        Возвращает полностью улучшенный тестовый код (Python + Playwright).
+        edits — вместо переписанного теста просим правки по номерам строк (RefineEdits).
         """
         problems = review.get("problems") or []
         problems_text = "\n".join(f"- {p}" for p in problems) or "сделай тест лучше и стабильнее"
@@ -502,15 +1383,16 @@ class EvolutionClient:
 
         Старый код теста:
         ```python
-        {old_code}
+        {numbered(old_code) if edits else old_code}
         ```
         Проблемы от ревьюера:
         {problems_text}
 
-        Перепиши тест с учётом всех замечаний.
+        {"Исправь тест правками строк" if edits else "Перепиши тест"} с учётом всех замечаний.
         """.strip()
 
-        response = self.client.chat.completions.create(
+        call = ChatCall(
+            method="refine_ui_test_with_feedback",
             model=self.gen_model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -518,19 +1400,13 @@ class EvolutionClient:
             ],
             temperature=0.2,
         )
-
-        return response.choices[0].message.content or ""
+        return self._refine_edits_call(call) if edits else call
 
     # =========================
     # РЕВЬЮ + ФИКС ДЛЯ API
     # =========================
 
-    def review_api_test(self, requirement, test_code: str) -> dict:
-        """
-        Ревизор для API-автотестов (requests).
-        requirement: ApiRequirement
-        Возвращает JSON: {"ok": bool, "problems": [...]}.
-        """
+    def _review_api_test_call(self, requirement, test_code: str) -> ChatCall:
         system_prompt = """
         Ты выступаешь как ревизор API-автотестов (senior QA по backend).
         На вход тебе даётся:
@@ -565,39 +1441,26 @@ class EvolutionClient:
         ```
         """.strip()
 
-        response = self.client.chat.completions.create(
+        return ChatCall(
+            method="review_api_test",
             model=self.review_model,
             temperature=0,
-            response_format={"type": "json_object"},
+            response_format=response_format(ReviewVerdict, "review_verdict"),
+            schema=ReviewVerdict,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
         )
 
-        content = response.choices[0].message.content
-        try:
-            data = json.loads(content)
-        except Exception:
-            data = {"ok": True, "problems": []}
-        return data
-
-    def refine_api_test_with_feedback(
+    def _refine_api_test_call(
         self,
         requirement,
         old_code: str,
         review: dict,
         base_url: str,
-    ) -> str:
-        """
-        Улучшает API-автотест (requests) на основе фидбэка ревизора.
-
-        requirement: ApiRequirement
-        old_code: исходный код pytest-теста
-        review: JSON от review_api_test: {"ok": bool, "problems": [...]}
-        base_url: BASE_URL из ApiRequirementsDocument
-        """
-
+        edits: bool = False,
+    ) -> ChatCall:
         problems = review.get("problems") or []
         problems_text = "\n".join(f"- {p}" for p in problems) or "нет явных проблем, но сделай тест чуть лучше"
 
@@ -633,16 +1496,17 @@ class EvolutionClient:
 
         Старый код теста:
         ```python
-        {old_code}
+        {numbered(old_code) if edits else old_code}
         ```
 
         Проблемы от ревьюера:
         {problems_text}
 
-        Перепиши тест с учётом всех замечаний.
+        {"Исправь тест правками строк" if edits else "Перепиши тест"} с учётом всех замечаний.
         """.strip()
 
-        response = self.client.chat.completions.create(
+        call = ChatCall(
+            method="refine_api_test_with_feedback",
             model=self.gen_model,
             temperature=0.2,
             messages=[
@@ -650,5 +1514,383 @@ class EvolutionClient:
                 {"role": "user", "content": user_prompt},
             ],
         )
+        return self._refine_edits_call(call) if edits else call
+
+    # =====================================================================
+    # Исправление правками строк
+    # =====================================================================
+
+    @staticmethod
+    def _refine_edits_call(call: ChatCall) -> ChatCall:
+        """
+        Запрос полного исправления -> запрос правок по номерам строк (RefineEdits):
+        ответ в разы короче переписанного теста.
+        """
+        system, *rest = call.messages
+        return replace(
+            call,
+            method=REFINE_EDITS_METHODS[call.method],
+            messages=[{"role": "system", "content": system["content"] + REFINE_EDITS_PROMPT}, *rest],
+            response_format=response_format(RefineEdits, "refine_edits"),
+            schema=RefineEdits,
+        )
+
+    def _refine_edits_result(self, old_code: str, content: str | None) -> str | None:
+        """
+        Код теста после правок из ответа refine_*_edits. None — правки не разобрались,
+        не применились или код после них не компилируется: тест переписывается целиком.
+        """
+        try:
+            edits = RefineEdits.model_validate(loads_json(content or "")).edits
+            code = apply_line_edits(old_code, edits)
+        except ValueError:
+            self.refine_stats["fallback"] += 1
+            return None
+        self.refine_stats["patched"] += 1
+        return code
+
+
+class EvolutionClient(BaseEvolutionClient):
+    """
+    Обёртка над Evolution Foundation Models (OpenAI-совместимый API).
+
+    Требует:
+    - переменная окружения API_KEY
+    - base_url: https://foundation-models.api.cloud.ru/v1
+      (или EVOLUTION_BASE_URL / параметр base_url — например, локальный FakeEvolutionServer)
+
+    cassette (EVOLUTION_CASSETTE) — записать ответы прогона в файл или воспроизвести их
+    без сети: так меряется стоимость не-LLM частей пайплайна (см. llm/cassette.py).
+    """
+
+    def __init__(
+        self,
+        gen_model: str | None = None,
+        review_model: str | None = None,
+        cache: CompletionCache | None = None,
+        cache_bypass: bool = False,
+        ledger: CallLedger | None = None,
+        max_retries: int = 2,
+        concurrency: ConcurrencyController | None = None,
+        routing: RoutingTable | None = None,
+        base_url: str | None = None,
+        structured_outputs: bool | None = None,
+        refine_edits: bool | None = None,
+        output_budget: OutputBudget | None = None,
+        exemplars: ExemplarIndex | None = None,
+        cassette: Cassette | None = None,
+        quota: SharedQuota | None = None,
+    ) -> None:
+        super().__init__(
+            gen_model=gen_model,
+            review_model=review_model,
+            cache=cache,
+            cache_bypass=cache_bypass,
+            ledger=ledger,
+            max_retries=max_retries,
+            concurrency=concurrency,
+            routing=routing,
+            base_url=base_url,
+            structured_outputs=structured_outputs,
+            refine_edits=refine_edits,
+            output_budget=output_budget,
+            exemplars=exemplars,
+            cassette=cassette,
+            quota=quota,
+        )
 
-        return response.choices[0].message.content or ""
+        # пул соединений общий на процесс (llm/transport.py)
+        self.client = OpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            max_retries=0,
+            http_client=transports.http_client(self.base_url, self.api_key, self.pool_size),
+        )
+
+    # --- базовый чат-запрос ---
+
+    def _complete(self, call: ChatCall) -> str | None:
+        """
+        Отправляет ChatCall в chat.completions.create
+        и возвращает message.content первой choice.
+        Повторные одинаковые запросы отдаются из кэша.
+        Ответ, не прошедший проверку схемы, запрашивается ещё один раз.
+        """
+        content = self._request(call)
+        retry = self._schema_retry_call(call, content)
+        return content if retry is None else self._request(retry)
+
+    def _request(self, call: ChatCall) -> str | None:
+        cassette_key = self._cassette_key(call) if self.cassette is not None else None
+        if self._replaying():
+            entry = self._cassette_take(cassette_key)
+            delay = self.cassette.delay(entry)
+            if delay:
+                time.sleep(delay)
+            call = replace(cassette_key, model=entry.model)
+            self._record(call, entry.content, source="replay", response=entry.response(), latency_s=delay)
+            return entry.content
+
+        call = self.routing.apply(call, self.ledger)
+
+        cached = self._cache_get(call)
+        if cached is not None:
+            self._record(call, cached, source="cache")
+            return cached
+
+        # одинаковый запрос уже отправлен другим потоком / клиентом — ждём его ответ
+        content, shared = single_flight.run(
+            self._flight_key(call), lambda: self._fetch(call, cassette_key), call.method
+        )
+        if shared:
+            self._record(call, content, source="coalesced")
+        return content
+
+    def _fetch(self, call: ChatCall, cassette_key: ChatCall | None = None) -> str | None:
+        state = self._fetch_state(call, cassette_key)
+        try:
+            while True:
+                cost = self._attempt_cost(state)
+                if cost is not None:
+                    self.quota.acquire(state.call.model, cost)
+                state.limiter.acquire()
+                self._attempt_sent(state)
+                try:
+                    response = self.client.chat.completions.create(**state.call.create_kwargs())
+                except BaseException as e:
+                    delay = self._attempt_failed(state, e)
+                    if delay:
+                        time.sleep(delay)
+                    continue
+                if self._attempt_succeeded(state, response):
+                    return self._fetch_result(state, response)
+        finally:
+            self._quota_refund(state)
+
+    def _map_calls(self, calls: List[ChatCall], parse) -> List[Any]:
+        """
+        Параллельно выполняет запросы и разбирает ответы; ошибка запроса
+        возвращается на его месте, а не прерывает остальные.
+        """
+
+        def _one(call: ChatCall) -> Any:
+            try:
+                return parse(self._complete(call))
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(len(calls), self.concurrency.initial)) as pool:
+            return list(pool.map(_one, calls))
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        """
+        Простая обёртка вокруг chat.completions.create.
+        Возвращает содержимое message.content первой choice.
+        Использует модель генерации по умолчанию.
+        """
+        return self._complete(self._chat_call(messages, **kwargs)) or ""
+
+    # =====================================================================
+    # UI: требования + AAA + Playwright
+    # =====================================================================
+
+    def ui_requirements_from_text(
+        self,
+        text: str,
+        feature: str | None = None,
+    ) -> UiRequirementsDocument:
+        """
+        Из свободного текста требований по любому UI-продукту
+        строит UiRequirementsDocument.
+
+        Длинный текст делится на куски по заголовкам блоков, куски разбираются
+        параллельно, результаты склеиваются в исходном порядке без дублей id.
+        """
+        calls = self._ui_requirements_calls(text, feature)
+        if len(calls) == 1:
+            return self._ui_requirements_result(self._complete(calls[0]))
+
+        with ThreadPoolExecutor(max_workers=min(len(calls), self.concurrency.initial)) as pool:
+            contents = list(pool.map(self._complete, calls))
+        return self._ui_requirements_merged(feature, contents)
+
+    def ui_aaa_for_requirement(self, requirement: UiRequirement) -> dict:
+        """
+        Генерирует текст шагов Arrange/Act/Assert для UI-требования.
+        Возвращает словарь: {"arrange": "...", "act": "...", "assert": "..."}.
+        """
+        call = self._ui_aaa_call(requirement)
+        return self._ui_aaa_result(requirement, self._complete(call))
+
+    def ui_aaa_batch(self, requirements: List[UiRequirement]) -> Dict[str, dict]:
+        """
+        Шаги AAA сразу для нескольких UI-требований одним запросом.
+        Возвращает {req.id: {"arrange", "act", "assert"}} только для корректно
+        разобранных требований — остальные нужно догенерировать через ui_aaa_for_requirement.
+        """
+        call = self._ui_aaa_batch_call(requirements)
+        return self._aaa_batch_result(requirements, self._complete(call))
+
+    # =====================================================================
+    # API: AAA (текст) + код requests
+    # =====================================================================
+
+    def api_aaa_steps(self, requirement) -> dict:
+        """
+        Генерирует Arrange / Act / Assert для одного API-требования.
+        requirement: ApiRequirement
+        """
+        call = self._api_aaa_call(requirement)
+        return self._api_aaa_result(requirement, self._complete(call))
+
+    def api_aaa_batch(self, requirements: list) -> Dict[str, dict]:
+        """
+        Шаги AAA сразу для нескольких API-требований одним запросом.
+        Возвращает {req.id: {...}} только для корректно разобранных требований —
+        остальные нужно догенерировать через api_aaa_steps.
+        """
+        call = self._api_aaa_batch_call(requirements)
+        return self._aaa_batch_result(requirements, self._complete(call))
+
+    def api_requests_code(self, feature: str, requirement) -> dict:
+        """
+        Генерирует реальные шаги Python+requests для API-теста.
+        Возвращает dict с ключами: arrange, act, assert — списки строк Python-кода.
+        """
+        call = self._api_requests_code_call(feature, requirement)
+        return self._api_requests_code_result(requirement, self._complete(call))
+
+    def api_requests_code_candidates(self, feature: str, requirement, n: int) -> List[dict]:
+        """
+        n вариантов api_requests_code параллельными запросами.
+        """
+        calls = self._candidate_calls(self._api_requests_code_call(feature, requirement), n)
+        return self._candidate_results(
+            self._map_calls(calls, lambda content: self._api_requests_code_result(requirement, content))
+        )
+
+    def api_steps_and_code(self, feature: str, requirement) -> dict:
+        """
+        Один запрос вместо api_aaa_steps + api_requests_code.
+        Возвращает {"steps": {"arrange", "act", "assert"} — текст шагов,
+                    "code": {"arrange", "act", "assert"} — списки строк Python-кода}.
+        """
+        call = self._fused_call(self._api_requests_code_call(feature, requirement), "api_steps_and_code")
+        return self._api_steps_and_code_result(requirement, self._complete(call))
+
+    def ui_playwright_steps(self, feature: str, requirement) -> dict:
+        """
+        Генерирует реальные шаги Playwright для UI-теста.
+        Возвращает dict с ключами: arrange, act, assert — списки строк Python-кода.
+        """
+        call = self._ui_playwright_steps_call(feature, requirement)
+        return self._ui_playwright_steps_result(self._complete(call))
+
+    def ui_playwright_steps_candidates(self, feature: str, requirement, n: int) -> List[dict]:
+        """
+        n вариантов ui_playwright_steps параллельными запросами
+        (лучший выбирает генератор локальными проверками).
+        """
+        calls = self._candidate_calls(self._ui_playwright_steps_call(feature, requirement), n)
+        return self._candidate_results(
+            self._map_calls(calls, self._ui_playwright_steps_result)
+        )
+
+    def ui_steps_and_code(self, feature: str, requirement: UiRequirement) -> dict:
+        """
+        Один запрос вместо ui_aaa_for_requirement + ui_playwright_steps.
+        Возвращает {"steps": {"arrange", "act", "assert"} — текст шагов,
+                    "code": {"arrange", "act", "assert"} — списки строк Playwright-кода}.
+        """
+        call = self._fused_call(self._ui_playwright_steps_call(feature, requirement), "ui_steps_and_code")
+        return self._ui_steps_and_code_result(requirement, self._complete(call))
+
+    def review_ui_test(self, requirement_title: str, test_code: str) -> dict:
+        """
+        Ревизор: проверяет, покрывает ли тест требование.
+        Возвращает JSON: {"ok": bool, "problems": [...]}.
+        """
+        call = self._review_ui_test_call(requirement_title, test_code)
+        return self._review_result(self._complete(call))
+
+    def review_ui_batch(self, items: List[tuple]) -> Dict[str, dict]:
+        """
+        Пакетное ревью UI-тестов: items — [(UiRequirement, test_code)].
+        Тесты раскладываются по пакетам под контекст ревизора, пакеты идут параллельно.
+        Возвращает {req.id: {"ok", "problems"}} только для разобранных вердиктов —
+        остальные нужно проверить через review_ui_test.
+        """
+        calls = {req.id: self._review_ui_test_call(req.title, code) for req, code in items}
+        return self._review_batches(self._review_batch_calls("review_ui_batch", calls))
+
+    def _review_batches(self, batches: List[tuple[List[str], ChatCall]]) -> Dict[str, dict]:
+        contents = self._map_calls([call for _, call in batches], lambda content: content)
+        result: Dict[str, dict] = {}
+        for (ids, _), content in zip(batches, contents):
+            if not isinstance(content, BaseException):
+                result.update(self._review_batch_result(ids, content))
+        return result
+
+    def refine_ui_test_with_feedback(
+            self,
+            feature: str,
+            requirement: UiRequirement,
+            old_code: str,
+            review: dict,
+    ) -> str:
+        """
+        Улучшает автотест на основе фидбэка ревизора.
+        Возвращает полностью улучшенный тестовый код (Python + Playwright).
+        С refine_edits модель присылает только правки строк, они применяются локально.
+        """
+        if self.refine_edits:
+            call = self._refine_ui_test_call(feature, requirement, old_code, review, edits=True)
+            code = self._refine_edits_result(old_code, self._complete(call))
+            if code is not None:
+                return code
+        call = self._refine_ui_test_call(feature, requirement, old_code, review)
+        return self._complete(call) or ""
+
+    # =========================
+    # РЕВЬЮ + ФИКС ДЛЯ API
+    # =========================
+
+    def review_api_test(self, requirement, test_code: str) -> dict:
+        """
+        Ревизор для API-автотестов (requests).
+        requirement: ApiRequirement
+        Возвращает JSON: {"ok": bool, "problems": [...]}.
+        """
+        call = self._review_api_test_call(requirement, test_code)
+        return self._review_result(self._complete(call))
+
+    def review_api_batch(self, items: List[tuple]) -> Dict[str, dict]:
+        """
+        Пакетное ревью API-тестов: items — [(ApiRequirement, test_code)].
+        Возвращает {req.id: {"ok", "problems"}}, как review_ui_batch.
+        """
+        calls = {req.id: self._review_api_test_call(req, code) for req, code in items}
+        return self._review_batches(self._review_batch_calls("review_api_batch", calls))
+
+    def refine_api_test_with_feedback(
+        self,
+        requirement,
+        old_code: str,
+        review: dict,
+        base_url: str,
+    ) -> str:
+        """
+        Улучшает API-автотест (requests) на основе фидбэка ревизора.
+
+        requirement: ApiRequirement
+        old_code: исходный код pytest-теста
+        review: JSON от review_api_test: {"ok": bool, "problems": [...]}
+        base_url: BASE_URL из ApiRequirementsDocument
+        """
+        if self.refine_edits:
+            call = self._refine_api_test_call(requirement, old_code, review, base_url, edits=True)
+            code = self._refine_edits_result(old_code, self._complete(call))
+            if code is not None:
+                return code
+        call = self._refine_api_test_call(requirement, old_code, review, base_url)
+        return self._complete(call) or ""
@@ -0,0 +1,209 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+
+DEFAULT_EXEMPLARS_PATH = Path.home() / ".cache" / "cloudru_agent" / "exemplars.sqlite"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD_RE.findall(text.lower()) if len(word) > 1]
+
+
+def requirement_text(requirement: Any) -> str:
+    """
+    Текст требования для поиска: UI (блок, название, описание) или API (метод, путь, summary).
+    """
+    parts = (getattr(requirement, name, None) for name in ("block", "title", "description", "method", "path", "summary"))
+    return " ".join(str(part) for part in parts if part)
+
+
+@dataclass
+class Exemplar:
+    """Одобренный тест из прошлых прогонов и его близость к запросу (BM25)."""
+
+    requirement: str
+    code: str
+    score: float
+
+
+class _Corpus:
+    """
+    BM25 по тестам одного вида (ui / api) в памяти: документ — текст требования и код теста.
+    """
+
+    def __init__(self) -> None:
+        self.docs: Dict[str, Tuple[str, str, Counter, int]] = {}
+        self.df: Counter = Counter()
+        self.total_len = 0
+
+    def put(self, key: str, requirement: str, code: str) -> None:
+        self.remove(key)
+        terms = Counter(tokenize(requirement) + tokenize(code))
+        length = sum(terms.values())
+        self.docs[key] = (requirement, code, terms, length)
+        self.df.update(terms.keys())
+        self.total_len += length
+
+    def remove(self, key: str) -> None:
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        self.df.subtract(doc[2].keys())
+        self.total_len -= doc[3]
+
+    def search(self, query: str, k1: float, b: float) -> List[Tuple[float, str]]:
+        terms = set(tokenize(query))
+        n = len(self.docs)
+        if not terms or not n:
+            return []
+        avg_len = self.total_len / n
+        idf = {t: math.log(1 + (n - self.df[t] + 0.5) / (self.df[t] + 0.5)) for t in terms if self.df[t] > 0}
+
+        scored = []
+        for key, (_, _, tf, length) in self.docs.items():
+            score = sum(
+                idf[t] * tf[t] * (k1 + 1) / (tf[t] + k1 * (1 - b + b * length / avg_len))
+                for t in idf
+                if t in tf
+            )
+            if score > 0:
+                scored.append((score, key))
+        scored.sort(reverse=True)
+        return scored
+
+
+class ExemplarIndex:
+    """
+    Локальный полнотекстовый индекс (BM25, без сети) тестов, которые одобрило ревью
+    в прошлых прогонах: sqlite на диске, ранжирование в памяти процесса.
+
+    По новому требованию search отдаёт top_k самых похожих тестов того же вида (ui / api),
+    суммарно не длиннее max_tokens (≈ 4 символа на токен) — их добавляют в промпт
+    генерации кода как образцы.
+
+    stats: searches — поисков, hits — поисков хотя бы с одним примером, added — записано тестов.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_EXEMPLARS_PATH,
+        top_k: int = 3,
+        max_tokens: int = 1500,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        self.path = Path(path).expanduser()
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.k1 = k1
+        self.b = b
+
+        self.searches = 0
+        self.hits = 0
+        self.added = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS exemplars ("
+            " key TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " requirement TEXT NOT NULL,"
+            " code TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._corpora: Dict[str, _Corpus] | None = None
+
+    @classmethod
+    def from_env(cls) -> "ExemplarIndex | None":
+        """
+        Индекс по переменным окружения:
+        - EVOLUTION_EXEMPLARS=0 — не вести индекс (=1 — ещё и добавлять примеры в промпты);
+        - EVOLUTION_EXEMPLARS_PATH — путь к sqlite-файлу;
+        - EVOLUTION_EXEMPLARS_K — сколько примеров на требование (3);
+        - EVOLUTION_EXEMPLARS_TOKENS — бюджет примеров в промпте, токенов (1500).
+        """
+        if os.getenv("EVOLUTION_EXEMPLARS", "").lower() in ("0", "false", "no", "off"):
+            return None
+        return cls(
+            path=os.getenv("EVOLUTION_EXEMPLARS_PATH") or DEFAULT_EXEMPLARS_PATH,
+            top_k=int(os.getenv("EVOLUTION_EXEMPLARS_K", "3")),
+            max_tokens=int(os.getenv("EVOLUTION_EXEMPLARS_TOKENS", "1500")),
+        )
+
+    @staticmethod
+    def _key(kind: str, requirement: str) -> str:
+        # одно требование — один пример: повторно одобренный тест заменяет прежний
+        return hashlib.sha1(f"{kind}\0{requirement}".encode("utf-8")).hexdigest()
+
+    def _load(self) -> Dict[str, _Corpus]:
+        if self._corpora is None:
+            self._corpora = {}
+            for key, kind, requirement, code in self._conn.execute(
+                "SELECT key, kind, requirement, code FROM exemplars"
+            ):
+                self._corpora.setdefault(kind, _Corpus()).put(key, requirement, code)
+        return self._corpora
+
+    def add(self, kind: str, requirement: Any, code: str) -> None:
+        """
+        Тест, одобренный ревью. kind: "ui" или "api"; requirement — UiRequirement / ApiRequirement.
+        """
+        text = requirement_text(requirement)
+        if not text or not code.strip():
+            return
+        key = self._key(kind, text)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO exemplars (key, kind, requirement, code, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, text, code, time.time()),
+            )
+            self._conn.commit()
+            self._load().setdefault(kind, _Corpus()).put(key, text, code)
+            self.added += 1
+
+    def search(self, kind: str, requirement: Any) -> List[Exemplar]:
+        """
+        До top_k одобренных тестов, похожих на requirement, в пределах max_tokens.
+        """
+        budget = self.max_tokens * 4
+        found: List[Exemplar] = []
+        with self._lock:
+            self.searches += 1
+            corpus = self._load().get(kind)
+            if corpus is not None:
+                for score, key in corpus.search(requirement_text(requirement), self.k1, self.b):
+                    if len(found) >= self.top_k:
+                        break
+                    text, code = corpus.docs[key][:2]
+                    size = len(text) + len(code)
+                    if size > budget:
+                        continue
+                    budget -= size
+                    found.append(Exemplar(requirement=text, code=code, score=round(score, 3)))
+            self.hits += bool(found)
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = dict(self._conn.execute("SELECT kind, COUNT(*) FROM exemplars GROUP BY kind").fetchall())
+        return {
+            "entries": entries,
+            "searches": self.searches,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.searches, 3) if self.searches else 0.0,
+            "added": self.added,
+        }
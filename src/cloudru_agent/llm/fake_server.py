@@ -0,0 +1,455 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+from cloudru_agent.llm.chunking import HEADING_RE
+
+
+@dataclass
+class FakeServerConfig:
+    """
+    Поведение локального сервера:
+    - latency_ms / latency_sigma — медиана и разброс (лог-нормальный) задержки ответа;
+    - error_rate — доля ответов 500;
+    - rate_limit_rate — доля ответов 429 (с Retry-After: retry_after_s);
+    - capacity — сколько запросов обрабатывается одновременно, сверх — 429 (None — без лимита);
+    - quota_rpm — квота запросов в минуту на модель (корзина на секунду квоты), сверх — 429
+      с Retry-After до освобождения квоты (None — без квоты);
+    - review_fail_rate — доля отрицательных вердиктов ревизора;
+    - bad_code_rate — доля ответов с кодом теста без проверок (шаг Assert пустой),
+      такой тест статическая проверка отправит на исправление;
+    - malformed_rate — доля JSON-ответов без одного из обязательных ключей (не проходят схему);
+    - structured_outputs — принимать response_format json_schema (False — отвечать 400, как
+      бэкенды без structured outputs);
+    - ms_per_token — время генерации на токен ответа сверх latency_ms (длинный ответ дольше);
+    - ramble_rate — доля ответов, к которым модель «дописывает» ramble_tokens токенов
+      рассуждений (строки-комментарии после ответа). Ответ длиннее max_tokens запроса
+      обрывается с finish_reason "length".
+    """
+
+    latency_ms: float = 300.0
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    capacity: int | None = None
+    quota_rpm: float | None = None
+    retry_after_s: float = 1.0
+    review_fail_rate: float = 0.0
+    bad_code_rate: float = 0.0
+    malformed_rate: float = 0.0
+    structured_outputs: bool = True
+    ms_per_token: float = 0.0
+    ramble_rate: float = 0.0
+    ramble_tokens: int = 4000
+    seed: int | None = None
+
+
+# Распознавание метода клиента по системному промпту,
+# если нет заголовка X-Evolution-Method (порядок важен: сначала более частные)
+PROMPT_MARKERS = [
+    ("ui_requirements_from_text", "выделить атомарные требования"),
+    ("ui_aaa_batch", "список требований по UI"),
+    ("api_aaa_batch", "список HTTP-эндпоинтов"),
+    ("ui_aaa_for_requirement", "Для каждого требования по UI"),
+    ("api_aaa_steps", "об одном HTTP-эндпоинте"),
+    ("review_ui_test", "ревизор автотестов"),
+    ("review_api_test", "ревизор API-автотестов"),
+    ("refine_api_test_with_feedback", "по backend (API)"),
+    ("refine_ui_test_with_feedback", "ПЕРЕПИСАТЬ тест"),
+    ("api_requests_code", "pytest + requests"),
+    ("ui_playwright_steps", "Python + Playwright"),
+]
+
+
+def detect_method(messages: List[Dict[str, str]], header: str | None = None) -> str:
+    if header:
+        return header
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    for method, marker in PROMPT_MARKERS:
+        if marker in system:
+            if method in ("api_requests_code", "ui_playwright_steps") and '"titles"' in system:
+                return method.replace("api_requests_code", "api_steps_and_code").replace(
+                    "ui_playwright_steps", "ui_steps_and_code"
+                )
+            return method
+    return "chat"
+
+
+# === заготовки ответов ===
+
+def _user(messages: List[Dict[str, str]]) -> str:
+    # первое сообщение пользователя — задание; следующие — просьбы исправить ответ
+    return next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+
+
+def _field(text: str, name: str, default: str = "") -> str:
+    match = re.search(rf"{name}:\s*(.+)", text)
+    return match.group(1).strip() if match else default
+
+
+def _requirements(messages: List[Dict[str, str]], rng: random.Random) -> Dict[str, Any]:
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    feature = re.search(r'"feature":\s*"([^"]*)"', system)
+    text = _user(messages).split("требования:\n\n", 1)[-1]
+
+    requirements = []
+    block, block_no = "BLOCK_0", 0
+    for line in text.splitlines():
+        if HEADING_RE.match(line):
+            block_no += 1
+            block = f"BLOCK_{block_no}"
+        elif line.strip().startswith(("-", "*")):
+            title = line.strip(" -*\t")
+            requirements.append(
+                {
+                    "id": f"REQ_{block}_{len(requirements) + 1}",
+                    "block": block,
+                    "title": title[:80],
+                    "description": title,
+                    "priority": rng.choice(["CRITICAL", "NORMAL", "NORMAL", "LOW"]),
+                }
+            )
+    return {"feature": feature.group(1) if feature else "UI продукта", "requirements": requirements}
+
+
+def _aaa_text() -> Dict[str, str]:
+    return {
+        "arrange": "Открыть страницу продукта",
+        "act": "Выполнить действие пользователя",
+        "assert": "Проверить ожидаемый результат",
+    }
+
+
+def _aaa_batch(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {req_id: _aaa_text() for req_id in re.findall(r"ID:\s*(\S+)", _user(messages))}
+
+
+def _ui_code(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {
+        "arrange": ["page.goto(CALC_URL)", 'page.wait_for_load_state("domcontentloaded")'],
+        "act": ['page.get_by_role("button").first.click()'],
+        "assert": ['expect(page.locator("body")).to_be_visible()'],
+    }
+
+
+def _api_code(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    user = _user(messages)
+    method = _field(user, "Метод", "GET").lower()
+    path = _field(user, "Путь", "/")
+    code = _field(user, "Успешный код ответа", "200")
+    return {
+        "arrange": [
+            f"url = BASE_URL + {path!r}",
+            'headers = {"Authorization": f"Bearer {userPlaneApiToken}"}',
+        ],
+        "act": [f"response = requests.{method}(url, headers=headers, timeout=30)"],
+        "assert": [f"assert response.status_code == {code if code.isdigit() else 200}"],
+    }
+
+
+def _with_titles(build: Callable[[List[Dict[str, str]]], Dict[str, Any]]):
+    def _build(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        data = build(messages)
+        data["titles"] = _aaa_text()
+        return data
+
+    return _build
+
+
+def _refined(messages: List[Dict[str, str]]) -> str:
+    # «исправленный» тест — старый код без изменений
+    match = re.search(r"```python\n(.*?)```", _user(messages), re.S)
+    return match.group(1).strip() + "\n" if match else "import allure\n"
+
+
+def _line_edits(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    # «исправление» правками строк: последняя строка старого кода без изменений
+    lines = re.findall(r"^\s*(\d+)\| (.*)$", _user(messages), re.M)
+    if not lines:
+        return {"edits": []}
+    number, code = lines[-1]
+    return {"edits": [{"start": int(number), "end": int(number), "lines": [code]}]}
+
+
+class FakeEvolutionServer:
+    """
+    Локальный OpenAI-совместимый сервер (POST /v1/chat/completions) для нагрузочных
+    прогонов без расхода квоты: на каждый тип промпта EvolutionClient отдаёт
+    валидный по схеме JSON, с настраиваемыми задержкой, ошибками и 429.
+    Запрос с stream=True получает ответ кусками (SSE).
+
+        with FakeEvolutionServer(FakeServerConfig(latency_ms=500)) as server:
+            client = AsyncEvolutionClient(base_url=server.url)
+    """
+
+    def __init__(self, config: FakeServerConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or FakeServerConfig()
+        self.rng = random.Random(self.config.seed)
+        self.stats: Counter = Counter()
+        self.in_flight = 0
+        # квота по моделям: (запросов в корзине, время пополнения)
+        self._quota: Dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeEvolutionServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeEvolutionServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    # --- обработка запроса ---
+
+    def _latency(self) -> float:
+        cfg = self.config
+        with self._lock:
+            return cfg.latency_ms / 1000 * self.rng.lognormvariate(0.0, cfg.latency_sigma)
+
+    def _roll(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def _over_quota(self, model: str) -> float | None:
+        """
+        Запрос сверх quota_rpm: через сколько секунд квота освободится; None — в пределах квоты.
+        """
+        rpm = self.config.quota_rpm
+        if not rpm:
+            return None
+        rate, capacity = rpm / 60, max(1.0, rpm / 60)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._quota.get(model, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._quota[model] = (tokens, now)
+                return (1 - tokens) / rate
+            self._quota[model] = (tokens - 1, now)
+            return None
+
+    def _verdict(self) -> Dict[str, Any]:
+        ok = not self._roll(self.config.review_fail_rate)
+        return {"ok": ok, "problems": [] if ok else ["Нет проверки реакции интерфейса на действие"]}
+
+    def _content(self, method: str, messages: List[Dict[str, str]]) -> str:
+        builders: Dict[str, Callable[[List[Dict[str, str]]], Any]] = {
+            "ui_requirements_from_text": lambda m: _requirements(m, self.rng),
+            "ui_aaa_for_requirement": lambda m: _aaa_text(),
+            "api_aaa_steps": lambda m: _aaa_text(),
+            "ui_aaa_batch": _aaa_batch,
+            "api_aaa_batch": _aaa_batch,
+            "ui_playwright_steps": _ui_code,
+            "ui_steps_and_code": _with_titles(_ui_code),
+            "api_requests_code": _api_code,
+            "api_steps_and_code": _with_titles(_api_code),
+            "refine_ui_test_edits": _line_edits,
+            "refine_api_test_edits": _line_edits,
+        }
+        if method in builders:
+            data = builders[method](messages)
+            if "assert" in data and isinstance(data["assert"], list) and self._roll(self.config.bad_code_rate):
+                data["assert"] = []
+            if data and self._roll(self.config.malformed_rate):
+                with self._lock:
+                    data.pop(self.rng.choice(sorted(data)))
+            return json.dumps(data, ensure_ascii=False)
+        if method in ("review_ui_batch", "review_api_batch"):
+            ids = re.findall(r"^=== ID: (\S+) ===$", _user(messages), re.M)
+            return json.dumps({req_id: self._verdict() for req_id in ids}, ensure_ascii=False)
+        if method.startswith("review_"):
+            return json.dumps(self._verdict(), ensure_ascii=False)
+        if method.startswith("refine_"):
+            return _refined(messages)
+        return "ok"
+
+    def handle(self, body: Dict[str, Any], method_header: str | None) -> tuple[int, Dict[str, str], Dict[str, Any]]:
+        """
+        (статус, заголовки, тело ответа) для одного запроса chat.completions.
+        """
+        cfg = self.config
+        messages = body.get("messages") or []
+        method = detect_method(messages, method_header)
+
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema" and not cfg.structured_outputs:
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["schema_rejected"] += 1
+            return 400, {}, {
+                "error": {
+                    "message": "response_format json_schema is not supported",
+                    "type": "invalid_request_error",
+                    "code": 400,
+                }
+            }
+
+        with self._lock:
+            self.stats["requests"] += 1
+            over_capacity = cfg.capacity is not None and self.in_flight >= cfg.capacity
+            if not over_capacity:
+                self.in_flight += 1
+
+        quota_wait = None if over_capacity else self._over_quota(body.get("model", "fake"))
+        if over_capacity or quota_wait is not None or self._roll(cfg.rate_limit_rate):
+            with self._lock:
+                self.stats["throttled"] += 1
+                if quota_wait is not None:
+                    self.stats["over_quota"] += 1
+                if not over_capacity:
+                    self.in_flight -= 1
+            retry_after = cfg.retry_after_s if quota_wait is None else quota_wait
+            return 429, {"Retry-After": f"{retry_after:.3f}"}, {
+                "error": {"message": "Rate limit exceeded", "type": "rate_limit_error", "code": 429}
+            }
+
+        try:
+            time.sleep(self._latency())
+            if self._roll(cfg.error_rate):
+                with self._lock:
+                    self.stats["errors"] += 1
+                return 500, {}, {"error": {"message": "Internal error", "type": "server_error", "code": 500}}
+
+            content = self._content(method, messages)
+            if self._roll(cfg.ramble_rate):
+                content += "\n" + "# Дополнительно стоит учесть ещё несколько соображений.\n" * (cfg.ramble_tokens // 14)
+            finish_reason = "stop"
+            max_tokens = body.get("max_tokens")
+            if max_tokens and len(content) // 4 > max_tokens:
+                content, finish_reason = content[: max_tokens * 4], "length"
+            if not body.get("stream"):
+                # потоковый ответ выдаётся по кускам с той же скоростью (Handler._send_stream)
+                time.sleep(len(content) // 4 * cfg.ms_per_token / 1000)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        with self._lock:
+            self.stats[method] += 1
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return 200, {}, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status: int, headers: Dict[str, str], payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, payload: Dict[str, Any]) -> None:
+                """
+                Ответ stream=True (SSE): содержимое кусками по 4 токена со скоростью ms_per_token,
+                затем finish_reason, usage и [DONE].
+                """
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                choice = payload["choices"][0]
+                content = choice["message"]["content"]
+                base = {k: payload[k] for k in ("id", "created", "model")}
+                base["object"] = "chat.completion.chunk"
+
+                def event(choices: list, **extra: Any) -> None:
+                    data = json.dumps({**base, "choices": choices, **extra}, ensure_ascii=False)
+                    self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                for i in range(0, len(content), 16):
+                    time.sleep(4 * server.config.ms_per_token / 1000)
+                    delta = {"content": content[i:i + 16]} if i else {"role": "assistant", "content": content[:16]}
+                    event([{"index": 0, "delta": delta, "finish_reason": None}])
+                event([{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}])
+                event([], usage=payload["usage"])
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b"{}"
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {}, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    self._send(400, {}, {"error": {"message": "Invalid JSON body"}})
+                    return
+                status, headers, payload = server.handle(body, self.headers.get("X-Evolution-Method"))
+                try:
+                    if status == 200 and body.get("stream"):
+                        self._send_stream(payload)
+                    else:
+                        self._send(status, headers, payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # клиент отменил запрос (например, проигравший дубль при хеджировании)
+                    with server._lock:
+                        server.stats["cancelled"] += 1
+                    self.close_connection = True
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send(200, {}, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+                else:
+                    self._send(404, {}, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # без построчного лога запросов: сервер используется в бенчмарках
+                pass
+
+        return Handler
@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+from cloudru_agent.llm.ledger import percentile
+
+
+class HedgePolicy:
+    """
+    Хеджирование медленных запросов: если ответ не пришёл за percentile-й
+    перцентиль задержки метода на этой модели, отправляется дубль; побеждает
+    первый ответ, второй запрос отменяется.
+
+    - задержки копятся по последним window успешным запросам метода (без очереди
+      к лимиту и ретраев), дубли начинаются после min_samples наблюдений;
+    - дублей не больше max_extra_ratio от числа запросов (доп. нагрузка на эндпоинт);
+    - min_delay_s — не дублировать раньше, даже если метод очень быстрый.
+
+    Экономия (saved_s) — оценка: средняя задержка «хвоста» метода (запросов
+    медленнее порога) минус время, за которое ответил дубль. Точнее не узнать:
+    проигравший запрос отменён.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_extra_ratio: float = 0.1,
+        min_samples: int = 20,
+        window: int = 200,
+        min_delay_s: float = 0.5,
+    ) -> None:
+        self.percentile = percentile
+        self.max_extra_ratio = max_extra_ratio
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay_s = min_delay_s
+
+        self._lock = threading.Lock()
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+        self.saved_s = 0.0
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy | None":
+        """
+        Хеджирование включается явно:
+        - EVOLUTION_HEDGE=1;
+        - EVOLUTION_HEDGE_PERCENTILE — после какого перцентиля задержки слать дубль (95);
+        - EVOLUTION_HEDGE_MAX_RATIO — предел доли дублей от всех запросов (0.1).
+        """
+        if os.getenv("EVOLUTION_HEDGE", "0").lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(
+            percentile=float(os.getenv("EVOLUTION_HEDGE_PERCENTILE", "95")),
+            max_extra_ratio=float(os.getenv("EVOLUTION_HEDGE_MAX_RATIO", "0.1")),
+        )
+
+    def delay_for(self, method: str, model: str) -> float | None:
+        """
+        Через сколько секунд дублировать запрос; None — пока не дублировать.
+        """
+        with self._lock:
+            self.requests += 1
+            samples = self._latencies.get((method, model))
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            return max(self.min_delay_s, percentile(list(samples), self.percentile))
+
+    def admit(self) -> bool:
+        """
+        Можно ли отправить ещё один дубль, не выходя за max_extra_ratio.
+        """
+        with self._lock:
+            if self.hedged + 1 > self.max_extra_ratio * self.requests:
+                self.over_budget += 1
+                return False
+            self.hedged += 1
+            return True
+
+    def observe(self, method: str, model: str, latency_s: float) -> None:
+        with self._lock:
+            samples = self._latencies.get((method, model))
+            if samples is None:
+                samples = self._latencies[(method, model)] = deque(maxlen=self.window)
+            samples.append(latency_s)
+
+    def record_win(self, method: str, model: str, delay_s: float, elapsed_s: float) -> None:
+        """
+        Дубль ответил первым через elapsed_s от начала основного запроса.
+        """
+        with self._lock:
+            self.hedge_wins += 1
+            tail = [x for x in self._latencies.get((method, model), ()) if x > delay_s]
+            if tail:
+                self.saved_s += max(0.0, sum(tail) / len(tail) - elapsed_s)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "over_budget": self.over_budget,
+                "saved_s": round(self.saved_s, 3),
+            }
@@ -0,0 +1,201 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, List, Tuple
+
+
+# Названия починок — в LedgerEntry.json_repairs и сводке журнала
+FENCE = "fence"                  # ответ обёрнут в ```json ... ```
+EXTRACTED = "extracted"          # вокруг объекта был лишний текст
+SINGLE_QUOTES = "single_quotes"  # строки в одинарных кавычках
+TRAILING_COMMA = "trailing_comma"
+TRUNCATED = "truncated"          # ответ оборван (max_tokens): недописанное отброшено, скобки закрыты
+CONTROL_CHARS = "control_chars"  # неэкранированные переводы строк / табы внутри строк
+PYTHON_LITERALS = "python_literals"  # True / False / None вместо true / false / null
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)", re.S)
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_WORD_RE = re.compile(r"[A-Za-z_]+")
+
+
+class JsonRepairError(ValueError):
+    """
+    Ответ не удалось разобрать как JSON даже после починок.
+    Наследник ValueError: старые `except ValueError` / `except Exception` ловят его как прежде.
+    """
+
+
+@dataclass
+class DecodedJson:
+    """
+    Разобранный ответ модели и список применённых починок (пустой — JSON был валиден).
+    """
+
+    data: Any
+    repairs: Tuple[str, ...] = ()
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.repairs)
+
+
+def _strip_fence(text: str) -> Tuple[str, bool]:
+    if "```" not in text:
+        return text, False
+    match = _FENCE_RE.search(text)
+    if match is None:
+        return text, False
+    return match.group(1), True
+
+
+def _close_truncated(out: List[str], stack: List[list], in_string: bool) -> str:
+    """
+    Дописывает оборванный ответ до валидного.
+
+    Недописанная строка или значение отбрасываются вместе с элементом: обрубок
+    строки кода хуже её отсутствия. Если элемент дописан целиком — просто
+    закрываем скобки.
+    """
+    text = "".join(out)
+    if not in_string:
+        candidate = text.rstrip().rstrip(",")
+        candidate += "".join(_CLOSERS[opener] for opener, _ in reversed(stack))
+        try:
+            json.loads(candidate, strict=False)
+            return candidate
+        except ValueError:
+            pass
+
+    # режем до последней запятой самого глубокого открытого контейнера
+    _, cut = stack[-1]
+    return "".join(out[:cut]).rstrip().rstrip(",") + "".join(_CLOSERS[opener] for opener, _ in reversed(stack))
+
+
+def _normalize(text: str) -> Tuple[str, List[str]]:
+    """
+    Один проход по тексту: берёт первый сбалансированный объект / массив,
+    переводит строки в одинарных кавычках в двойные, убирает висячие запятые
+    и закрывает оборванный ответ.
+    """
+    repairs: List[str] = []
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise JsonRepairError("No JSON object in response")
+    start = min(starts)
+    if text[:start].strip():
+        repairs.append(EXTRACTED)
+
+    out: List[str] = []
+    # [открывающая скобка, позиция в out, до которой можно откатить недописанный элемент]
+    stack: List[list] = []
+    quote: str | None = None
+    escape = False
+    end = len(text)
+
+    skip = 0
+    for i in range(start, len(text)):
+        if skip:
+            skip -= 1
+            continue
+        ch = text[i]
+
+        if quote is not None:
+            if escape:
+                escape = False
+                # \' допустимо в одинарных кавычках, но не в JSON
+                out.append("'" if ch == "'" and quote == "'" else "\\" + ch)
+            elif ch == "\\":
+                escape = True
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                # quote == "'": двойная кавычка внутри такой строки
+                out.append('\\"')
+            else:
+                out.append(ch)
+            continue
+
+        if ch in "\"'":
+            if ch == "'" and SINGLE_QUOTES not in repairs:
+                repairs.append(SINGLE_QUOTES)
+            quote = ch
+            out.append('"')
+        elif ch in _CLOSERS:
+            out.append(ch)
+            stack.append([ch, len(out)])
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                if TRAILING_COMMA not in repairs:
+                    repairs.append(TRAILING_COMMA)
+            out.append(ch)
+            if stack:
+                stack.pop()
+            if not stack:
+                end = i + 1
+                break
+        elif ch == ",":
+            out.append(ch)
+            if stack:
+                stack[-1][1] = len(out) - 1
+        elif ch in "TFN" and (word := _WORD_RE.match(text, i).group()) in _PYTHON_LITERALS:
+            if PYTHON_LITERALS not in repairs:
+                repairs.append(PYTHON_LITERALS)
+            out.append(_PYTHON_LITERALS[word])
+            skip = len(word) - 1
+        else:
+            out.append(ch)
+
+    if stack:
+        repairs.append(TRUNCATED)
+        return _close_truncated(out, stack, in_string=quote is not None), repairs
+
+    if text[end:].strip() and EXTRACTED not in repairs:
+        repairs.append(EXTRACTED)
+    return "".join(out), repairs
+
+
+def decode_json(content: str | None) -> DecodedJson:
+    """
+    Разбирает ответ модели, который должен быть JSON-объектом.
+
+    Валидный JSON возвращается как есть. Иначе по очереди: снимаем markdown-ограждение
+    ```json```, берём первый сбалансированный объект, чиним одинарные кавычки,
+    True/False/None, висячие запятые, оборванный хвост и неэкранированные переводы строк.
+    Что именно починено — в DecodedJson.repairs. Если не помогло — JsonRepairError.
+    """
+    text = (content or "").strip()
+    try:
+        return DecodedJson(json.loads(text))
+    except ValueError:
+        pass
+
+    repairs: List[str] = []
+    text, fenced = _strip_fence(text)
+    if fenced:
+        repairs.append(FENCE)
+
+    normalized, found = _normalize(text)
+    repairs.extend(found)
+    try:
+        data = json.loads(normalized)
+    except ValueError:
+        try:
+            data = json.loads(normalized, strict=False)
+        except ValueError as e:
+            raise JsonRepairError(f"Unrecoverable JSON in response: {e}") from e
+        repairs.append(CONTROL_CHARS)
+    return DecodedJson(data, tuple(repairs))
+
+
+def loads(content: str | None) -> Any:
+    """
+    decode_json(content).data — замена json.loads для ответов модели.
+    """
+    return decode_json(content).data
@@ -0,0 +1,110 @@
+import json
+from typing import Any, Dict, List
+
+
+class JsonArrayStream:
+    """
+    Инкрементальный разбор ответа модели, который приходит по кускам (stream=True):
+    объекты массива key верхнего уровня ({"key": [{...}, {...}]}) отдаются,
+    как только закрылась их фигурная скобка, не дожидаясь конца ответа.
+
+    Строковые значения верхнего уровня, закрытые до массива (например, "feature"),
+    доступны в fields. Объект, который не разобрался как JSON, пропускается:
+    весь ответ всё равно разбирается целиком в конце (с починкой JSON).
+
+        stream = JsonArrayStream("requirements")
+        for delta in deltas:
+            for item in stream.feed(delta):
+                ...
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.fields: Dict[str, Any] = {}
+        self.emitted = 0
+
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # начало текущей строки / объекта массива в self._text
+        self._string_start = -1
+        self._item_start = -1
+        self._last_string: str | None = None
+        self._pending_key: str | None = None
+        # глубина, на которой открыт нужный массив (None — ещё не дошли)
+        self._array_depth: int | None = None
+        self._text = ""
+        self._pos = 0
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        """
+        Очередной кусок ответа -> объекты массива, закрывшиеся в этом куске.
+        """
+        self._text += delta
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._string_closed(text[self._string_start:i + 1])
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._pending_key == self.key:
+                    self._array_depth = self._depth
+                elif ch == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = i
+                self._pending_key = None
+            elif ch in "}]":
+                if ch == "}" and self._item_start >= 0 and self._depth == self._array_depth + 1:
+                    item = self._parse(text[self._item_start:i + 1])
+                    self._item_start = -1
+                    if item is not None:
+                        items.append(item)
+                if ch == "]" and self._depth == self._array_depth:
+                    self._array_depth = None
+                self._depth -= 1
+            elif ch == ":" and self._depth == 1 and self._last_string is not None:
+                self._pending_key, self._last_string = self._last_string, None
+            elif ch == "," and self._depth == 1:
+                self._pending_key = None
+        self._pos = len(text)
+        self.emitted += len(items)
+        return items
+
+    def _string_closed(self, raw: str) -> None:
+        if self._depth != 1:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = None
+        if self._pending_key is not None:
+            # значение поля верхнего уровня
+            self.fields[self._pending_key] = value
+            self._pending_key = None
+            self._last_string = None
+        else:
+            self._last_string = value
+
+    @staticmethod
+    def _parse(raw: str) -> Dict[str, Any] | None:
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+
+    @property
+    def text(self) -> str:
+        return self._text
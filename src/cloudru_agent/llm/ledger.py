@@ -0,0 +1,246 @@
+import csv
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Перцентиль (0..100) с линейной интерполяцией; 0.0 для пустого списка.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """
+    Цена модели за 1 млн токенов промпта и ответа.
+    """
+
+    prompt: float
+    completion: float = 0.0
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.prompt + completion_tokens * self.completion) / 1_000_000
+
+
+def parse_prices(spec: str) -> Dict[str, ModelPrice]:
+    """
+    "model-a=10:30,model-b=2" -> цены по моделям (промпт[:ответ] за 1 млн токенов).
+    """
+    prices = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        model, _, price = item.strip().rpartition("=")
+        prompt, _, completion = price.partition(":")
+        prices[model.strip()] = ModelPrice(
+            prompt=float(prompt),
+            completion=float(completion) if completion.strip() else float(prompt),
+        )
+    return prices
+
+
+@dataclass
+class LedgerEntry:
+    """
+    Один вызов LLM: какой метод клиента, какая модель, сколько токенов и времени ушло.
+
+    source: "api" — реальный запрос, "cache" — ответ из кэша, "coalesced" — ответ
+    одинакового запроса, который в это время уже выполнялся (llm/single_flight.py),
+    "replay" — ответ из кассеты (llm/cassette.py).
+    json_status: "ok" / "repaired" / "invalid" для JSON-ответов, "mismatch" — JSON
+    не прошёл проверку схемы ответа, None — ответ не JSON;
+    json_repairs: какие починки понадобились (через запятую, см. llm/json_repair.py);
+    schema_retry: повторный запрос после ответа, не прошедшего проверку схемы;
+    latency_s: от отправки последней попытки до ответа;
+    wait_s: ожидание до неё — квота, слот, неудачные попытки и паузы перед ретраями;
+    max_tokens: лимит длины ответа в запросе (routing или OutputBudget);
+    truncated: ответ оборван по max_tokens (finish_reason == "length");
+    cost: стоимость реального запроса по таблице цен журнала, None — цена модели не задана.
+    """
+
+    method: str
+    model: str
+    source: str = "api"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_s: float = 0.0
+    wait_s: float = 0.0
+    retries: int = 0
+    json_status: Optional[str] = None
+    json_repairs: Optional[str] = None
+    schema_retry: bool = False
+    max_tokens: Optional[int] = None
+    truncated: bool = False
+    error: Optional[str] = None
+    cost: Optional[float] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+class CallLedger:
+    """
+    Журнал вызовов EvolutionClient в памяти процесса.
+    Потокобезопасен; выгружается в JSON/CSV и сворачивается в сводку по методам.
+
+    prices: цены моделей для LedgerEntry.cost; по умолчанию из EVOLUTION_PRICES
+    ("model-a=10:30,model-b=2" — промпт[:ответ] за 1 млн токенов).
+    """
+
+    def __init__(self, prices: Dict[str, ModelPrice] | None = None) -> None:
+        self.prices = prices if prices is not None else parse_prices(os.getenv("EVOLUTION_PRICES", ""))
+        self._lock = threading.Lock()
+        self._entries: List[LedgerEntry] = []
+
+    def record(self, entry: LedgerEntry) -> None:
+        price = self.prices.get(entry.model)
+        # платят только за реальные запросы: кэш, кассета и общий ответ бесплатны
+        if price is not None and entry.source == "api" and entry.cost is None:
+            entry.cost = round(price.cost(entry.prompt_tokens, entry.completion_tokens), 6)
+        with self._lock:
+            self._entries.append(entry)
+
+    @property
+    def entries(self) -> List[LedgerEntry]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def latencies(self, method: str, model: str | None = None) -> List[float]:
+        """
+        Задержки успешных реальных запросов метода (и модели, если указана).
+        """
+        return [
+            e.latency_s
+            for e in self.entries
+            if e.method == method and e.source == "api" and e.error is None
+            and (model is None or e.model == model)
+        ]
+
+    # --- сводка ---
+
+    def summary(self) -> List[Dict[str, object]]:
+        """
+        Сводка по методам: число вызовов, попадания в кэш, токены и стоимость, задержки и ожидание, ретраи,
+        починенные и невалидные JSON-ответы, ответы не по схеме и повторы из-за них,
+        ответы, оборванные по max_tokens.
+        """
+        by_method: Dict[str, List[LedgerEntry]] = {}
+        for entry in self.entries:
+            by_method.setdefault(entry.method, []).append(entry)
+
+        rows = []
+        for method, entries in sorted(by_method.items()):
+            api_calls = [e for e in entries if e.source == "api"]
+            latencies = [e.latency_s for e in api_calls if e.error is None]
+            rows.append(
+                {
+                    "method": method,
+                    "models": ", ".join(sorted({e.model for e in entries})),
+                    "calls": len(api_calls),
+                    "cached": sum(1 for e in entries if e.source == "cache"),
+                    "coalesced": sum(1 for e in entries if e.source == "coalesced"),
+                    "replayed": sum(1 for e in entries if e.source == "replay" and e.error is None),
+                    # вместе с запросами, которых не оказалось в кассете
+                    "errors": sum(1 for e in entries if e.error and e.source in ("api", "replay")),
+                    "prompt_tokens": sum(e.prompt_tokens for e in api_calls),
+                    "completion_tokens": sum(e.completion_tokens for e in api_calls),
+                    "cost": round(sum(e.cost or 0.0 for e in api_calls), 4),
+                    "latency_total_s": round(sum(latencies), 3),
+                    "latency_p50_s": round(percentile(latencies, 50), 3),
+                    "latency_p95_s": round(percentile(latencies, 95), 3),
+                    "wait_total_s": round(sum(e.wait_s for e in api_calls), 3),
+                    "retries": sum(e.retries for e in api_calls),
+                    "json_repaired": sum(1 for e in entries if e.json_status == "repaired"),
+                    "json_invalid": sum(1 for e in entries if e.json_status == "invalid"),
+                    "json_mismatch": sum(1 for e in entries if e.json_status == "mismatch"),
+                    "schema_retries": sum(1 for e in api_calls if e.schema_retry),
+                    "truncated": sum(1 for e in api_calls if e.truncated),
+                }
+            )
+        return rows
+
+    def json_repairs(self) -> Dict[str, int]:
+        """
+        Сколько раз понадобилась каждая починка JSON (ответы, которые иначе ушли бы в запасной вариант).
+        """
+        counts: Dict[str, int] = {}
+        for entry in self.entries:
+            for repair in (entry.json_repairs or "").split(","):
+                if repair:
+                    counts[repair] = counts.get(repair, 0) + 1
+        return counts
+
+    def format_summary(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return "LLM ledger: вызовов не было"
+
+        columns = [
+            ("method", "method"),
+            ("calls", "calls"),
+            ("cached", "cached"),
+            ("coalesced", "shared"),
+            ("replayed", "replay"),
+            ("errors", "err"),
+            ("prompt_tokens", "prompt_tok"),
+            ("completion_tokens", "compl_tok"),
+            ("cost", "cost"),
+            ("latency_total_s", "total_s"),
+            ("latency_p50_s", "p50_s"),
+            ("latency_p95_s", "p95_s"),
+            ("wait_total_s", "wait_s"),
+            ("retries", "retries"),
+            ("json_repaired", "fixed_json"),
+            ("json_invalid", "bad_json"),
+            ("json_mismatch", "bad_schema"),
+            ("schema_retries", "schema_retry"),
+            ("truncated", "cut"),
+        ]
+        widths = [max(len(title), *(len(str(r[key])) for r in rows)) for key, title in columns]
+        lines = [
+            "  ".join(title.ljust(w) for (_, title), w in zip(columns, widths)),
+        ]
+        for row in rows:
+            lines.append("  ".join(str(row[key]).ljust(w) for (key, _), w in zip(columns, widths)))
+        if self.prices:
+            lines.append(f"total cost: {round(sum(row['cost'] for row in rows), 4)}")
+        return "\n".join(lines)
+
+    # --- экспорт ---
+
+    def to_json(self, path: str | Path) -> None:
+        Path(path).write_text(
+            json.dumps([asdict(e) for e in self.entries], ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+
+    def to_csv(self, path: str | Path) -> None:
+        names = [f.name for f in fields(LedgerEntry)]
+        with Path(path).open("w", encoding="utf-8", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=names)
+            writer.writeheader()
+            for entry in self.entries:
+                writer.writerow(asdict(entry))
+
+    def export(self, path: str | Path) -> None:
+        """
+        Выгрузка по расширению файла: .csv — CSV, иначе JSON.
+        """
+        if str(path).lower().endswith(".csv"):
+            self.to_csv(path)
+        else:
+            self.to_json(path)
@@ -0,0 +1,62 @@
+import ast
+import re
+from typing import Iterable, List
+
+from cloudru_agent.llm.schemas import LineEdit
+
+
+# «  7| код» — так строки старого кода пронумерованы в промпте
+_NUMBERED_RE = re.compile(r"^\s*\d+\| ?")
+
+
+class PatchError(ValueError):
+    """
+    Правки не применяются к коду (строки вне файла, пересечения)
+    или код после них не компилируется.
+    """
+
+
+def numbered(code: str) -> str:
+    """
+    Код с номерами строк — по ним модель ссылается на строки в правках.
+    """
+    lines = code.splitlines()
+    width = len(str(len(lines)))
+    return "\n".join(f"{i:>{width}}| {line}" for i, line in enumerate(lines, 1))
+
+
+def _replacement(lines: List[str]) -> List[str]:
+    # модель иногда отдаёт несколько строк одним элементом или копирует номера строк
+    result = [part for line in lines for part in (line.splitlines() or [""])]
+    if result and all(_NUMBERED_RE.match(line) for line in result if line.strip()):
+        result = [_NUMBERED_RE.sub("", line, count=1) for line in result]
+    return result
+
+
+def apply_line_edits(code: str, edits: Iterable[LineEdit]) -> str:
+    """
+    Применяет правки по номерам строк к code и проверяет, что результат компилируется.
+    Номера — в исходном коде, поэтому правки применяются с конца файла.
+    """
+    lines = code.splitlines()
+    ordered = sorted(edits, key=lambda e: (e.start, e.end))
+    if not ordered:
+        raise PatchError("правок нет")
+
+    covered = 0
+    for edit in ordered:
+        if not (1 <= edit.start <= len(lines) + 1 and edit.start - 1 <= edit.end <= len(lines)):
+            raise PatchError(f"строки {edit.start}-{edit.end} вне файла из {len(lines)} строк")
+        if edit.start <= covered:
+            raise PatchError(f"правки пересекаются на строке {edit.start}")
+        covered = max(covered, edit.end)
+
+    for edit in reversed(ordered):
+        lines[edit.start - 1:edit.end] = _replacement(edit.lines)
+
+    result = "\n".join(lines) + ("\n" if code.endswith("\n") else "")
+    try:
+        ast.parse(result)
+    except SyntaxError as e:
+        raise PatchError(f"после правок код не компилируется: {e.msg} (строка {e.lineno})") from e
+    return result
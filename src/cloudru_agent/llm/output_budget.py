@@ -0,0 +1,198 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Tuple
+
+from cloudru_agent.llm.ledger import percentile
+
+
+DEFAULT_OUTPUT_BUDGET_PATH = Path.home() / ".cache" / "cloudru_agent" / "output_budget.sqlite"
+
+
+class OutputBudget:
+    """
+    Лимит длины ответа (max_tokens) по методу клиента и модели, предсказанный по истории:
+    percentile-й перцентиль длины последних window ответов метода × headroom,
+    не меньше min_tokens. Пока не набралось min_samples ответов, лимита нет.
+
+    Пакетные методы (*_batch) без лимита: длина их ответа зависит от размера пакета
+    (от 1 до max_batch_size элементов), и общий перцентиль обрывал бы большие пакеты.
+
+    Ответ, оборванный этим лимитом (finish_reason == "length"), запрашивается ещё раз
+    с лимитом в retry_factor раз больше. Оборванный и после этого ответ — модель
+    «зациклилась» — остаётся как есть (оборванный JSON чинится локально).
+
+    - truncated — сколько ответов оборвано лимитом бюджета, lost_s — время этих попыток;
+    - saved_s — оценка итоговой экономии: без лимита «заговорившийся» ответ шёл бы
+      до ceiling_tokens (потолок ответа на эндпоинте) с той же скоростью, а действительно
+      длинный ответ стоил бы одного запроса, а не двух. Точнее не узнать: сколько ещё
+      написала бы модель, неизвестно.
+
+    path — sqlite-файл с историей длин ответов: без него история живёт только в процессе,
+    и за один прогон CLI её обычно не хватает до min_samples. С ним каждый процесс
+    при старте читает последние window ответов каждого метода и дописывает свои.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 99.0,
+        headroom: float = 1.5,
+        min_tokens: int = 256,
+        min_samples: int = 20,
+        window: int = 200,
+        retry_factor: float = 4.0,
+        ceiling_tokens: int = 4096,
+        path: str | Path | None = None,
+    ) -> None:
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.min_samples = min_samples
+        self.window = window
+        self.retry_factor = retry_factor
+        self.ceiling_tokens = ceiling_tokens
+
+        self._lock = threading.Lock()
+        self._lengths: Dict[Tuple[str, str], Deque[int]] = {}
+        self.requests = 0
+        self.capped = 0
+        self.truncated = 0
+        self.runaway = 0
+        self.lost_s = 0.0
+        self.saved_s = 0.0
+
+        self.path = Path(path).expanduser() if path is not None else None
+        self._conn: sqlite3.Connection | None = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lengths ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " method TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " tokens INTEGER NOT NULL,"
+                " observed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lengths_method ON lengths (method, model, id)")
+            self._conn.commit()
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "OutputBudget | None":
+        """
+        Включено по умолчанию, EVOLUTION_OUTPUT_BUDGET=0 — выключить:
+        - EVOLUTION_OUTPUT_BUDGET_PERCENTILE — перцентиль длины ответов (99);
+        - EVOLUTION_OUTPUT_BUDGET_HEADROOM — запас сверх перцентиля (1.5);
+        - EVOLUTION_OUTPUT_CEILING — потолок длины ответа на эндпоинте, для оценки экономии (4096);
+        - EVOLUTION_OUTPUT_BUDGET_PATH — sqlite-файл истории длин ответов, общий для прогонов.
+        """
+        if os.getenv("EVOLUTION_OUTPUT_BUDGET", "1").lower() in ("0", "false", "no", "off"):
+            return None
+        return cls(
+            percentile=float(os.getenv("EVOLUTION_OUTPUT_BUDGET_PERCENTILE", "99")),
+            headroom=float(os.getenv("EVOLUTION_OUTPUT_BUDGET_HEADROOM", "1.5")),
+            ceiling_tokens=int(os.getenv("EVOLUTION_OUTPUT_CEILING", "4096")),
+            path=os.getenv("EVOLUTION_OUTPUT_BUDGET_PATH") or DEFAULT_OUTPUT_BUDGET_PATH,
+        )
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT method, model, tokens FROM ("
+            " SELECT method, model, tokens, id,"
+            " ROW_NUMBER() OVER (PARTITION BY method, model ORDER BY id DESC) AS rn FROM lengths"
+            ") WHERE rn <= ? ORDER BY id",
+            (self.window,),
+        ).fetchall()
+        for method, model, tokens in rows:
+            lengths = self._lengths.get((method, model))
+            if lengths is None:
+                lengths = self._lengths[(method, model)] = deque(maxlen=self.window)
+            lengths.append(tokens)
+
+    def _persist(self, method: str, model: str, completion_tokens: int) -> None:
+        # вызывается под self._lock; старше window ответов метода в файле не храним
+        self._conn.execute(
+            "INSERT INTO lengths (method, model, tokens, observed_at) VALUES (?, ?, ?, ?)",
+            (method, model, completion_tokens, time.time()),
+        )
+        self._conn.execute(
+            "DELETE FROM lengths WHERE method = ? AND model = ? AND id <= ("
+            " SELECT id FROM lengths WHERE method = ? AND model = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (method, model, method, model, self.window),
+        )
+        self._conn.commit()
+
+    def cap_for(self, method: str, model: str) -> int | None:
+        """
+        max_tokens для запроса; None — истории метода пока мало или это пакетный метод, без лимита.
+        """
+        if self.uncapped(method):
+            return None
+        with self._lock:
+            self.requests += 1
+            lengths = self._lengths.get((method, model))
+            if lengths is None or len(lengths) < self.min_samples:
+                return None
+            self.capped += 1
+            cap = percentile(list(lengths), self.percentile) * self.headroom
+            return max(self.min_tokens, math.ceil(cap))
+
+    @staticmethod
+    def uncapped(method: str) -> bool:
+        return method.endswith("_batch")
+
+    def observe(self, method: str, model: str, completion_tokens: int, truncated: bool) -> None:
+        """
+        Длина ответа; оборванные ответы в историю не идут — их длина не настоящая.
+        """
+        if truncated or completion_tokens <= 0 or self.uncapped(method):
+            return
+        with self._lock:
+            lengths = self._lengths.get((method, model))
+            if lengths is None:
+                lengths = self._lengths[(method, model)] = deque(maxlen=self.window)
+            lengths.append(completion_tokens)
+            if self._conn is not None:
+                self._persist(method, model, completion_tokens)
+
+    def extend(self, cap: int, latency_s: float) -> int:
+        """
+        Ответ оборван лимитом cap за latency_s: лимит для повтора.
+        """
+        with self._lock:
+            self.truncated += 1
+            self.lost_s += latency_s
+        return math.ceil(cap * self.retry_factor)
+
+    def settle(self, first_cap: int, first_latency_s: float, tokens: int, latency_s: float, truncated: bool) -> None:
+        """
+        Итог повтора (tokens токенов за latency_s) после оборванной первой попытки.
+        """
+        with self._lock:
+            if truncated:
+                # зациклилась и при повторе: без лимита шла бы до потолка
+                self.runaway += 1
+                baseline = latency_s * self.ceiling_tokens / max(tokens, 1)
+            elif tokens <= first_cap:
+                # повтор уложился в первый лимит: «заговорилась» только первая попытка
+                baseline = first_latency_s * self.ceiling_tokens / first_cap
+            else:
+                # ответ действительно длинный: лимит был мал, первая попытка потеряна
+                baseline = latency_s
+            self.saved_s += baseline - first_latency_s - latency_s
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "capped": self.capped,
+                "truncated": self.truncated,
+                "runaway": self.runaway,
+                "lost_s": round(self.lost_s, 3),
+                "saved_s": round(self.saved_s, 3),
+            }
@@ -0,0 +1,335 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+
+DEFAULT_QUOTA_PATH = Path.home() / ".cache" / "cloudru_agent" / "quota.sqlite"
+
+
+@dataclass(frozen=True)
+class ModelQuota:
+    """Квота эндпоинта на модель: запросов и токенов (prompt + completion) в минуту."""
+
+    rpm: float | None = None
+    tpm: float | None = None
+
+
+def parse_quotas(spec: str) -> Dict[str, ModelQuota]:
+    """
+    "model-a=60:120000,model-b=30" -> квоты по моделям (rpm[:tpm]).
+    """
+    quotas = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        model, _, limits = item.strip().rpartition("=")
+        rpm, _, tpm = limits.partition(":")
+        quotas[model.strip()] = ModelQuota(
+            rpm=float(rpm) if rpm.strip() else None,
+            tpm=float(tpm) if tpm.strip() else None,
+        )
+    return quotas
+
+
+class SharedQuota:
+    """
+    Квота запросов и токенов в минуту, общая для всех процессов на машине
+    (несколько CLI-прогонов в CI): token bucket на модель в sqlite-файле.
+
+    Транзакция BEGIN IMMEDIATE — межпроцессная блокировка: запрос забирает из корзины
+    один запрос и оценку токенов (промпт ≈ символы / 4 + max_tokens или expected_completion),
+    после ответа оценка сверяется с usage (settle). Корзина вмещает burst_s секунд квоты,
+    поэтому поток запросов ровный, без пачек и отказов 429 в начале каждой минуты.
+    Ответ 429 опустошает корзину модели на Retry-After для всех процессов (throttled).
+
+    Очередь честная между процессами: пока ждут несколько процессов, следующим получает
+    запрос тот, кто получал его давнее всех. Внутри процесса в sqlite ходит один ожидающий
+    на модель, остальные потоки / задачи ждут его локально.
+    """
+
+    def __init__(
+        self,
+        quotas: Dict[str, ModelQuota],
+        default: ModelQuota | None = None,
+        path: str | Path = DEFAULT_QUOTA_PATH,
+        burst_s: float = 1.0,
+        expected_completion: int = 512,
+        max_poll_s: float = 0.5,
+        stale_s: float = 5.0,
+    ) -> None:
+        self.quotas = quotas
+        self.default = default
+        self.path = Path(path).expanduser()
+        self.burst_s = burst_s
+        self.expected_completion = expected_completion
+        self.max_poll_s = max_poll_s
+        self.stale_s = stale_s
+        self.owner = f"{os.getpid()}"
+
+        self.granted: Counter = Counter()
+        self.waited: Counter = Counter()
+        self.wait_s: Counter = Counter()
+        self.penalties: Counter = Counter()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._local: Dict[str, threading.Lock] = {}
+        self._alocal: Dict[Tuple[int, str], asyncio.Lock] = {}
+        # autocommit: транзакции открываются явно (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " model TEXT PRIMARY KEY,"
+            " requests REAL NOT NULL,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS owners ("
+            " model TEXT NOT NULL,"
+            " owner TEXT NOT NULL,"
+            " last_grant REAL NOT NULL,"
+            " waiting_since REAL,"
+            " seen_at REAL NOT NULL,"
+            " PRIMARY KEY (model, owner))"
+        )
+
+    @classmethod
+    def from_env(cls) -> "SharedQuota | None":
+        """
+        Квота по переменным окружения (не задана — без квоты):
+        - EVOLUTION_QUOTA_RPM / EVOLUTION_QUOTA_TPM — запросов / токенов в минуту на модель;
+        - EVOLUTION_QUOTA_MODELS — свои квоты моделей: "model-a=60:120000,model-b=30";
+        - EVOLUTION_QUOTA_PATH — sqlite-файл, общий для процессов;
+        - EVOLUTION_QUOTA_BURST_S — сколько секунд квоты можно израсходовать пачкой (1).
+        """
+        rpm = os.getenv("EVOLUTION_QUOTA_RPM")
+        tpm = os.getenv("EVOLUTION_QUOTA_TPM")
+        quotas = parse_quotas(os.getenv("EVOLUTION_QUOTA_MODELS", ""))
+        default = ModelQuota(rpm=float(rpm) if rpm else None, tpm=float(tpm) if tpm else None)
+        if not quotas and default.rpm is None and default.tpm is None:
+            return None
+        return cls(
+            quotas=quotas,
+            default=default if default.rpm is not None or default.tpm is not None else None,
+            path=os.getenv("EVOLUTION_QUOTA_PATH") or DEFAULT_QUOTA_PATH,
+            burst_s=float(os.getenv("EVOLUTION_QUOTA_BURST_S", "1")),
+        )
+
+    def quota_for(self, model: str) -> ModelQuota | None:
+        return self.quotas.get(model, self.default)
+
+    def estimate(self, messages: list, max_tokens: int | None) -> int:
+        """
+        Оценка токенов запроса до ответа: промпт ≈ символы / 4, ответ — max_tokens.
+        """
+        prompt = sum(len(m.get("content") or "") for m in messages) // 4
+        return prompt + (max_tokens or self.expected_completion)
+
+    # --- корзина в sqlite ---
+
+    def _capacity(self, per_minute: float | None) -> float:
+        return max(1.0, per_minute / 60 * self.burst_s) if per_minute else 0.0
+
+    def _refill(self, model: str, quota: ModelQuota, now: float) -> Tuple[float, float]:
+        row = self._conn.execute("SELECT requests, tokens, updated_at FROM buckets WHERE model = ?", (model,)).fetchone()
+        cap_r, cap_t = self._capacity(quota.rpm), self._capacity(quota.tpm)
+        if row is None:
+            return cap_r, cap_t
+        requests, tokens, updated_at = row
+        elapsed = max(0.0, now - updated_at)
+        if quota.rpm:
+            requests = min(cap_r, requests + quota.rpm / 60 * elapsed)
+        if quota.tpm:
+            tokens = min(cap_t, tokens + quota.tpm / 60 * elapsed)
+        return requests, tokens
+
+    def _save(self, model: str, requests: float, tokens: float, now: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO buckets (model, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+            (model, requests, tokens, now),
+        )
+
+    def _try_take(self, model: str, quota: ModelQuota, cost: int) -> float:
+        """
+        Одна попытка: 0.0 — запрос разрешён, иначе через сколько секунд попробовать снова.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens = self._refill(model, quota, now)
+                row = self._conn.execute(
+                    "SELECT last_grant, waiting_since FROM owners WHERE model = ? AND owner = ?", (model, self.owner)
+                ).fetchone()
+                last_grant, waiting_since = row if row is not None else (0.0, None)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO owners (model, owner, last_grant, waiting_since, seen_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (model, self.owner, last_grant, waiting_since or now, now),
+                )
+
+                # очередь процессов: первым идёт тот, кто получал запрос давнее всех
+                ahead = self._conn.execute(
+                    "SELECT COUNT(*) FROM owners WHERE model = ? AND owner != ? AND waiting_since IS NOT NULL"
+                    " AND seen_at > ? AND (last_grant < ? OR (last_grant = ? AND owner < ?))",
+                    (model, self.owner, now - self.stale_s, last_grant, last_grant, self.owner),
+                ).fetchone()[0]
+
+                wait = 0.0
+                if quota.rpm and requests < 1:
+                    wait = (1 - requests) / (quota.rpm / 60)
+                # запрос больше корзины пропускается, когда она полна (остаток уходит в долг)
+                need = min(cost, self._capacity(quota.tpm))
+                if quota.tpm and tokens < need:
+                    wait = max(wait, (need - tokens) / (quota.tpm / 60))
+
+                if ahead or wait > 0:
+                    self._save(model, requests, tokens, now)
+                    self._conn.execute("COMMIT")
+                    if ahead:
+                        # своя очередь не подошла: проверить снова, когда в корзине появится запрос
+                        wait = max(wait, 60 / quota.rpm if quota.rpm else 0.05)
+                    return min(wait, self.max_poll_s)
+
+                self._save(model, requests - 1 if quota.rpm else requests, tokens - cost if quota.tpm else tokens, now)
+                self._conn.execute(
+                    "UPDATE owners SET last_grant = ?, waiting_since = NULL WHERE model = ? AND owner = ?",
+                    (now, model, self.owner),
+                )
+                self._conn.execute("COMMIT")
+                return 0.0
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- выдача ---
+
+    def acquire(self, model: str, cost: int) -> None:
+        quota = self.quota_for(model)
+        if quota is None:
+            return
+        with self._lock:
+            local = self._local.setdefault(model, threading.Lock())
+        started = time.monotonic()
+        with local:
+            try:
+                while True:
+                    wait = self._try_take(model, quota, cost)
+                    if wait == 0.0:
+                        break
+                    time.sleep(wait)
+            except BaseException:
+                self._leave(model)
+                raise
+        self._granted(model, time.monotonic() - started)
+
+    async def aacquire(self, model: str, cost: int) -> None:
+        """
+        Как acquire, но ждёт в event loop (транзакция sqlite короткая и выполняется в нём же).
+        """
+        quota = self.quota_for(model)
+        if quota is None:
+            return
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            local = self._alocal.setdefault((id(loop), model), asyncio.Lock())
+        started = time.monotonic()
+        async with local:
+            try:
+                while True:
+                    wait = self._try_take(model, quota, cost)
+                    if wait == 0.0:
+                        break
+                    await asyncio.sleep(wait)
+            except BaseException:
+                # отменённая задача не должна держать очередь других процессов
+                self._leave(model)
+                raise
+        self._granted(model, time.monotonic() - started)
+
+    def _leave(self, model: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE owners SET waiting_since = NULL WHERE model = ? AND owner = ?", (model, self.owner)
+            )
+
+    def _granted(self, model: str, waited_s: float) -> None:
+        with self._lock:
+            self.granted[model] += 1
+            if waited_s > 0.001:
+                self.waited[model] += 1
+                self.wait_s[model] += waited_s
+
+    # --- обратная связь ---
+
+    def _adjust(self, model: str, requests_delta: float, tokens_delta: float, floor_s: float | None = None) -> None:
+        quota = self.quota_for(model)
+        if quota is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens = self._refill(model, quota, now)
+                requests += requests_delta
+                tokens += tokens_delta
+                if floor_s is not None:
+                    # корзина пуста ещё floor_s секунд
+                    if quota.rpm:
+                        requests = min(requests, 1 - quota.rpm / 60 * floor_s)
+                    if quota.tpm:
+                        tokens = min(tokens, -quota.tpm / 60 * floor_s)
+                self._save(model, requests, tokens, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def settle(self, model: str, estimate: int, actual: int) -> None:
+        """
+        Токены ответа по usage вместо оценки при выдаче.
+        """
+        quota = self.quota_for(model)
+        if quota is None or not quota.tpm or not actual or actual == estimate:
+            return
+        self._adjust(model, 0.0, float(estimate - actual))
+
+    def refund(self, model: str, estimate: int) -> None:
+        """
+        Запрос не получил ответа (ошибка, отмена): оценка токенов возвращается в корзину.
+        Сам запрос остаётся списанным; 429 дополнительно штрафуется через throttled.
+        """
+        quota = self.quota_for(model)
+        if quota is None or not quota.tpm or not estimate:
+            return
+        self._adjust(model, 0.0, float(estimate))
+
+    def throttled(self, model: str, retry_after: float | None) -> None:
+        """
+        Эндпоинт ответил 429: квота исчерпана и для других процессов — корзина
+        опустошается на retry_after (или на секунду, если заголовка нет).
+        """
+        if self.quota_for(model) is None:
+            return
+        with self._lock:
+            self.penalties[model] += 1
+        self._adjust(model, 0.0, 0.0, floor_s=retry_after or 1.0)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                model: {
+                    "granted": self.granted[model],
+                    "waited": self.waited[model],
+                    "wait_s": round(self.wait_s[model], 3),
+                    "throttled": self.penalties[model],
+                }
+                for model in self.granted
+            }
@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict
+
+import yaml
+
+from cloudru_agent.llm.ledger import CallLedger, percentile
+
+if TYPE_CHECKING:
+    from cloudru_agent.llm.evolution_client import ChatCall
+
+# os.path.expandvars оставляет незаданные переменные как есть: $NAME или ${NAME}
+_UNRESOLVED_VAR_RE = re.compile(r"\$(\w+|\{[^}]*\})")
+
+
+@dataclass
+class Route:
+    """
+    Настройки запросов одного метода клиента. None — оставить как в промпте
+    (модель gen_model/review_model, temperature метода, без max_tokens).
+
+    latency_slo_s + fallback_model: если p95 задержки метода на основной модели
+    превысил SLO, запросы уходят на запасную модель. Задержка — от отправки до ответа,
+    без ожидания квоты, слота и пауз перед ретраями (LedgerEntry.wait_s).
+    """
+
+    model: str | None = None
+    temperature: float | None = None
+    max_tokens: int | None = None
+    latency_slo_s: float | None = None
+    fallback_model: str | None = None
+
+
+class RoutingTable:
+    """
+    Таблица маршрутизации: метод клиента (ChatCall.method) -> Route.
+    Ключ "default" задаёт настройки для методов без своей записи.
+
+    p95 считается по последним window успешным вызовам из журнала (CallLedger),
+    но не раньше, чем наберётся min_samples. Пока метод на запасной модели,
+    каждый probe_every-й запрос всё равно идёт на основную, чтобы заметить,
+    что она снова укладывается в SLO.
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, Route] | None = None,
+        window: int = 50,
+        min_samples: int = 10,
+        probe_every: int = 10,
+    ) -> None:
+        self.routes = dict(routes or {})
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+
+        self._lock = threading.Lock()
+        self._degraded_calls: Dict[str, int] = {}
+        self.fallbacks: Dict[str, int] = {}
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "RoutingTable":
+        known = {f.name for f in fields(Route)}
+        routes = {}
+        for method, options in (raw or {}).items():
+            options = {k: v for k, v in (options or {}).items() if k in known}
+            # модели можно задавать через переменные окружения: $EVOLUTION_REVIEW_MODEL;
+            # незаданная переменная — ошибка, а не имя модели "$EVOLUTION_REVIEW_MODEL"
+            for key in ("model", "fallback_model"):
+                if isinstance(options.get(key), str):
+                    value = os.path.expandvars(options[key])
+                    if _UNRESOLVED_VAR_RE.search(value):
+                        raise ValueError(
+                            f"Routing: {method}.{key} = {options[key]!r} refers to an unset "
+                            "environment variable"
+                        )
+                    options[key] = value or None
+            routes[method] = Route(**options)
+        return cls(routes)
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "RoutingTable":
+        """
+        YAML или JSON вида {method: {model, temperature, max_tokens, latency_slo_s, fallback_model}}.
+        """
+        text = Path(path).expanduser().read_text(encoding="utf-8")
+        raw = json.loads(text) if str(path).endswith(".json") else yaml.safe_load(text)
+        return cls.from_dict(raw)
+
+    @classmethod
+    def from_env(cls) -> "RoutingTable":
+        """
+        EVOLUTION_ROUTING_PATH — файл таблицы; без него таблица пустая
+        и запросы уходят как раньше.
+        """
+        path = os.getenv("EVOLUTION_ROUTING_PATH")
+        return cls.from_file(path) if path else cls()
+
+    def route_for(self, method: str) -> Route | None:
+        return self.routes.get(method) or self.routes.get("default")
+
+    def _over_slo(self, method: str, model: str, slo: float, ledger: CallLedger) -> bool:
+        latencies = ledger.latencies(method, model)[-self.window:]
+        return len(latencies) >= self.min_samples and percentile(latencies, 95) > slo
+
+    def apply(self, call: "ChatCall", ledger: CallLedger, slo_fallback: bool = True) -> "ChatCall":
+        """
+        Подставляет в запрос модель / temperature / max_tokens из таблицы
+        и переключает на запасную модель при нарушении SLO (slo_fallback=False — без
+        переключения: запрос как в таблице, ключ кассеты).
+        """
+        route = self.route_for(call.method)
+        if route is None:
+            return call
+
+        changes: Dict[str, Any] = {}
+        model = route.model or call.model
+        if route.temperature is not None:
+            changes["temperature"] = route.temperature
+        if route.max_tokens is not None:
+            changes["max_tokens"] = route.max_tokens
+
+        if slo_fallback and route.latency_slo_s is not None and route.fallback_model:
+            if self._over_slo(call.method, model, route.latency_slo_s, ledger):
+                with self._lock:
+                    n = self._degraded_calls.get(call.method, 0) + 1
+                    self._degraded_calls[call.method] = n
+                    if n % self.probe_every:
+                        model = route.fallback_model
+                        self.fallbacks[call.method] = self.fallbacks.get(call.method, 0) + 1
+            else:
+                with self._lock:
+                    self._degraded_calls.pop(call.method, None)
+
+        if model != call.model:
+            changes["model"] = model
+        return replace(call, **changes) if changes else call
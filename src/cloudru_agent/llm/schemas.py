@@ -0,0 +1,200 @@
+import copy
+import json
+import threading
+from typing import Any, Dict, List, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError, create_model, field_validator
+
+from cloudru_agent.llm.json_repair import loads as loads_json
+
+
+class AaaSteps(BaseModel):
+    """
+    Текст шагов Arrange / Act / Assert (ui_aaa_for_requirement, api_aaa_steps, titles).
+    """
+
+    arrange: str
+    act: str
+    assert_: str = Field(alias="assert")
+
+
+class CodeSteps(BaseModel):
+    """
+    Строки кода шагов Arrange / Act / Assert (ui_playwright_steps, api_requests_code).
+    """
+
+    arrange: List[str]
+    act: List[str]
+    assert_: List[str] = Field(alias="assert")
+
+    @field_validator("arrange", "act", "assert_", mode="before")
+    @classmethod
+    def _lines(cls, value: Any) -> Any:
+        # одну строку вместо списка разбор ответа и так принимает — не повод для повтора
+        return [value] if isinstance(value, str) else value
+
+
+class FusedCodeSteps(CodeSteps):
+    """
+    Код шагов + их названия одним ответом (ui_steps_and_code, api_steps_and_code).
+    """
+
+    titles: AaaSteps
+
+
+class ReviewVerdict(BaseModel):
+    """
+    Вердикт ревизора (review_ui_test, review_api_test).
+    """
+
+    ok: bool
+    problems: List[str]
+
+
+class LineEdit(BaseModel):
+    """
+    Замена строк start..end старого кода (с 1, включительно) на lines.
+    end = start - 1 — вставка перед строкой start, пустой lines — удаление.
+    """
+
+    start: int
+    end: int
+    lines: List[str]
+
+
+class RefineEdits(BaseModel):
+    """
+    Точечные правки теста вместо переписанного целиком (refine_ui_test_edits, refine_api_test_edits).
+    """
+
+    edits: List[LineEdit]
+
+
+def batch_schema(item: Type[BaseModel], ids: List[str], name: str) -> Type[BaseModel]:
+    """
+    Схема пакетного ответа {ID: item}: ровно те ID требований, что были во входе.
+    ID бывают не идентификаторами Python, поэтому они — alias полей.
+    """
+    fields: Dict[str, Any] = {
+        f"req_{i}": (item, Field(alias=req_id)) for i, req_id in enumerate(ids)
+    }
+    return create_model(name, **fields)
+
+
+def aaa_batch_schema(ids: List[str]) -> Type[BaseModel]:
+    return batch_schema(AaaSteps, ids, "AaaBatch")
+
+
+def review_batch_schema(ids: List[str]) -> Type[BaseModel]:
+    return batch_schema(ReviewVerdict, ids, "ReviewBatch")
+
+
+def _strict(node: Any) -> None:
+    """
+    Приводит JSON Schema к строгому режиму structured outputs: у объектов все поля
+    обязательны и лишние запрещены, значений по умолчанию нет.
+    """
+    if not isinstance(node, dict):
+        return
+    node.pop("default", None)
+    properties = node.get("properties")
+    if isinstance(properties, dict):
+        node["required"] = list(properties)
+        node["additionalProperties"] = False
+        for sub in properties.values():
+            _strict(sub)
+    for sub in node.get("$defs", {}).values():
+        _strict(sub)
+    for key in ("anyOf", "allOf", "oneOf"):
+        for sub in node.get(key, []):
+            _strict(sub)
+    _strict(node.get("items"))
+
+
+def strict_json_schema(schema: Type[BaseModel]) -> Dict[str, Any]:
+    data = copy.deepcopy(schema.model_json_schema(by_alias=True))
+    _strict(data)
+    return data
+
+
+def response_format(schema: Type[BaseModel], name: str) -> Dict[str, Any]:
+    """
+    response_format для chat.completions со строгой JSON Schema модели.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": strict_json_schema(schema)},
+    }
+
+
+def schema_error(schema: Type[BaseModel], content: str | None) -> str | None:
+    """
+    None — ответ разбирается (с локальными починками JSON) и проходит валидацию схемы;
+    иначе — короткое описание ошибок для повторного запроса.
+    """
+    try:
+        data = loads_json(content)
+    except ValueError as e:
+        return f"ответ не является JSON: {e}"
+    try:
+        schema.model_validate(data)
+    except ValidationError as e:
+        errors = e.errors()
+        lines = [
+            f"- {'.'.join(str(part) for part in err['loc']) or '<root>'}: {err['msg']}"
+            for err in errors[:10]
+        ]
+        if len(errors) > 10:
+            lines.append(f"- ... и ещё {len(errors) - 10}")
+        return "\n".join(lines)
+    return None
+
+
+def schema_prompt(schema: Type[BaseModel]) -> str:
+    return json.dumps(strict_json_schema(schema), ensure_ascii=False)
+
+
+class StructuredOutputSupport:
+    """
+    Принимает ли бэкенд response_format json_schema — по (base_url, модель), общее на процесс:
+    синхронный и асинхронный клиенты и все оркестраторы узнают об этом один раз.
+
+    Пока поддержка неизвестна, json_schema отправляет только один запрос-проба,
+    остальные идут с json_object и проверяются локально — иначе при старте флоу
+    все параллельные запросы получили бы 400.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._supported: Dict[Tuple[str, str], bool] = {}
+        self._probing: set[Tuple[str, str]] = set()
+
+    def use_schema(self, base_url: str, model: str) -> bool:
+        key = (base_url, model)
+        with self._lock:
+            if key in self._supported:
+                return self._supported[key]
+            if key in self._probing:
+                return False
+            self._probing.add(key)
+            return True
+
+    def report(self, base_url: str, model: str, supported: bool | None) -> None:
+        """
+        Итог запроса с json_schema; None — запрос упал по другой причине, поддержка неизвестна.
+        """
+        key = (base_url, model)
+        with self._lock:
+            self._probing.discard(key)
+            if supported is not None:
+                self._supported[key] = supported
+
+    def stats(self) -> Dict[str, str]:
+        with self._lock:
+            return {
+                f"{model} @ {base_url}": "json_schema" if supported else "json_object + local validation"
+                for (base_url, model), supported in sorted(self._supported.items())
+            }
+
+
+structured_support = StructuredOutputSupport()
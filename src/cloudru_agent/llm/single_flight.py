@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class FlightAbandoned(Exception):
+    """
+    Ведущий запрос отменён (CancelledError, KeyboardInterrupt): ожидающие
+    не получают его отмену, а отправляют запрос сами.
+    """
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых запросов «в полёте»: пока идёт запрос с ключом key,
+    остальные вызывающие с тем же ключом не отправляют свой, а ждут его результат
+    (или его ошибку). Работает между потоками и между asyncio-задачами, в том числе
+    разных event loop: результат передаётся через concurrent.futures.Future.
+
+    Реестр общий на процесс (single_flight ниже), поэтому склеиваются запросы
+    разных клиентов и оркестраторов — например, нескольких пользователей Streamlit,
+    генерирующих тесты по одной спецификации.
+
+    coalesced — сколько вызовов получили чужой результат, по методам.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.coalesced: Counter = Counter()
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException | None = None) -> None:
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            future.set_exception(FlightAbandoned())
+
+    def _shared(self, label: str) -> None:
+        with self._lock:
+            self.coalesced[label] += 1
+
+    def run(self, key: Hashable, fetch: Callable[[], Any], label: str = "") -> Tuple[Any, bool]:
+        """
+        (результат, получен ли он от чужого запроса). fetch выполняет только ведущий.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fetch()
+                except BaseException as e:
+                    self._finish(key, future, error=e)
+                    raise
+                self._finish(key, future, result)
+                return result, False
+            try:
+                result = future.result()
+            except FlightAbandoned:
+                continue
+            self._shared(label)
+            return result, True
+
+    async def arun(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], label: str = "") -> Tuple[Any, bool]:
+        """
+        То же для корутин. Отмена ожидающей задачи не отменяет ведущий запрос.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fetch()
+                except BaseException as e:
+                    self._finish(key, future, error=e)
+                    raise
+                self._finish(key, future, result)
+                return result, False
+            try:
+                # shield: иначе отмена ожидающего отменила бы общий Future
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except FlightAbandoned:
+                continue
+            self._shared(label)
+            return result, True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": sum(self.coalesced.values()),
+                "coalesced_by_method": dict(self.coalesced),
+                "in_flight": len(self._flights),
+            }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import importlib
+import importlib.util
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, Tuple, TypeVar
+
+if TYPE_CHECKING:
+    import httpx
+
+
+T = TypeVar("T")
+
+# Сколько держать простаивающее keep-alive соединение (между запусками в Streamlit)
+KEEPALIVE_EXPIRY_S = 120.0
+TIMEOUT_S = 600.0
+CONNECT_TIMEOUT_S = 10.0
+
+
+def _httpx() -> Any | None:
+    """
+    Модуль httpx, если он установлен. Импорт — при первом клиенте, а не при старте
+    (офлайн-вкладки Streamlit его не грузят); без httpx клиенты openai создают
+    HTTP-клиент сами, без общего пула.
+    """
+    try:
+        return importlib.import_module("httpx")
+    except ImportError:
+        return None
+
+
+def http2_enabled() -> bool:
+    """
+    HTTP/2 включается, если установлен пакет h2 (pip install "httpx[http2]")
+    и не задано EVOLUTION_HTTP2=0.
+    """
+    if os.getenv("EVOLUTION_HTTP2", "1") == "0":
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def pool_limits(max_connections: int) -> httpx.Limits:
+    """
+    Пул под лимит одновременных запросов: соединений не меньше, чем запросов
+    могут пустить ConcurrencyController-ы обеих моделей, все держим в keep-alive.
+    """
+    max_connections = max(1, max_connections)
+    return _httpx().Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=KEEPALIVE_EXPIRY_S,
+    )
+
+
+def _credential_id(api_key: str) -> str:
+    # сам ключ в реестре не храним
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class TransportRegistry:
+    """
+    Реестр HTTP-транспортов процесса: один пул соединений (keep-alive, HTTP/2)
+    на пару base_url + ключ API, общий для всех EvolutionClient / AsyncEvolutionClient
+    и всех AgentOrchestrator. Новый оркестратор на каждый клик в Streamlit
+    больше не открывает заново TLS-соединения.
+
+    Асинхронный пул привязан к event loop, поэтому хранится отдельно на каждый
+    loop (и умирает вместе с ним). Чтобы пул переживал запуски, асинхронные флоу
+    выполняются в общем фоновом loop процесса: run(coro) вместо asyncio.run(coro).
+
+    Без пакета httpx реестр пулов не держит (http_client / async_http_client — None).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sync: Dict[Tuple[str, str], httpx.Client] = {}
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], httpx.AsyncClient]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def http_client(self, base_url: str, api_key: str, max_connections: int) -> httpx.Client | None:
+        httpx = _httpx()
+        if httpx is None:
+            return None
+        key = (base_url.rstrip("/"), _credential_id(api_key))
+        with self._lock:
+            client = self._sync.get(key)
+            if client is None or client.is_closed:
+                client = httpx.Client(
+                    http2=http2_enabled(),
+                    limits=pool_limits(max_connections),
+                    timeout=httpx.Timeout(timeout=TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                    follow_redirects=True,
+                )
+                self._sync[key] = client
+            return client
+
+    def async_http_client(self, base_url: str, api_key: str, max_connections: int) -> httpx.AsyncClient | None:
+        """
+        Общий AsyncClient для текущего event loop. None, если loop не запущен:
+        клиент, созданный вне loop, может потом работать в любом — ему нужен свой пул.
+        """
+        httpx = _httpx()
+        if httpx is None:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+        key = (base_url.rstrip("/"), _credential_id(api_key))
+        with self._lock:
+            clients = self._async.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    http2=http2_enabled(),
+                    limits=pool_limits(max_connections),
+                    timeout=httpx.Timeout(timeout=TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                    follow_redirects=True,
+                )
+                clients[key] = client
+            return client
+
+    # --- общий фоновый event loop ---
+
+    def _shared_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="evolution-transport", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        Выполняет корутину в общем фоновом loop процесса и ждёт результат
+        (блокирует вызывающий поток, как asyncio.run).
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._shared_loop()).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sync_pools": len(self._sync),
+                "async_pools": sum(len(clients) for clients in self._async.values()),
+                "http2": http2_enabled(),
+                "shared_pools": importlib.util.find_spec("httpx") is not None,
+            }
+
+
+# Реестр процесса
+transports = TransportRegistry()
+
+
+def run_async(coro: Awaitable[T]) -> T:
+    """
+    asyncio.run для асинхронных флоу оркестратора, но в общем loop процесса,
+    где переиспользуются соединения из предыдущих запусков.
+    """
+    return transports.run(coro)
@@ -1,46 +1,191 @@
+import os
+from typing import Optional
+
 import typer
 from dotenv import load_dotenv
 from pathlib import Path
+from cloudru_agent.llm.transport import run_async
 from cloudru_agent.orchestrator.orchestrator import AgentOrchestrator
 
 app = typer.Typer(help="Cloud.ru Hack: test generation agent")
 load_dotenv()
 
+
+def _print_llm_stats(orchestrator: AgentOrchestrator) -> None:
+    """
+    Короткая сводка по обращениям к LLM после команды генерации.
+    """
+    typer.echo(orchestrator.ledger.format_summary())
+    json_repairs = orchestrator.ledger.json_repairs()
+    if json_repairs:
+        typer.echo(f"LLM JSON repaired: {json_repairs}")
+    if orchestrator.static_gate_stats:
+        typer.echo(f"Static pre-review gate: {dict(orchestrator.static_gate_stats)}")
+    if orchestrator.candidate_stats:
+        typer.echo(f"Code candidates selected locally: {dict(orchestrator.candidate_stats)}")
+    if orchestrator.refine_stats:
+        typer.echo(f"Refine by line edits: {dict(orchestrator.refine_stats)}")
+    if orchestrator.review_stats:
+        typer.echo(f"Review outcomes: {orchestrator.review_stats}")
+    if orchestrator.llm_in_use:
+        from cloudru_agent.llm.schemas import structured_support
+        from cloudru_agent.llm.single_flight import single_flight
+        from cloudru_agent.llm.transport import transports
+
+        typer.echo(f"LLM calls reused within run: {orchestrator.run_artifacts.summary()}")
+        if orchestrator.llm_cache is not None:
+            typer.echo(f"LLM cache: {orchestrator.llm_cache.stats()}")
+        if orchestrator.exemplar_index is not None:
+            typer.echo(f"Approved-test exemplars: {orchestrator.exemplar_index.stats()}")
+        typer.echo(f"LLM transport: {transports.stats()}")
+        if single_flight.coalesced:
+            typer.echo(f"LLM identical in-flight requests coalesced: {single_flight.stats()}")
+        if structured_support.stats():
+            typer.echo(f"LLM structured outputs: {structured_support.stats()}")
+        for model, stats in orchestrator.llm_concurrency.stats().items():
+            typer.echo(f"LLM concurrency [{model}]: {stats}")
+        if orchestrator.llm_output_budget is not None and orchestrator.llm_output_budget.capped:
+            typer.echo(f"LLM output budget (max_tokens from history): {orchestrator.llm_output_budget.stats()}")
+        if "allm" in orchestrator.__dict__ and orchestrator.llm_hedging is not None:
+            typer.echo(f"LLM hedged requests: {orchestrator.llm_hedging.stats()}")
+        if orchestrator.llm_routing.fallbacks:
+            typer.echo(f"LLM fallback model used (SLO exceeded): {orchestrator.llm_routing.fallbacks}")
+        if orchestrator.llm_quota is not None:
+            typer.echo(f"LLM shared quota: {orchestrator.llm_quota.stats()}")
+        if orchestrator.llm_cassette is not None:
+            typer.echo(f"LLM cassette: {orchestrator.llm_cassette.stats()}")
+
+    # EVOLUTION_LEDGER_PATH=ledger.csv (или .json) — выгрузить журнал вызовов
+    ledger_path = os.getenv("EVOLUTION_LEDGER_PATH")
+    if ledger_path:
+        orchestrator.ledger.export(ledger_path)
+        typer.echo(f"LLM ledger saved to {ledger_path}")
+
+    _check_cassette(orchestrator.llm_cassette if orchestrator.llm_in_use else None)
+
+
+def _check_cassette(cassette) -> None:
+    """
+    Запросы, которых не было в кассете, — прогон недостоверен: ошибка и код выхода 1.
+    """
+    if cassette is None or not cassette.misses:
+        return
+    methods = ", ".join(sorted(set(cassette.misses)))
+    typer.echo(
+        f"LLM cassette: {len(cassette.misses)} requests not found in {cassette.path} ({methods}); "
+        "re-record it with EVOLUTION_CASSETTE_MODE=record",
+        err=True,
+    )
+    raise typer.Exit(code=1)
+
+
 @app.command()
-def generate_ui_manual(requirements_path: str, output_dir: str = "generated/manual_ui"):
+def generate_ui_manual(
+    requirements_path: str,
+    output_dir: str = "generated/manual_ui",
+    concurrency: Optional[int] = None,
+    no_cache: bool = False,
+    batch_aaa: bool = False,
+):
     """
     Сгенерировать ручные тест-кейсы (Allure TestOps as Code)
     для UI из текстового файла с требованиями.
+    --batch-aaa — шаги AAA пакетами по блоку требований (EVOLUTION_BATCH_AAA=1).
     """
-    orchestrator = AgentOrchestrator()
-    orchestrator.generate_ui_manual_tests(requirements_path, output_dir)
+    orchestrator = AgentOrchestrator(
+        llm_concurrency=concurrency,
+        llm_cache_bypass=no_cache,
+        llm_batch_aaa=batch_aaa or None,
+    )
+    run_async(orchestrator.agenerate_ui_manual_tests(requirements_path, output_dir))
+    _print_llm_stats(orchestrator)
 
 
 @app.command()
-def generate_api_manual(openapi_path: str, output_dir: str = "generated/manual_api"):
+def generate_api_manual(
+    openapi_path: str,
+    output_dir: str = "generated/manual_api",
+    concurrency: Optional[int] = None,
+    no_cache: bool = False,
+    batch_aaa: bool = False,
+):
     """
     Сгенерировать ручные тест-кейсы по OpenAPI (VMs, Disks, Flavors).
+    --batch-aaa — шаги AAA пакетами по эндпоинтам (EVOLUTION_BATCH_AAA=1).
     """
-    orchestrator = AgentOrchestrator()
-    orchestrator.generate_api_manual_tests(openapi_path, output_dir)
+    orchestrator = AgentOrchestrator(
+        llm_concurrency=concurrency,
+        llm_cache_bypass=no_cache,
+        llm_batch_aaa=batch_aaa or None,
+    )
+    run_async(orchestrator.agenerate_api_manual_tests(openapi_path, output_dir))
+    _print_llm_stats(orchestrator)
 
 
 @app.command()
-def generate_ui_auto(requirements_path: str, output_dir: str = "generated/auto_ui"):
+def generate_ui_auto(
+    requirements_path: str,
+    output_dir: str = "generated/auto_ui",
+    concurrency: Optional[int] = None,
+    no_cache: bool = False,
+    fused: bool = False,
+    candidates: int = 1,
+    check_locators: bool = False,
+    static_gate: bool = True,
+    review_batch: bool = False,
+    refine_edits: bool = False,
+    exemplars: bool = False,
+):
     """
     Сгенерировать e2e UI автотесты (pytest) на основе требований.
+    --review-batch — ревизор-модель проверяет тесты пакетами; вместе с --no-static-gate:
+    со статической проверкой ревизору тесты не отправляются.
     """
-    orchestrator = AgentOrchestrator()
-    orchestrator.generate_ui_automation(requirements_path, output_dir)
+    orchestrator = AgentOrchestrator(
+        llm_concurrency=concurrency,
+        llm_cache_bypass=no_cache,
+        llm_fused=fused,
+        llm_candidates=candidates,
+        llm_check_locators=check_locators,
+        llm_static_gate=static_gate,
+        llm_review_batch=review_batch,
+        llm_refine_edits=refine_edits or None,
+        llm_exemplars=exemplars or None,
+    )
+    run_async(orchestrator.agenerate_ui_automation(requirements_path, output_dir))
+    _print_llm_stats(orchestrator)
 
 
 @app.command()
-def generate_api_auto(openapi_path: str, output_dir: str = "generated/auto_api"):
+def generate_api_auto(
+    openapi_path: str,
+    output_dir: str = "generated/auto_api",
+    concurrency: Optional[int] = None,
+    no_cache: bool = False,
+    fused: bool = False,
+    candidates: int = 1,
+    static_gate: bool = True,
+    review_batch: bool = False,
+    refine_edits: bool = False,
+    exemplars: bool = False,
+):
     """
     Сгенерировать API автотесты (pytest) на основе OpenAPI.
+    --review-batch — ревизор-модель проверяет тесты пакетами; вместе с --no-static-gate:
+    со статической проверкой ревизору тесты не отправляются.
     """
-    orchestrator = AgentOrchestrator()
-    orchestrator.generate_api_automation(openapi_path, output_dir)
+    orchestrator = AgentOrchestrator(
+        llm_concurrency=concurrency,
+        llm_cache_bypass=no_cache,
+        llm_fused=fused,
+        llm_candidates=candidates,
+        llm_static_gate=static_gate,
+        llm_review_batch=review_batch,
+        llm_refine_edits=refine_edits or None,
+        llm_exemplars=exemplars or None,
+    )
+    run_async(orchestrator.agenerate_api_automation(openapi_path, output_dir))
+    _print_llm_stats(orchestrator)
 
 
 @app.command()
@@ -50,19 +195,228 @@ def analyze_tests(tests_dir: str):
     """
     orchestrator = AgentOrchestrator()
     orchestrator.analyze_tests(tests_dir)
+    _print_llm_stats(orchestrator)
 
 @app.command()
 def generate_ui_from_text(
     text_path: str,
     output_dir: str = "generated/from_text",
+    concurrency: Optional[int] = None,
+    no_cache: bool = False,
+    fused: bool = False,
+    candidates: int = 1,
+    check_locators: bool = False,
+    static_gate: bool = True,
+    review_batch: bool = False,
+    refine_edits: bool = False,
+    exemplars: bool = False,
+    stream_requirements: bool = False,
+    batch_aaa: bool = False,
 ):
     """
     Прочитать текст требований из файла и через Evolution FM
     сгенерировать ручные тест-кейсы + автотесты.
+    --batch-aaa — шаги AAA ручных кейсов пакетами по блоку требований (EVOLUTION_BATCH_AAA=1).
+    --stream-requirements — генерация по требованию стартует, пока модель ещё
+    выписывает остальные требования (EVOLUTION_STREAM_REQUIREMENTS=1).
     """
-    orchestrator = AgentOrchestrator()
+    orchestrator = AgentOrchestrator(
+        llm_concurrency=concurrency,
+        llm_cache_bypass=no_cache,
+        llm_fused=fused,
+        llm_candidates=candidates,
+        llm_check_locators=check_locators,
+        llm_static_gate=static_gate,
+        llm_review_batch=review_batch,
+        llm_refine_edits=refine_edits or None,
+        llm_exemplars=exemplars or None,
+        llm_stream_requirements=stream_requirements or None,
+        llm_batch_aaa=batch_aaa or None,
+    )
     text = Path(text_path).read_text(encoding="utf-8")
-    orchestrator.generate_ui_from_text(text, output_dir)
+    run_async(orchestrator.agenerate_ui_from_text(text, output_dir))
+    _print_llm_stats(orchestrator)
+
+
+@app.command()
+def fake_server(
+    host: str = "127.0.0.1",
+    port: int = 8089,
+    latency_ms: float = 300.0,
+    latency_sigma: float = 0.5,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    capacity: Optional[int] = None,
+    quota_rpm: Optional[float] = None,
+    retry_after: float = 1.0,
+    review_fail_rate: float = 0.0,
+    bad_code_rate: float = 0.0,
+    malformed_rate: float = 0.0,
+    structured_outputs: bool = True,
+    ms_per_token: float = 0.0,
+    ramble_rate: float = 0.0,
+):
+    """
+    Запустить локальный OpenAI-совместимый сервер с заготовленными ответами
+    (для прогонов без квоты: EVOLUTION_BASE_URL=http://127.0.0.1:8089/v1).
+    """
+    from cloudru_agent.llm.fake_server import FakeEvolutionServer, FakeServerConfig
+
+    config = FakeServerConfig(
+        latency_ms=latency_ms,
+        latency_sigma=latency_sigma,
+        error_rate=error_rate,
+        rate_limit_rate=rate_limit_rate,
+        capacity=capacity,
+        quota_rpm=quota_rpm,
+        retry_after_s=retry_after,
+        review_fail_rate=review_fail_rate,
+        bad_code_rate=bad_code_rate,
+        malformed_rate=malformed_rate,
+        structured_outputs=structured_outputs,
+        ms_per_token=ms_per_token,
+        ramble_rate=ramble_rate,
+    )
+    server = FakeEvolutionServer(config, host=host, port=port)
+    typer.echo(f"Fake Evolution server: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        typer.echo(f"Served: {dict(server.stats)}")
+
+
+@app.command()
+def benchmark(
+    requirements: int = 20,
+    flows: str = "ui,api",
+    fake: bool = True,
+    latency_ms: float = 300.0,
+    latency_sigma: float = 0.5,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    capacity: Optional[int] = None,
+    bad_code_rate: float = 0.0,
+    malformed_rate: float = 0.0,
+    structured_outputs: bool = True,
+    ms_per_token: float = 0.0,
+    ramble_rate: float = 0.0,
+    concurrency: Optional[int] = None,
+    fused: bool = False,
+    candidates: int = 1,
+    hedge: bool = False,
+    review_fail_rate: float = 0.0,
+    static_gate: bool = True,
+    review_batch: bool = False,
+    refine_edits: bool = False,
+    exemplars: bool = False,
+    output_budget: bool = True,
+    exemplars_path: Optional[str] = None,
+    stream_requirements: bool = False,
+    batch_aaa: bool = False,
+    cassette: Optional[str] = None,
+    cassette_mode: str = "replay",
+    replay_latency: float = 0.0,
+    json_out: Optional[str] = None,
+):
+    """
+    Замер пайплайна на синтетических документах из N требований:
+    пропускная способность, p50/p95 по этапам, вызовы LLM на требование.
+    По умолчанию — против локального фейкового сервера (--no-fake — реальный эндпоинт).
+    --hedge — с хеджированием медленных запросов (EVOLUTION_HEDGE=1).
+    --no-structured-outputs — фейковый сервер отклоняет json_schema (как бэкенд без structured outputs).
+    --no-static-gate --review-batch — все тесты идут к ревизору-модели, пакетами.
+    --refine-edits — тесты исправляются правками строк (EVOLUTION_REFINE_EDITS=1);
+    с --ms-per-token фейковый сервер тратит время на каждый токен ответа, как настоящая модель,
+    а с --ramble-rate часть ответов затягивает на тысячи токенов;
+    --no-output-budget — без лимита max_tokens по истории длин ответов (EVOLUTION_OUTPUT_BUDGET=0).
+    --exemplars — одобренные ревью тесты прошлых прогонов идут в промпт образцами
+    (EVOLUTION_EXEMPLARS=1); индекс — в --exemplars-path, по умолчанию новый в каталоге замера.
+    --stream-requirements — UI-флоу генерирует тесты по требованиям из потока ответа,
+    не дожидаясь разбора всего текста (EVOLUTION_STREAM_REQUIREMENTS=1).
+    --batch-aaa — шаги AAA ручных кейсов пакетами (EVOLUTION_BATCH_AAA=1).
+    --cassette run.jsonl.gz --cassette-mode record — записать ответы модели;
+    --cassette run.jsonl.gz — воспроизвести их без сети (--replay-latency 1 — с записанными
+    задержками, 0 — со скоростью памяти): замер не-LLM частей пайплайна.
+    """
+    import json
+
+    from cloudru_agent.orchestrator.benchmark import format_results, run_benchmark
+
+    if cassette:
+        os.environ["EVOLUTION_CASSETTE"] = cassette
+        os.environ["EVOLUTION_CASSETTE_MODE"] = cassette_mode
+        os.environ["EVOLUTION_CASSETTE_LATENCY"] = str(replay_latency)
+    replaying = bool(cassette) and cassette_mode == "replay"
+
+    server = None
+    base_url = None
+    if fake and not replaying:
+        from cloudru_agent.llm.fake_server import FakeEvolutionServer, FakeServerConfig
+
+        server = FakeEvolutionServer(
+            FakeServerConfig(
+                latency_ms=latency_ms,
+                latency_sigma=latency_sigma,
+                error_rate=error_rate,
+                rate_limit_rate=rate_limit_rate,
+                capacity=capacity,
+                review_fail_rate=review_fail_rate,
+                bad_code_rate=bad_code_rate,
+                malformed_rate=malformed_rate,
+                structured_outputs=structured_outputs,
+                ms_per_token=ms_per_token,
+                ramble_rate=ramble_rate,
+            )
+        ).start()
+        base_url = server.url
+    if fake:
+        # фейковому серверу ключ и имена моделей не важны (кассета с фейкового сервера —
+        # с теми же именами моделей)
+        os.environ.setdefault("API_KEY", "fake")
+        os.environ.setdefault("EVOLUTION_GEN_MODEL", "fake-gen")
+        os.environ.setdefault("EVOLUTION_REVIEW_MODEL", "fake-review")
+
+    if hedge:
+        os.environ["EVOLUTION_HEDGE"] = "1"
+    if not output_budget:
+        os.environ["EVOLUTION_OUTPUT_BUDGET"] = "0"
+
+    try:
+        results = run_benchmark(
+            requirements=requirements,
+            flows=[f.strip() for f in flows.split(",") if f.strip()],
+            base_url=base_url,
+            llm_concurrency=concurrency,
+            llm_fused=fused,
+            llm_candidates=candidates,
+            llm_static_gate=static_gate,
+            llm_review_batch=review_batch,
+            llm_refine_edits=refine_edits or None,
+            llm_exemplars=exemplars or None,
+            exemplars_path=exemplars_path,
+            llm_stream_requirements=stream_requirements or None,
+            llm_batch_aaa=batch_aaa or None,
+        )
+    finally:
+        if server is not None:
+            server.stop()
+
+    typer.echo(format_results(results))
+    if server is not None:
+        typer.echo(f"Fake server: {dict(server.stats)}")
+    if json_out:
+        Path(json_out).write_text(
+            json.dumps([r.to_dict() for r in results], ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+    if cassette:
+        from cloudru_agent.llm.cassette import cassette_from_env
+
+        run_cassette = cassette_from_env()
+        typer.echo(f"LLM cassette: {run_cassette.stats()}")
+        _check_cassette(run_cassette)
 
 
 if __name__ == "__main__":
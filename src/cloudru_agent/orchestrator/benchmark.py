@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import tempfile
+import time
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List
+
+from cloudru_agent.llm.completion_cache import CompletionCache
+from cloudru_agent.llm.exemplars import ExemplarIndex
+from cloudru_agent.llm.ledger import CallLedger, LedgerEntry, percentile
+from cloudru_agent.llm.transport import run_async
+from cloudru_agent.orchestrator.orchestrator import AgentOrchestrator
+
+
+# этап пайплайна -> методы клиента
+STAGES: Dict[str, tuple] = {
+    "parse": ("ui_requirements_from_text",),
+    "aaa": ("ui_aaa_for_requirement", "ui_aaa_batch", "api_aaa_steps", "api_aaa_batch"),
+    "code": ("ui_playwright_steps", "ui_steps_and_code", "api_requests_code", "api_steps_and_code"),
+    "review": ("review_ui_test", "review_api_test", "review_ui_batch", "review_api_batch"),
+    "refine": (
+        "refine_ui_test_with_feedback",
+        "refine_api_test_with_feedback",
+        "refine_ui_test_edits",
+        "refine_api_test_edits",
+    ),
+}
+
+_SECTIONS = ("vms", "disks", "flavors")
+
+# артефакты шагов AAA (поштучные и из пакетов) в RunArtifacts
+_AAA_ARTIFACTS = ("ui_aaa_for_requirement", "api_aaa_steps")
+
+# ответы «от модели»: запросы к эндпоинту и ответы из кассеты при воспроизведении
+_SERVED = ("api", "replay")
+
+
+def synthetic_ui_text(requirements: int, per_block: int = 5) -> str:
+    """
+    Текст UI-требований в формате examples/ui_calc_requirements_text.md:
+    блоки «Блок N. ...» по per_block пунктов.
+    """
+    blocks = []
+    for start in range(0, requirements, per_block):
+        block_no = start // per_block + 1
+        items = "\n".join(
+            f"- Элемент {i + 1} на экране {block_no} отображается и реагирует на клик."
+            for i in range(start, min(start + per_block, requirements))
+        )
+        blocks.append(f"Блок {block_no}. Экран {block_no}\n\n{items}")
+    return "\n\n".join(blocks)
+
+
+def synthetic_openapi(requirements: int) -> str:
+    """
+    OpenAPI (YAML) с requirements операциями GET по секциям VMs / Disks / Flavors.
+    """
+    lines = [
+        "openapi: 3.0.0",
+        "info: {title: Synthetic Compute API, version: '1'}",
+        "servers: [{url: 'https://compute.api.cloud.ru'}]",
+        "paths:",
+    ]
+    for i in range(requirements):
+        section = _SECTIONS[i % len(_SECTIONS)]
+        lines += [
+            f"  /v3/{section}/item{i}:",
+            "    get:",
+            f"      operationId: get_{section}_item{i}",
+            f"      summary: Получить объект {i} из {section}",
+            "      responses: {'200': {description: OK}, '404': {description: Not found}}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class StageStats:
+    calls: int
+    latency_p50_s: float
+    latency_p95_s: float
+    span_s: float
+
+
+@dataclass
+class BenchmarkResult:
+    flow: str
+    requirements: int
+    wall_s: float
+    throughput_rps: float
+    calls: int
+    calls_per_requirement: float
+    errors: int
+    retries: int
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    hedging: Dict[str, Any] | None = None
+    candidates: Dict[str, int] | None = None
+    schema: Dict[str, int] | None = None
+    refine: Dict[str, int] | None = None
+    output_budget: Dict[str, Any] | None = None
+    review: Dict[str, float] | None = None
+    exemplars: Dict[str, Any] | None = None
+    quota: Dict[str, Dict[str, Any]] | None = None
+    # шагов AAA запрошено у LLM на требование: без ошибок — ровно 1 (None — AAA не запрашивались)
+    aaa_per_requirement: float | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def stage_stats(entries: Iterable[LedgerEntry]) -> Dict[str, StageStats]:
+    """
+    p50/p95 задержки вызовов по этапам и «окно» этапа: от начала первого
+    до конца последнего вызова (этапы в асинхронном флоу перекрываются).
+    """
+    stage_of = {method: stage for stage, methods in STAGES.items() for method in methods}
+    grouped: Dict[str, List[LedgerEntry]] = {}
+    for entry in entries:
+        if entry.source in _SERVED and entry.error is None:
+            grouped.setdefault(stage_of.get(entry.method, "other"), []).append(entry)
+
+    stats = {}
+    for stage in list(STAGES) + ["other"]:
+        items = grouped.get(stage)
+        if not items:
+            continue
+        latencies = [e.latency_s for e in items]
+        started = min(e.timestamp - e.latency_s - e.wait_s for e in items)
+        finished = max(e.timestamp for e in items)
+        stats[stage] = StageStats(
+            calls=len(items),
+            latency_p50_s=round(percentile(latencies, 50), 3),
+            latency_p95_s=round(percentile(latencies, 95), 3),
+            span_s=round(finished - started, 3),
+        )
+    return stats
+
+
+def schema_stats(entries: Iterable[LedgerEntry]) -> Dict[str, int] | None:
+    """
+    Ответы не по схеме, повторы из-за них и запросы, где бэкенд отклонил json_schema.
+    """
+    stats = {"mismatch": 0, "retries": 0, "rejected": 0}
+    for entry in entries:
+        stats["mismatch"] += entry.json_status == "mismatch"
+        stats["retries"] += entry.schema_retry and entry.source in _SERVED
+        stats["rejected"] += entry.error in ("BadRequestError", "UnprocessableEntityError")
+    return stats if any(stats.values()) else None
+
+
+def refine_stats(entries: Iterable[LedgerEntry], edits: Dict[str, int]) -> Dict[str, int] | None:
+    """
+    Запросы исправления тестов и токены их ответов; edits — итог правок строк
+    (patched / fallback), если они включены.
+    """
+    refine = [e for e in entries if e.method in STAGES["refine"] and e.source in _SERVED]
+    if not refine:
+        return None
+    return {
+        "calls": len(refine),
+        "completion_tokens": sum(e.completion_tokens for e in refine),
+        **edits,
+    }
+
+
+def run_benchmark(
+    requirements: int = 20,
+    flows: Iterable[str] = ("ui", "api"),
+    base_url: str | None = None,
+    exemplars_path: str | None = None,
+    **orchestrator_kwargs,
+) -> List[BenchmarkResult]:
+    """
+    Прогоняет асинхронные UI- и/или API-флоу оркестратора на синтетических документах
+    из requirements требований. Кэш ответов на каждый флоу свой, пустой, во временной
+    папке: меряем эндпоинт, а не диск, и не засоряем рабочий кэш ответами стенда.
+    Индекс одобренных тестов — тоже во временной папке, если не задан exemplars_path
+    (общий индекс между замерами показывает, как образцы снижают долю исправлений).
+    """
+    results = []
+    for flow in flows:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{flow}_") as out:
+            ledger = CallLedger()
+            orchestrator = AgentOrchestrator(ledger=ledger, llm_base_url=base_url, **orchestrator_kwargs)
+            orchestrator.llm_cache = CompletionCache(path=Path(out) / "completions.sqlite")
+            orchestrator.exemplar_index = ExemplarIndex(path=exemplars_path or Path(out) / "exemplars.sqlite")
+
+            started = time.perf_counter()
+            if flow == "ui":
+                run_async(orchestrator.agenerate_ui_from_text(synthetic_ui_text(requirements), out))
+            elif flow == "api":
+                run_async(orchestrator.agenerate_api_from_openapi_text(synthetic_openapi(requirements), out))
+            else:
+                raise ValueError(f"Unknown flow: {flow!r} (expected 'ui' or 'api')")
+            wall = time.perf_counter() - started
+
+        entries = ledger.entries
+        calls = sum(1 for e in entries if e.source in _SERVED)
+        results.append(
+            BenchmarkResult(
+                flow=flow,
+                requirements=requirements,
+                wall_s=round(wall, 3),
+                throughput_rps=round(requirements / wall, 3) if wall else 0.0,
+                calls=calls,
+                calls_per_requirement=round(calls / requirements, 2) if requirements else 0.0,
+                errors=sum(1 for e in entries if e.error),
+                retries=sum(e.retries for e in entries),
+                stages=stage_stats(entries),
+                hedging=orchestrator.llm_hedging.stats() if orchestrator.llm_hedging is not None else None,
+                candidates=dict(orchestrator.candidate_stats) or None,
+                schema=schema_stats(entries),
+                refine=refine_stats(entries, dict(orchestrator.refine_stats)),
+                output_budget=(
+                    orchestrator.llm_output_budget.stats() if orchestrator.llm_output_budget is not None else None
+                ),
+                review=orchestrator.review_stats or None,
+                exemplars=orchestrator.exemplar_index.stats() if orchestrator.llm_exemplars else None,
+                quota=orchestrator.llm_quota.stats() if orchestrator.llm_quota is not None else None,
+                aaa_per_requirement=aaa_per_requirement(orchestrator, requirements),
+            )
+        )
+    return results
+
+
+def aaa_per_requirement(orchestrator: AgentOrchestrator, requirements: int) -> float | None:
+    requested = sum(orchestrator.run_artifacts.requested[kind] for kind in _AAA_ARTIFACTS)
+    if not requested or not requirements:
+        return None
+    return round(requested / requirements, 2)
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    lines = []
+    for r in results:
+        lines.append(
+            f"[{r.flow}] {r.requirements} требований за {r.wall_s} с: "
+            f"{r.throughput_rps} треб./с, {r.calls} вызовов LLM "
+            f"({r.calls_per_requirement} на требование), ошибок {r.errors}, ретраев {r.retries}"
+        )
+        if r.hedging:
+            lines.append(f"    hedging {r.hedging}")
+        if r.candidates:
+            lines.append(f"    candidates {r.candidates}")
+        if r.schema:
+            lines.append(f"    schema {r.schema}")
+        if r.refine:
+            lines.append(f"    refine {r.refine}")
+        if r.output_budget:
+            lines.append(f"    output_budget {r.output_budget}")
+        if r.review:
+            lines.append(f"    review {r.review}")
+        if r.exemplars:
+            lines.append(f"    exemplars {r.exemplars}")
+        if r.quota:
+            lines.append(f"    quota {r.quota}")
+        if r.aaa_per_requirement is not None:
+            lines.append(f"    aaa_per_requirement {r.aaa_per_requirement}")
+        for stage, s in r.stages.items():
+            lines.append(
+                f"    {stage:<7} calls={s.calls:<5} p50={s.latency_p50_s:<7} "
+                f"p95={s.latency_p95_s:<7} span={s.span_s}"
+            )
+    return "\n".join(lines)
@@ -1,42 +1,302 @@
+from __future__ import annotations
+
+from functools import cached_property
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List
+from collections import Counter
+import asyncio
 import json
+import os
 
-from cloudru_agent.llm.evolution_client import EvolutionClient
-from cloudru_agent.parsers.ui_requirements_parser import UiRequirementsParser
-from cloudru_agent.parsers.openapi_parser import OpenApiParser
-from cloudru_agent.generators.allure_manual_generator import AllureManualGenerator
-from cloudru_agent.generators.ui_pytest_generator import UiPytestGenerator
-from cloudru_agent.generators.api_pytest_generator import ApiPytestGenerator
+from cloudru_agent.llm.concurrency import ConcurrencyController
+from cloudru_agent.llm.ledger import CallLedger
+from cloudru_agent.models.requirements import UiRequirement, UiRequirementsDocument
+from cloudru_agent.orchestrator.run_artifacts import RunArtifacts, RunScopedLlm, AsyncRunScopedLlm, strip_review_header
 from cloudru_agent.analyzers.coverage_analyzer import CoverageAnalyzer
 from cloudru_agent.analyzers.standards_checker import StandardsChecker
+from cloudru_agent.analyzers.static_review import StaticReviewGate
+
+if TYPE_CHECKING:
+    from cloudru_agent.llm.cassette import Cassette
+    from cloudru_agent.llm.completion_cache import CompletionCache
+    from cloudru_agent.llm.exemplars import ExemplarIndex
+    from cloudru_agent.llm.hedging import HedgePolicy
+    from cloudru_agent.llm.output_budget import OutputBudget
+    from cloudru_agent.llm.quota import SharedQuota
+    from cloudru_agent.llm.routing import RoutingTable
+    from cloudru_agent.parsers.ui_requirements_parser import UiRequirementsParser
+    from cloudru_agent.parsers.openapi_parser import OpenApiParser
+    from cloudru_agent.generators.allure_manual_generator import AllureManualGenerator
+    from cloudru_agent.generators.ui_pytest_generator import UiPytestGenerator
+    from cloudru_agent.generators.api_pytest_generator import ApiPytestGenerator
 
 
 class AgentOrchestrator:
     """
     Главный координатор: решает, какие модули вызывать и в каком порядке.
     Поддерживает любой UI-продукт через ui_base_url и ui_feature_name.
+
+    Методы с префиксом a* — асинхронные варианты флоу: запросы к модели
+    по всем требованиям идут параллельно: llm_concurrency — стартовый лимит
+    одновременных запросов на модель, дальше он подстраивается под ответы эндпоинта.
+
+    Клиенты LLM, парсеры и генераторы создаются при первом обращении:
+    офлайн-команды (analyze_tests) не загружают openai и не требуют API_KEY.
     """
 
     def __init__(
         self,
         ui_base_url: str = "https://cloud.ru/calculator",
         ui_feature_name: str = "UI продукта",
+        llm_concurrency: int | None = None,
+        llm_cache_bypass: bool = False,
+        llm_batch_aaa: bool | None = None,
+        llm_fused: bool = False,
+        ledger: CallLedger | None = None,
+        llm_static_gate: bool = True,
+        llm_base_url: str | None = None,
+        llm_candidates: int = 1,
+        llm_check_locators: bool = False,
+        llm_review_batch: bool = False,
+        llm_refine_edits: bool | None = None,
+        llm_exemplars: bool | None = None,
+        llm_stream_requirements: bool | None = None,
     ) -> None:
-        # общие компоненты
-        self.ui_parser = UiRequirementsParser()
-        self.openapi_parser = OpenApiParser()
-        self.manual_generator = AllureManualGenerator()
-        self.api_auto_generator = ApiPytestGenerator()
+        # офлайн-анализ
         self.coverage_analyzer = CoverageAnalyzer()
         self.standards_checker = StandardsChecker()
-        self.llm = EvolutionClient()
+        # журнал вызовов LLM (токены, задержки, ретраи), общий для обоих клиентов
+        self.ledger = ledger if ledger is not None else CallLedger()
+        # адаптивные лимиты одновременных запросов по моделям, общие для обоих клиентов
+        self.llm_concurrency = ConcurrencyController.from_env(initial=llm_concurrency)
+        # артефакты текущего прогона (шаги, код, вердикты) общие для всех этапов:
+        # повторный запрос того же артефакта не идёт в LLM
+        self.run_artifacts = RunArtifacts()
+
+        self.llm_cache_bypass = llm_cache_bypass
+        # None — EVOLUTION_BASE_URL или эндпоинт Evolution по умолчанию
+        self.llm_base_url = llm_base_url
+        # статическая проверка автотестов перед ревизором-моделью:
+        # с находками тест сразу идёт в refine, чистый (при llm_static_gate) — без ревью
+        self.llm_static_gate = llm_static_gate
+        self.static_gate_stats: Counter = Counter()
+        # шаги AAA ручных кейсов пакетами по блоку требований, а не запросом на требование
+        # (None — EVOLUTION_BATCH_AAA=1, по умолчанию поштучно)
+        if llm_batch_aaa is None:
+            llm_batch_aaa = os.getenv("EVOLUTION_BATCH_AAA", "").lower() in ("1", "true", "yes", "on")
+        self.llm_batch_aaa = llm_batch_aaa
+        # ревизор-модель получает тесты пакетами (под свой большой контекст), а не по одному.
+        # В пакет идут только тесты без вердикта статической проверки: при llm_static_gate
+        # (по умолчанию) таких нет — с находками тест сразу идёт в refine, чистый принимается
+        # без ревью, — так что пакетное ревью работает вместе с llm_static_gate=False
+        self.llm_review_batch = llm_review_batch
+        # исправление теста правками строк вместо переписывания целиком (None — EVOLUTION_REFINE_EDITS)
+        self.llm_refine_edits = llm_refine_edits
+        # одобренные ревью тесты прошлых прогонов — образцы в промптах генерации кода
+        # (None — EVOLUTION_EXEMPLARS=1); индекс пополняется и без этого флага
+        if llm_exemplars is None:
+            llm_exemplars = os.getenv("EVOLUTION_EXEMPLARS", "").lower() in ("1", "true", "yes", "on")
+        self.llm_exemplars = llm_exemplars
+        # требования из текста потоком: генерация по требованию стартует, пока модель
+        # ещё выписывает остальные (None — EVOLUTION_STREAM_REQUIREMENTS=1), только async-флоу
+        if llm_stream_requirements is None:
+            llm_stream_requirements = os.getenv("EVOLUTION_STREAM_REQUIREMENTS", "").lower() in (
+                "1", "true", "yes", "on",
+            )
+        self.llm_stream_requirements = llm_stream_requirements
+        # итог ревью по тестам: approved — принят, refined — отправлен на исправление
+        self.review_outcomes: Counter = Counter()
 
         # параметры UI-продукта
         self.ui_base_url = ui_base_url
         self.ui_feature_name = ui_feature_name
 
+        # совмещённая генерация: текст AAA и код одним запросом на требование,
+        # результат идёт и в ручные кейсы, и в автотесты
+        self.llm_fused = llm_fused
+
+        # сколько вариантов кода автотеста запрашивать на требование; лучший выбирается
+        # локально (статика, для UI с llm_check_locators — ещё и локаторы в браузере)
+        self.llm_candidates = llm_candidates
+        self.llm_check_locators = llm_check_locators
+
+    # --- компоненты, создаваемые по требованию ---
+
+    @cached_property
+    def llm_cache(self) -> CompletionCache | None:
+        # один дисковый кэш ответов на оба клиента
+        from cloudru_agent.llm.completion_cache import CompletionCache
+
+        return CompletionCache.from_env()
+
+    @cached_property
+    def llm_routing(self) -> RoutingTable:
+        # таблица маршрутизации по методам, общая для обоих клиентов
+        from cloudru_agent.llm.routing import RoutingTable
+
+        return RoutingTable.from_env()
+
+    @cached_property
+    def llm_hedging(self) -> HedgePolicy | None:
+        # дубли медленных запросов (EVOLUTION_HEDGE=1), только в асинхронных флоу
+        from cloudru_agent.llm.hedging import HedgePolicy
+
+        return HedgePolicy.from_env()
+
+    @cached_property
+    def exemplar_index(self) -> ExemplarIndex | None:
+        # тесты, одобренные ревью, из всех прогонов (EVOLUTION_EXEMPLARS=0 — не вести)
+        from cloudru_agent.llm.exemplars import ExemplarIndex
+
+        return ExemplarIndex.from_env()
+
+    @cached_property
+    def llm_output_budget(self) -> OutputBudget | None:
+        # max_tokens по истории длин ответов методов, общая для обоих клиентов
+        from cloudru_agent.llm.output_budget import OutputBudget
+
+        return OutputBudget.from_env()
+
+    @cached_property
+    def llm_quota(self) -> SharedQuota | None:
+        # квота эндпоинта, общая для процессов на машине (EVOLUTION_QUOTA_*)
+        from cloudru_agent.llm.quota import SharedQuota
+
+        return SharedQuota.from_env()
+
+    @cached_property
+    def llm_cassette(self) -> Cassette | None:
+        # запись / воспроизведение ответов модели (EVOLUTION_CASSETTE), одна на процесс
+        from cloudru_agent.llm.cassette import cassette_from_env
+
+        return cassette_from_env()
+
+    @cached_property
+    def llm(self) -> RunScopedLlm:
+        from cloudru_agent.llm.evolution_client import EvolutionClient
+
+        return RunScopedLlm(
+            EvolutionClient(
+                cache=self.llm_cache,
+                cache_bypass=self.llm_cache_bypass,
+                ledger=self.ledger,
+                concurrency=self.llm_concurrency,
+                routing=self.llm_routing,
+                base_url=self.llm_base_url,
+                refine_edits=self.llm_refine_edits,
+                output_budget=self.llm_output_budget,
+                cassette=self.llm_cassette,
+                quota=self.llm_quota,
+                exemplars=self.exemplar_index if self.llm_exemplars else None,
+            ),
+            self.run_artifacts,
+        )
+
+    @cached_property
+    def allm(self) -> AsyncRunScopedLlm:
+        from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
+
+        return AsyncRunScopedLlm(
+            AsyncEvolutionClient(
+                cache=self.llm_cache,
+                cache_bypass=self.llm_cache_bypass,
+                ledger=self.ledger,
+                concurrency=self.llm_concurrency,
+                routing=self.llm_routing,
+                base_url=self.llm_base_url,
+                hedging=self.llm_hedging,
+                refine_edits=self.llm_refine_edits,
+                output_budget=self.llm_output_budget,
+                cassette=self.llm_cassette,
+                quota=self.llm_quota,
+                exemplars=self.exemplar_index if self.llm_exemplars else None,
+            ),
+            self.run_artifacts,
+        )
+
+    @property
+    def llm_in_use(self) -> bool:
+        """
+        Создавался ли хотя бы один клиент LLM.
+        """
+        return "llm" in self.__dict__ or "allm" in self.__dict__
+
+    @cached_property
+    def ui_parser(self) -> UiRequirementsParser:
+        from cloudru_agent.parsers.ui_requirements_parser import UiRequirementsParser
+
+        return UiRequirementsParser()
+
+    @cached_property
+    def openapi_parser(self) -> OpenApiParser:
+        from cloudru_agent.parsers.openapi_parser import OpenApiParser
+
+        return OpenApiParser()
+
+    @cached_property
+    def manual_generator(self) -> AllureManualGenerator:
+        from cloudru_agent.generators.allure_manual_generator import AllureManualGenerator
+
+        return AllureManualGenerator(batch_aaa=self.llm_batch_aaa)
+
+    @cached_property
+    def api_auto_generator(self) -> ApiPytestGenerator:
+        from cloudru_agent.generators.api_pytest_generator import ApiPytestGenerator
+
+        return ApiPytestGenerator(fused=self.llm_fused, candidates=self.llm_candidates)
+
+    @cached_property
+    def ui_auto_generator(self) -> UiPytestGenerator:
         # генератор UI-автотестов знает BASE_URL
-        self.ui_auto_generator = UiPytestGenerator(base_url=ui_base_url)
+        from cloudru_agent.generators.ui_pytest_generator import UiPytestGenerator
+
+        locator_checker = None
+        if self.llm_candidates > 1 and self.llm_check_locators:
+            from cloudru_agent.analyzers.ui_locators_checker import UiLocatorsChecker
+
+            locator_checker = UiLocatorsChecker(base_url=self.ui_base_url)
+
+        return UiPytestGenerator(
+            base_url=self.ui_base_url,
+            fused=self.llm_fused,
+            static_gate=self.llm_static_gate,
+            candidates=self.llm_candidates,
+            locator_checker=locator_checker,
+            review_batch=self.llm_review_batch,
+        )
+
+    @property
+    def candidate_stats(self) -> Counter:
+        """
+        Выбор из нескольких вариантов кода (см. CandidateSelector.stats) по обоим генераторам.
+        """
+        stats: Counter = Counter()
+        for name in ("ui_auto_generator", "api_auto_generator"):
+            if name in self.__dict__:
+                stats.update(self.__dict__[name].selector.stats)
+        return stats
+
+    @property
+    def review_stats(self) -> Dict[str, float]:
+        """
+        Сколько тестов ревью приняло и сколько отправило на исправление, и доля исправлений.
+        """
+        reviewed = self.review_outcomes["approved"] + self.review_outcomes["refined"]
+        if not reviewed:
+            return {}
+        return {**self.review_outcomes, "refine_rate": round(self.review_outcomes["refined"] / reviewed, 3)}
+
+    @property
+    def refine_stats(self) -> Counter:
+        """
+        Исправления правками строк по обоим клиентам: patched — правки применились,
+        fallback — тест пришлось переписать целиком.
+        """
+        stats: Counter = Counter()
+        for name in ("llm", "allm"):
+            if name in self.__dict__:
+                stats.update(self.__dict__[name].refine_stats)
+        return stats
 
     # =====================================================================
     # UI
@@ -50,6 +310,7 @@ class AgentOrchestrator:
         - подставить его в модель вместо «Cloud.ru Price Calculator»;
         - сохранить в UiRequirementsDocument.feature (для генераторов и ревизора).
         """
+        self.run_artifacts.reset()
         requirements_doc = self.ui_parser.parse_text_with_llm(
             text,
             self.llm,
@@ -62,11 +323,16 @@ class AgentOrchestrator:
         manual_dir.mkdir(parents=True, exist_ok=True)
         auto_dir.mkdir(parents=True, exist_ok=True)
 
+        prepared = None
+        if self.llm_fused:
+            prepared = self._prepare_fused(requirements_doc, self.llm.ui_steps_and_code)
+
         # 1) Генерация ручных кейсов
         self.manual_generator.generate_ui_tests(
             requirements_doc,
             str(manual_dir),
             llm=self.llm,
+            prepared=prepared,
         )
 
         # 2) Генерация первых версий автотестов (pytest + Playwright)
@@ -74,11 +340,134 @@ class AgentOrchestrator:
             requirements_doc,
             str(auto_dir),
             llm=self.llm,
+            prepared=prepared,
         )
 
         # 3) Проход ревизора + авто-фиксер поверх сгенерированных автотестов
         self._review_and_refine_ui_autotests(requirements_doc, auto_dir)
 
+    async def agenerate_ui_from_text(self, text: str, output_dir: str) -> None:
+        """
+        Асинхронный вариант generate_ui_from_text.
+        Ручные кейсы и автотесты генерируются одновременно; с llm_stream_requirements —
+        ещё и одновременно с разбором текста (см. _astream_ui_from_text).
+        """
+        self.run_artifacts.reset()
+        manual_dir = Path(output_dir) / "manual_ui"
+        auto_dir = Path(output_dir) / "auto_ui"
+
+        manual_dir.mkdir(parents=True, exist_ok=True)
+        auto_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.llm_stream_requirements:
+            requirements_doc = await self._astream_ui_from_text(text, manual_dir, auto_dir)
+            await self._areview_and_refine_ui_autotests(requirements_doc, auto_dir)
+            return
+
+        requirements_doc = await self.ui_parser.aparse_text_with_llm(
+            text,
+            self.allm,
+            feature=self.ui_feature_name,
+        )
+
+        prepared = None
+        if self.llm_fused:
+            prepared = await self._aprepare_fused(requirements_doc, self.allm.ui_steps_and_code)
+
+        await asyncio.gather(
+            self.manual_generator.agenerate_ui_tests(
+                requirements_doc, str(manual_dir), llm=self.allm, prepared=prepared
+            ),
+            self.ui_auto_generator.agenerate(
+                requirements_doc, str(auto_dir), llm=self.allm, prepared=prepared
+            ),
+        )
+
+        await self._areview_and_refine_ui_autotests(requirements_doc, auto_dir)
+
+    async def _astream_ui_from_text(self, text: str, manual_dir: Path, auto_dir: Path) -> UiRequirementsDocument:
+        """
+        Генерация по требованиям по мере их разбора: автотест требования запрашивается,
+        как только требование пришло из потока. Пакетные запросы ждут конца своего блока:
+        AAA (llm_batch_aaa) и автотесты с проверкой локаторов в браузере (один браузер на пакет)
+        уходят по блоку требований, не больше max_batch_size.
+        Возвращает документ со всеми требованиями — для ревью.
+        """
+        feature = self.ui_feature_name
+        batch_manual = self.llm_batch_aaa
+        batch_auto = self.llm_candidates > 1 and self.llm_check_locators
+        max_batch = self.manual_generator.max_batch_size
+        requirements: List[UiRequirement] = []
+        tasks: List[asyncio.Task] = []
+
+        def doc(reqs: List[UiRequirement]) -> UiRequirementsDocument:
+            return UiRequirementsDocument(feature=feature, requirements=reqs)
+
+        def generate(reqs: List[UiRequirement], manual: bool, auto: bool) -> None:
+            if manual:
+                tasks.append(asyncio.ensure_future(
+                    self.manual_generator.agenerate_ui_tests(doc(reqs), str(manual_dir), llm=self.allm)
+                ))
+            if auto:
+                tasks.append(asyncio.ensure_future(
+                    self.ui_auto_generator.agenerate(doc(reqs), str(auto_dir), llm=self.allm)
+                ))
+
+        async def fused(req: UiRequirement) -> None:
+            prepared = await self._aprepare_fused(doc([req]), self.allm.ui_steps_and_code)
+            await asyncio.gather(
+                self.manual_generator.agenerate_ui_tests(doc([req]), str(manual_dir), llm=self.allm, prepared=prepared),
+                self.ui_auto_generator.agenerate(doc([req]), str(auto_dir), llm=self.allm, prepared=prepared),
+            )
+
+        block: List[UiRequirement] = []
+        try:
+            async for req in self.ui_parser.astream_text_with_llm(text, self.allm, feature=feature):
+                requirements.append(req)
+                if self.llm_fused:
+                    tasks.append(asyncio.ensure_future(fused(req)))
+                    continue
+                if block and (block[-1].block != req.block or len(block) >= max_batch):
+                    generate(block, batch_manual, batch_auto)
+                    block = []
+                block.append(req)
+                generate([req], not batch_manual, not batch_auto)
+            if block:
+                generate(block, batch_manual, batch_auto)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        return doc(requirements)
+
+    @staticmethod
+    def _prepare_fused(requirements_doc, fused_fn) -> dict:
+        """
+        Совмещённая генерация (ui_steps_and_code / api_steps_and_code) по всем требованиям.
+        Требования, для которых запрос упал, генераторы догенерируют сами.
+        """
+        prepared = {}
+        for req in requirements_doc.requirements:
+            try:
+                prepared[req.id] = fused_fn(requirements_doc.feature, req)
+            except Exception:
+                continue
+        return prepared
+
+    @staticmethod
+    async def _aprepare_fused(requirements_doc, fused_fn) -> dict:
+        results = await asyncio.gather(
+            *(fused_fn(requirements_doc.feature, req) for req in requirements_doc.requirements),
+            return_exceptions=True,
+        )
+        return {
+            req.id: result
+            for req, result in zip(requirements_doc.requirements, results)
+            if isinstance(result, dict)
+        }
+
     def _review_and_refine_ui_autotests(self, requirements_doc, auto_dir: Path) -> None:
         """
         Прогоняет сгенерированные UI-автотесты через ревизора и авто-фиксер.
@@ -90,27 +479,15 @@ class AgentOrchestrator:
             req.id = "REQ_MAIN_PAGE_DISPLAY"
             -> файл: test_ui_req_main_page_display.py
         """
-        for req in requirements_doc.requirements:
-            file_name = f"test_ui_{req.id.lower()}.py"
-            test_path = auto_dir / file_name
-
-            if not test_path.exists():
-                continue
-
-            raw_code = test_path.read_text(encoding="utf-8")
-
-            has_fixme = "FIXME" in raw_code or "pass  # FIXME" in raw_code
-
-            if has_fixme:
-                # если есть заглушки - считаем тест заведомо плохим, не спрашивая ревизора
-                review = {
-                    "ok": False,
-                    "problems": [
-                        "В тесте остались заглушки FIXME / pass — автогенерация не смогла построить шаги Act/Assert, тест неполный."
-                    ],
-                }
-            else:
-                # обычный путь: спрашиваем ревизора-модель
+        tests = self._read_autotests(requirements_doc, auto_dir, "test_ui_")
+        reviews = self._static_reviews(tests, "ui")
+        if self.llm_review_batch:
+            reviews.update(self._batch_reviews(tests, reviews, self.llm.review_ui_batch))
+
+        for req, test_path, raw_code in tests:
+            review = reviews.get(req.id)
+            if review is None:
+                # статика чистая, но гейт выключен (а пакетное ревью вердикта не дало): спрашиваем ревизора-модель
                 try:
                     review = self.llm.review_ui_test(req.title, raw_code)
                 except Exception:
@@ -118,8 +495,10 @@ class AgentOrchestrator:
                     continue
 
             if review.get("ok", True):
-                # ревизор (или наша проверка) считает тест нормальным
+                # ревизор (или статическая проверка) считает тест нормальным
+                self._approve(req, raw_code, "ui")
                 continue
+            self.review_outcomes["refined"] += 1
 
             # авто-фикс поверх проблемного теста
             try:
@@ -132,34 +511,168 @@ class AgentOrchestrator:
             except Exception:
                 continue
 
-            if not improved_code or not improved_code.strip():
-                continue
+            self._write_refined_test(test_path, review, improved_code, "тест")
+
+    async def _areview_and_refine_ui_autotests(self, requirements_doc, auto_dir: Path) -> None:
+        """
+        Асинхронный вариант _review_and_refine_ui_autotests: требования проверяются параллельно.
+        """
+
+        tests = self._read_autotests(requirements_doc, auto_dir, "test_ui_")
+        reviews = self._static_reviews(tests, "ui")
+        if self.llm_review_batch:
+            reviews.update(await self._abatch_reviews(tests, reviews, self.allm.review_ui_batch))
+
+        async def _one(req, test_path: Path, raw_code: str) -> None:
+            review = reviews.get(req.id)
+            if review is None:
+                try:
+                    review = await self.allm.review_ui_test(req.title, raw_code)
+                except Exception:
+                    return
 
-            problems = review.get("problems") or []
-            if problems:
-                problems_comment = "\n".join(f"# - {p}" for p in problems)
-                header = (
-                    "# REVIEW AUTO-FIX: тест автоматически переписан по замечаниям ревизора\n"
-                    "# Найденные проблемы:\n"
-                    f"{problems_comment}\n\n"
+            if review.get("ok", True):
+                self._approve(req, raw_code, "ui")
+                return
+            self.review_outcomes["refined"] += 1
+
+            try:
+                improved_code = await self.allm.refine_ui_test_with_feedback(
+                    feature=requirements_doc.feature,
+                    requirement=req,
+                    old_code=raw_code,
+                    review=review,
                 )
-            else:
-                header = "# REVIEW AUTO-FIX: тест автоматически улучшен ревизором\n\n"
+            except Exception:
+                return
 
-            final_code = header + improved_code.lstrip()
-            test_path.write_text(final_code, encoding="utf-8")
+            self._write_refined_test(test_path, review, improved_code, "тест")
+
+        await asyncio.gather(*(_one(*test) for test in tests))
+
+    @staticmethod
+    def _read_autotests(requirements_doc, auto_dir: Path, prefix: str) -> List[tuple]:
+        """
+        (требование, путь, код) для сгенерированных файлов <prefix><req.id.lower()>.py.
+        """
+        tests = []
+        for req in requirements_doc.requirements:
+            test_path = auto_dir / f"{prefix}{req.id.lower()}.py"
+            if test_path.exists():
+                tests.append((req, test_path, test_path.read_text(encoding="utf-8")))
+        return tests
+
+    def _static_reviews(self, tests: List[tuple], kind: str) -> Dict[str, dict]:
+        """
+        Вердикты статической проверки по req.id; тестов без вердикта нет в словаре — нужен ревизор.
+        """
+        reviews = {}
+        for req, _, raw_code in tests:
+            review = self._static_review(raw_code, kind)
+            if review is not None:
+                reviews[req.id] = review
+        return reviews
+
+    @staticmethod
+    def _batch_reviews(tests: List[tuple], reviews: Dict[str, dict], review_batch) -> Dict[str, dict]:
+        """
+        Пакетное ревью моделью тестов, которым не хватило статической проверки.
+        Тесты без вердикта в ответе ревизор проверит поштучно.
+        """
+        items = [(req, raw_code) for req, _, raw_code in tests if req.id not in reviews]
+        if not items:
+            return {}
+        try:
+            return review_batch(items)
+        except Exception:
+            return {}
+
+    @staticmethod
+    async def _abatch_reviews(tests: List[tuple], reviews: Dict[str, dict], review_batch) -> Dict[str, dict]:
+        items = [(req, raw_code) for req, _, raw_code in tests if req.id not in reviews]
+        if not items:
+            return {}
+        try:
+            return await review_batch(items)
+        except Exception:
+            return {}
+
+    def _static_review(self, raw_code: str, kind: str) -> dict | None:
+        """
+        Статическая проверка теста до ревизора-модели (StaticReviewGate):
+        - есть находки — отрицательное ревью с ними, тест сразу идёт в refine;
+        - находок нет — {"ok": True} без вызова ревизора,
+          а при выключенном llm_static_gate — None (решает ревизор-модель).
+        kind: "ui" или "api".
+        """
+        result = StaticReviewGate(kind).check(raw_code)
+        if not result.ok:
+            self.static_gate_stats["sent_to_refine"] += 1
+            return result.as_review()
+        if self.llm_static_gate:
+            self.static_gate_stats["review_skipped"] += 1
+            return result.as_review()
+        return None
+
+    def _approve(self, req, raw_code: str, kind: str) -> None:
+        """
+        Тест принят ревью: запоминается в индексе образцов для следующих прогонов.
+        kind: "ui" или "api".
+        """
+        self.review_outcomes["approved"] += 1
+        if self.exemplar_index is not None:
+            self.exemplar_index.add(kind, req, strip_review_header(raw_code).lstrip())
+
+    @staticmethod
+    def _write_refined_test(test_path: Path, review: dict, improved_code: str, kind: str) -> None:
+        """
+        Сохраняет исправленный тест с шапкой REVIEW AUTO-FIX.
+        kind: "тест" для UI, "API-тест" для API.
+        """
+        if not improved_code or not improved_code.strip():
+            return
+
+        problems = review.get("problems") or []
+        if problems:
+            problems_comment = "\n".join(f"# - {p}" for p in problems)
+            header = (
+                f"# REVIEW AUTO-FIX: {kind} автоматически переписан по замечаниям ревизора\n"
+                "# Найденные проблемы:\n"
+                f"{problems_comment}\n\n"
+            )
+        else:
+            header = f"# REVIEW AUTO-FIX: {kind} автоматически улучшен ревизором\n\n"
+
+        # правки строк сохраняют шапку старой версии теста — она заменяется новой
+        final_code = header + strip_review_header(improved_code).lstrip() + "\n"
+        test_path.write_text(final_code, encoding="utf-8")
 
     def generate_ui_manual_tests(self, requirements_path: str, output_dir: str) -> None:
+        self.run_artifacts.reset()
         doc = self.ui_parser.parse(Path(requirements_path))
         self.manual_generator.generate_ui_tests(doc, output_dir, llm=self.llm)
 
     def generate_ui_automation(self, requirements_path: str, output_dir: str) -> None:
+        self.run_artifacts.reset()
         doc = self.ui_parser.parse(Path(requirements_path))
         out_dir = Path(output_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
         self.ui_auto_generator.generate(doc, str(out_dir), llm=self.llm)
         self._review_and_refine_ui_autotests(doc, out_dir)
 
+    async def agenerate_ui_manual_tests(self, requirements_path: str, output_dir: str) -> None:
+        self.run_artifacts.reset()
+        doc = self.ui_parser.parse(Path(requirements_path))
+        await self.manual_generator.agenerate_ui_tests(doc, output_dir, llm=self.allm)
+
+    async def agenerate_ui_automation(self, requirements_path: str, output_dir: str) -> None:
+        self.run_artifacts.reset()
+        doc = self.ui_parser.parse(Path(requirements_path))
+        out_dir = Path(output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        await self.ui_auto_generator.agenerate(doc, str(out_dir), llm=self.allm)
+        await self._areview_and_refine_ui_autotests(doc, out_dir)
+
     # =====================================================================
     # API (OpenAPI v3)
     # =====================================================================
@@ -168,6 +681,7 @@ class AgentOrchestrator:
         """
         CLI / утилита: ручные API-кейсы из OpenAPI-файла.
         """
+        self.run_artifacts.reset()
         doc = self.openapi_parser.parse_file(openapi_path)
         self.manual_generator.generate_api_tests(doc, output_dir, llm=self.llm)
 
@@ -175,12 +689,26 @@ class AgentOrchestrator:
         """
         CLI / утилита: pytest API-тесты из OpenAPI-файла.
         """
+        self.run_artifacts.reset()
         doc = self.openapi_parser.parse_file(openapi_path)
         out_dir = Path(output_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
         self.api_auto_generator.generate_api_tests(doc, str(out_dir), llm=self.llm)
         self._review_and_refine_api_autotests(doc, out_dir)
 
+    async def agenerate_api_manual_tests(self, openapi_path: str, output_dir: str) -> None:
+        self.run_artifacts.reset()
+        doc = self.openapi_parser.parse_file(openapi_path)
+        await self.manual_generator.agenerate_api_tests(doc, output_dir, llm=self.allm)
+
+    async def agenerate_api_automation(self, openapi_path: str, output_dir: str) -> None:
+        self.run_artifacts.reset()
+        doc = self.openapi_parser.parse_file(openapi_path)
+        out_dir = Path(output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        await self.api_auto_generator.agenerate_api_tests(doc, str(out_dir), llm=self.allm)
+        await self._areview_and_refine_api_autotests(doc, out_dir)
+
     def generate_api_from_openapi_text(
         self,
         openapi_text: str,
@@ -190,6 +718,7 @@ class AgentOrchestrator:
         Кейс 2 (для Streamlit): разобрать OpenAPI 3.0 и
         сгенерировать ручные кейсы + pytest API-тесты.
         """
+        self.run_artifacts.reset()
         doc = self.openapi_parser.parse_text(openapi_text)
 
         manual_dir = Path(output_dir) / "manual_api"
@@ -198,8 +727,10 @@ class AgentOrchestrator:
         manual_dir.mkdir(parents=True, exist_ok=True)
         auto_dir.mkdir(parents=True, exist_ok=True)
 
-        self.manual_generator.generate_api_tests(doc, str(manual_dir), llm=self.llm)
-        self.api_auto_generator.generate_api_tests(doc, str(auto_dir), llm=self.llm)
+        prepared = self._prepare_fused(doc, self.llm.api_steps_and_code) if self.llm_fused else None
+
+        self.manual_generator.generate_api_tests(doc, str(manual_dir), llm=self.llm, prepared=prepared)
+        self.api_auto_generator.generate_api_tests(doc, str(auto_dir), llm=self.llm, prepared=prepared)
 
         # ревью + авто-фикс для API
         self._review_and_refine_api_autotests(doc, auto_dir)
@@ -212,6 +743,7 @@ class AgentOrchestrator:
         """
         Альтернатива: взять спецификацию из файла (yaml/json).
         """
+        self.run_artifacts.reset()
         doc = self.openapi_parser.parse_file(openapi_path)
 
         manual_dir = Path(output_dir) / "manual_api"
@@ -220,45 +752,79 @@ class AgentOrchestrator:
         manual_dir.mkdir(parents=True, exist_ok=True)
         auto_dir.mkdir(parents=True, exist_ok=True)
 
-        self.manual_generator.generate_api_tests(doc, str(manual_dir), llm=self.llm)
-        self.api_auto_generator.generate_api_tests(doc, str(auto_dir), llm=self.llm)
+        prepared = self._prepare_fused(doc, self.llm.api_steps_and_code) if self.llm_fused else None
+
+        self.manual_generator.generate_api_tests(doc, str(manual_dir), llm=self.llm, prepared=prepared)
+        self.api_auto_generator.generate_api_tests(doc, str(auto_dir), llm=self.llm, prepared=prepared)
 
         # ревью + авто-фикс для API
         self._review_and_refine_api_autotests(doc, auto_dir)
 
-    def _review_and_refine_api_autotests(self, requirements_doc, auto_dir: Path) -> None:
+    async def agenerate_api_from_openapi_text(
+        self,
+        openapi_text: str,
+        output_dir: str = "generated/api_from_openapi",
+    ) -> None:
         """
-        Прогоняет сгенерированные API-автотесты через ревизора и авто-фиксер.
+        Асинхронный вариант generate_api_from_openapi_text.
+        """
+        self.run_artifacts.reset()
+        doc = self.openapi_parser.parse_text(openapi_text)
+        await self._agenerate_api_from_doc(doc, output_dir)
 
-        Файлы генерируются ApiPytestGenerator в формате:
-            test_<req.id.lower()>.py
+    async def agenerate_api_from_openapi_file(
+        self,
+        openapi_path: str,
+        output_dir: str = "generated/api_from_openapi",
+    ) -> None:
         """
-        for req in requirements_doc.requirements:
-            file_name = f"test_{req.id.lower()}.py"
-            test_path = auto_dir / file_name
+        Асинхронный вариант generate_api_from_openapi_file.
+        """
+        self.run_artifacts.reset()
+        doc = self.openapi_parser.parse_file(openapi_path)
+        await self._agenerate_api_from_doc(doc, output_dir)
 
-            if not test_path.exists():
-                continue
+    async def _agenerate_api_from_doc(self, doc, output_dir: str) -> None:
+        manual_dir = Path(output_dir) / "manual_api"
+        auto_dir = Path(output_dir) / "auto_api"
 
-            raw_code = test_path.read_text(encoding="utf-8")
+        manual_dir.mkdir(parents=True, exist_ok=True)
+        auto_dir.mkdir(parents=True, exist_ok=True)
+
+        prepared = await self._aprepare_fused(doc, self.allm.api_steps_and_code) if self.llm_fused else None
+
+        await asyncio.gather(
+            self.manual_generator.agenerate_api_tests(doc, str(manual_dir), llm=self.allm, prepared=prepared),
+            self.api_auto_generator.agenerate_api_tests(doc, str(auto_dir), llm=self.allm, prepared=prepared),
+        )
 
-            has_todo = "TODO" in raw_code or "pass" in raw_code
+        # ревью + авто-фикс для API
+        await self._areview_and_refine_api_autotests(doc, auto_dir)
+
+    def _review_and_refine_api_autotests(self, requirements_doc, auto_dir: Path) -> None:
+        """
+        Прогоняет сгенерированные API-автотесты через ревизора и авто-фиксер.
 
-            if has_todo:
-                review = {
-                    "ok": False,
-                    "problems": [
-                        "В тесте остались заглушки TODO / pass — автогенерация не дописала шаги или проверки, тест неполный."
-                    ],
-                }
-            else:
+        Файлы генерируются ApiPytestGenerator в формате:
+            test_<req.id.lower()>.py
+        """
+        tests = self._read_autotests(requirements_doc, auto_dir, "test_")
+        reviews = self._static_reviews(tests, "api")
+        if self.llm_review_batch:
+            reviews.update(self._batch_reviews(tests, reviews, self.llm.review_api_batch))
+
+        for req, test_path, raw_code in tests:
+            review = reviews.get(req.id)
+            if review is None:
                 try:
                     review = self.llm.review_api_test(req, raw_code)
                 except Exception:
                     continue
 
             if review.get("ok", True):
+                self._approve(req, raw_code, "api")
                 continue
+            self.review_outcomes["refined"] += 1
 
             try:
                 improved_code = self.llm.refine_api_test_with_feedback(
@@ -270,22 +836,44 @@ class AgentOrchestrator:
             except Exception:
                 continue
 
-            if not improved_code or not improved_code.strip():
-                continue
+            self._write_refined_test(test_path, review, improved_code, "API-тест")
+
+    async def _areview_and_refine_api_autotests(self, requirements_doc, auto_dir: Path) -> None:
+        """
+        Асинхронный вариант _review_and_refine_api_autotests: требования проверяются параллельно.
+        """
+
+        tests = self._read_autotests(requirements_doc, auto_dir, "test_")
+        reviews = self._static_reviews(tests, "api")
+        if self.llm_review_batch:
+            reviews.update(await self._abatch_reviews(tests, reviews, self.allm.review_api_batch))
+
+        async def _one(req, test_path: Path, raw_code: str) -> None:
+            review = reviews.get(req.id)
+            if review is None:
+                try:
+                    review = await self.allm.review_api_test(req, raw_code)
+                except Exception:
+                    return
+
+            if review.get("ok", True):
+                self._approve(req, raw_code, "api")
+                return
+            self.review_outcomes["refined"] += 1
 
-            problems = review.get("problems") or []
-            if problems:
-                problems_comment = "\n".join(f"# - {p}" for p in problems)
-                header = (
-                    "# REVIEW AUTO-FIX: API-тест автоматически переписан по замечаниям ревизора\n"
-                    "# Найденные проблемы:\n"
-                    f"{problems_comment}\n\n"
+            try:
+                improved_code = await self.allm.refine_api_test_with_feedback(
+                    requirement=req,
+                    old_code=raw_code,
+                    review=review,
+                    base_url=requirements_doc.base_url,
                 )
-            else:
-                header = "# REVIEW AUTO-FIX: API-тест автоматически улучшен ревизором\n\n"
+            except Exception:
+                return
+
+            self._write_refined_test(test_path, review, improved_code, "API-тест")
 
-            final_code = header + improved_code.lstrip()
-            test_path.write_text(final_code, encoding="utf-8")
+        await asyncio.gather(*(_one(*test) for test in tests))
 
     # =====================================================================
     # Аналитика
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Tuple
+
+
+def strip_review_header(code: str) -> str:
+    """
+    Код теста без служебной шапки ревизора (# REVIEW WARNING / # REVIEW AUTO-FIX ...).
+    """
+    lines = code.splitlines()
+    while lines and (not lines[0].strip() or lines[0].startswith(("# REVIEW", "# - ", "# Найденные"))):
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _code_key(code: str) -> str:
+    """
+    Ключ кода теста без служебной шапки ревизора,
+    чтобы вердикт по тесту из генератора переиспользовался оркестратором.
+    """
+    return hashlib.sha1(strip_review_header(code).encode("utf-8")).hexdigest()
+
+
+# метод клиента -> ключ артефакта по аргументам вызова
+MEMOIZED_METHODS: Dict[str, Callable[..., Hashable]] = {
+    "ui_aaa_for_requirement": lambda requirement: requirement.id,
+    "api_aaa_steps": lambda requirement: requirement.id,
+    "api_requests_code": lambda feature, requirement: requirement.id,
+    "ui_playwright_steps": lambda feature, requirement: requirement.id,
+    "ui_playwright_steps_candidates": lambda feature, requirement, n: (requirement.id, n),
+    "api_requests_code_candidates": lambda feature, requirement, n: (requirement.id, n),
+    "ui_steps_and_code": lambda feature, requirement: requirement.id,
+    "api_steps_and_code": lambda feature, requirement: requirement.id,
+    "review_ui_test": lambda requirement_title, test_code: (requirement_title, _code_key(test_code)),
+    "review_api_test": lambda requirement, test_code: (requirement.id, _code_key(test_code)),
+}
+
+# пакетные методы раскладывают ответ по артефактам поштучного метода
+BATCH_METHODS: Dict[str, str] = {
+    "ui_aaa_batch": "ui_aaa_for_requirement",
+    "api_aaa_batch": "api_aaa_steps",
+}
+
+# пакетное ревью: элемент (requirement, test_code) -> артефакт вердикта поштучного ревью
+REVIEW_BATCH_METHODS: Dict[str, Tuple[str, Callable[[Any, str], Hashable]]] = {
+    "review_ui_batch": (
+        "review_ui_test",
+        lambda requirement, test_code: MEMOIZED_METHODS["review_ui_test"](requirement.title, test_code),
+    ),
+    "review_api_batch": (
+        "review_api_test",
+        lambda requirement, test_code: MEMOIZED_METHODS["review_api_test"](requirement, test_code),
+    ),
+}
+
+
+class RunArtifacts:
+    """
+    Хранилище артефактов одного прогона оркестратора: шаги AAA, код,
+    вердикты ревизора. Если следующий этап просит то же самое, ответ берётся
+    отсюда, а не из LLM; saved считает сэкономленные вызовы по методам,
+    requested — артефакты, запрошенные у LLM (поштучно и в пакетах).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Hashable], Any] = {}
+        self._tasks: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self.saved: Counter = Counter()
+        self.produced: Counter = Counter()
+        self.requested: Counter = Counter()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self._tasks.clear()
+            self.saved.clear()
+            self.produced.clear()
+            self.requested.clear()
+
+    @property
+    def saved_calls(self) -> int:
+        return sum(self.saved.values())
+
+    def get(self, kind: str, key: Hashable) -> Any | None:
+        with self._lock:
+            value = self._values.get((kind, key))
+            if value is not None:
+                self.saved[kind] += 1
+            return value
+
+    def put(self, kind: str, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._values[(kind, key)] = value
+            self.produced[kind] += 1
+
+    def count_requested(self, kind: str, n: int = 1) -> None:
+        with self._lock:
+            self.requested[kind] += n
+
+    def get_or_create(self, kind: str, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self.get(kind, key)
+        if value is not None:
+            return value
+        self.count_requested(kind)
+        value = factory()
+        self.put(kind, key, value)
+        return value
+
+    async def aget_or_create(self, kind: str, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Асинхронный вариант: одновременные запросы одного артефакта
+        ждут общую задачу (или пакетный запрос, который его зарезервировал),
+        а не дублируют вызов LLM.
+        """
+        while True:
+            value = self.get(kind, key)
+            if value is not None:
+                return value
+
+            with self._lock:
+                task = self._tasks.get((kind, key))
+                shared = task is not None
+                if not shared:
+                    task = asyncio.ensure_future(factory())
+                    self._tasks[(kind, key)] = task
+                    self.requested[kind] += 1
+
+            try:
+                value = await asyncio.shield(task)
+            finally:
+                with self._lock:
+                    if self._tasks.get((kind, key)) is task:
+                        del self._tasks[(kind, key)]
+
+            if shared and value is None:
+                # пакетный запрос не вернул этот артефакт (ошибка, нет в ответе) — запрашиваем сами
+                continue
+            if shared:
+                with self._lock:
+                    self.saved[kind] += 1
+            if (kind, key) not in self._values:
+                self.put(kind, key, value)
+            return value
+
+    def reserve(self, kind: str, keys: Iterable[Hashable]) -> Dict[Hashable, asyncio.Future]:
+        """
+        Резервирует артефакты под пакетный запрос: одновременные aget_or_create по этим
+        ключам ждут его ответа. Ключи, которые уже есть или запрошены, не резервируются.
+        Каждую резервацию нужно закрыть resolve, в том числе при ошибке запроса.
+        """
+        loop = asyncio.get_running_loop()
+        reserved = {}
+        with self._lock:
+            for key in keys:
+                if (kind, key) in self._values or (kind, key) in self._tasks:
+                    continue
+                reserved[key] = self._tasks[(kind, key)] = loop.create_future()
+        return reserved
+
+    def resolve(self, kind: str, reserved: Dict[Hashable, asyncio.Future], values: Dict[Hashable, Any]) -> None:
+        """
+        Ответ пакетного запроса по резервациям reserve; ключи без ответа
+        ожидающие запросят у LLM сами.
+        """
+        with self._lock:
+            for key, future in reserved.items():
+                value = values.get(key)
+                if value is not None:
+                    self._values[(kind, key)] = value
+                    self.produced[kind] += 1
+                if self._tasks.get((kind, key)) is future:
+                    del self._tasks[(kind, key)]
+                if not future.done():
+                    future.set_result(value)
+
+    def summary(self) -> dict:
+        return {
+            "saved_calls": self.saved_calls,
+            "saved_by_method": dict(self.saved),
+        }
+
+
+class RunScopedLlm:
+    """
+    Обёртка над EvolutionClient: методы из MEMOIZED_METHODS идут через RunArtifacts,
+    остальные атрибуты — напрямую к клиенту.
+    """
+
+    def __init__(self, llm: Any, artifacts: RunArtifacts) -> None:
+        self._llm = llm
+        self._artifacts = artifacts
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._llm, name)
+
+        if name in MEMOIZED_METHODS:
+            key_fn = MEMOIZED_METHODS[name]
+
+            def _memoized(*args: Any, **kwargs: Any) -> Any:
+                key = key_fn(*args, **kwargs)
+                return self._artifacts.get_or_create(name, key, lambda: attr(*args, **kwargs))
+
+            return _memoized
+
+        if name in BATCH_METHODS:
+            kind = BATCH_METHODS[name]
+
+            def _batch(requirements: list) -> Dict[str, dict]:
+                known = {r.id: self._artifacts.get(kind, r.id) for r in requirements}
+                pending = [r for r in requirements if known[r.id] is None]
+                result = {req_id: value for req_id, value in known.items() if value is not None}
+                if len(pending) > 1:
+                    self._artifacts.count_requested(kind, len(pending))
+                    fresh = attr(pending)
+                    for req_id, value in fresh.items():
+                        self._artifacts.put(kind, req_id, value)
+                    result.update(fresh)
+                return result
+
+            return _batch
+
+        if name in REVIEW_BATCH_METHODS:
+            kind, key_fn = REVIEW_BATCH_METHODS[name]
+
+            def _review_batch(items: list) -> Dict[str, dict]:
+                known = {req.id: self._artifacts.get(kind, key_fn(req, code)) for req, code in items}
+                pending = [(req, code) for req, code in items if known[req.id] is None]
+                result = {req_id: value for req_id, value in known.items() if value is not None}
+                if len(pending) > 1:
+                    fresh = attr(pending)
+                    self._put_reviews(kind, key_fn, pending, fresh)
+                    result.update(fresh)
+                return result
+
+            return _review_batch
+
+        return attr
+
+    def _put_reviews(self, kind: str, key_fn: Callable, items: list, verdicts: Dict[str, dict]) -> None:
+        for req, code in items:
+            if req.id in verdicts:
+                self._artifacts.put(kind, key_fn(req, code), verdicts[req.id])
+
+
+class AsyncRunScopedLlm(RunScopedLlm):
+    """
+    То же для AsyncEvolutionClient: методы — корутины.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._llm, name)
+
+        if name in MEMOIZED_METHODS:
+            key_fn = MEMOIZED_METHODS[name]
+
+            async def _memoized(*args: Any, **kwargs: Any) -> Any:
+                key = key_fn(*args, **kwargs)
+                return await self._artifacts.aget_or_create(name, key, lambda: attr(*args, **kwargs))
+
+            return _memoized
+
+        if name in BATCH_METHODS:
+            kind = BATCH_METHODS[name]
+
+            async def _batch(requirements: list) -> Dict[str, dict]:
+                known = {r.id: self._artifacts.get(kind, r.id) for r in requirements}
+                result = {req_id: value for req_id, value in known.items() if value is not None}
+                # резервируем до отправки: поштучные запросы тех же требований из параллельного
+                # генератора ждут ответ пакета; уже запрошенные поштучно в пакет не идут
+                reserved = self._artifacts.reserve(kind, [r.id for r in requirements if known[r.id] is None])
+                pending = [r for r in requirements if r.id in reserved]
+                fresh: Dict[str, dict] = {}
+                try:
+                    if len(pending) > 1:
+                        self._artifacts.count_requested(kind, len(pending))
+                        fresh = await attr(pending)
+                        result.update(fresh)
+                finally:
+                    self._artifacts.resolve(kind, reserved, fresh)
+                return result
+
+            return _batch
+
+        if name in REVIEW_BATCH_METHODS:
+            kind, key_fn = REVIEW_BATCH_METHODS[name]
+
+            async def _review_batch(items: list) -> Dict[str, dict]:
+                known = {req.id: self._artifacts.get(kind, key_fn(req, code)) for req, code in items}
+                pending = [(req, code) for req, code in items if known[req.id] is None]
+                result = {req_id: value for req_id, value in known.items() if value is not None}
+                if len(pending) > 1:
+                    fresh = await attr(pending)
+                    self._put_reviews(kind, key_fn, pending, fresh)
+                    result.update(fresh)
+                return result
+
+            return _review_batch
+
+        return attr
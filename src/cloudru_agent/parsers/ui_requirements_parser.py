@@ -1,10 +1,16 @@
+from __future__ import annotations
+
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional
 
 import yaml
 
 from cloudru_agent.models.requirements import UiRequirementsDocument, UiRequirement
-from cloudru_agent.llm.evolution_client import EvolutionClient
+
+if TYPE_CHECKING:
+    # клиенты LLM тянут за собой openai: импортируем их только для аннотаций
+    from cloudru_agent.llm.evolution_client import EvolutionClient
+    from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
 
 
 class UiRequirementsParser:
@@ -21,6 +27,9 @@ class UiRequirementsParser:
 
     - parse_text_with_llm(text, feature): просит Evolution FM распарсить сырой текст
       и вернуть UiRequirementsDocument.
+
+    - astream_text_with_llm(text, feature): то же, но требования отдаются по одному,
+      по мере ответа модели.
     """
 
     def parse(self, path: Path) -> UiRequirementsDocument:
@@ -45,5 +54,40 @@ class UiRequirementsParser:
         :param llm: опционально — уже созданный EvolutionClient
         :param feature: название продукта/фичи, пойдёт в промпты и в UiRequirementsDocument.feature
         """
-        client = llm or EvolutionClient()
-        return client.ui_requirements_from_text(text, feature=feature)
+        if llm is None:
+            from cloudru_agent.llm.evolution_client import EvolutionClient
+
+            llm = EvolutionClient()
+        return llm.ui_requirements_from_text(text, feature=feature)
+
+    async def aparse_text_with_llm(
+        self,
+        text: str,
+        llm: Optional[AsyncEvolutionClient] = None,
+        feature: Optional[str] = None,
+    ) -> UiRequirementsDocument:
+        """
+        Асинхронный вариант parse_text_with_llm.
+        """
+        if llm is None:
+            from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
+
+            llm = AsyncEvolutionClient()
+        return await llm.ui_requirements_from_text(text, feature=feature)
+
+    async def astream_text_with_llm(
+        self,
+        text: str,
+        llm: Optional[AsyncEvolutionClient] = None,
+        feature: Optional[str] = None,
+    ) -> AsyncIterator[UiRequirement]:
+        """
+        Требования из текста по одному, пока модель ещё отвечает
+        (см. AsyncEvolutionClient.ui_requirements_stream).
+        """
+        if llm is None:
+            from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
+
+            llm = AsyncEvolutionClient()
+        async for requirement in llm.ui_requirements_stream(text, feature=feature):
+            yield requirement
@@ -0,0 +1,42 @@
+import pytest
+
+from cloudru_agent.llm.fake_server import FakeEvolutionServer, FakeServerConfig
+from cloudru_agent.models.requirements import UiRequirement
+
+
+@pytest.fixture(autouse=True)
+def evolution_env(monkeypatch, tmp_path):
+    """
+    Клиенту нужны ключ и модели; кэш, кассета, квота и маршрутизация из окружения — выключены,
+    файлы — во временном каталоге теста.
+    """
+    monkeypatch.setenv("API_KEY", "fake")
+    monkeypatch.setenv("EVOLUTION_GEN_MODEL", "fake-gen")
+    monkeypatch.setenv("EVOLUTION_REVIEW_MODEL", "fake-review")
+    monkeypatch.setenv("EVOLUTION_CACHE", "0")
+    for name in (
+        "EVOLUTION_BASE_URL",
+        "EVOLUTION_CASSETTE",
+        "EVOLUTION_QUOTA_RPM",
+        "EVOLUTION_QUOTA_TPM",
+        "EVOLUTION_ROUTING_PATH",
+        "EVOLUTION_OUTPUT_BUDGET",
+        "EVOLUTION_EXEMPLARS",
+        "EVOLUTION_HEDGE",
+        "EVOLUTION_MAX_CONCURRENCY",
+        "EVOLUTION_PRICES",
+    ):
+        monkeypatch.delenv(name, raising=False)
+    # история длин ответов (OutputBudget) — своя в каждом тесте
+    monkeypatch.setenv("EVOLUTION_OUTPUT_BUDGET_PATH", str(tmp_path / "output_budget.sqlite"))
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def fake_server():
+    with FakeEvolutionServer(FakeServerConfig(latency_ms=20, latency_sigma=0.0, seed=1)) as server:
+        yield server
+
+
+def ui_requirement(i: int) -> UiRequirement:
+    return UiRequirement(id=f"R{i}", block="Калькулятор", title=f"Требование {i}", description="d", priority="NORMAL")
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudru_agent.llm.async_evolution_client import AsyncEvolutionClient
+from cloudru_agent.llm.concurrency import ConcurrencyController
+from cloudru_agent.llm.evolution_client import EvolutionClient
+from cloudru_agent.llm.ledger import CallLedger, LedgerEntry, ModelPrice
+
+from conftest import ui_requirement
+
+
+def test_latency_excludes_slot_wait(fake_server):
+    fake_server.config.latency_ms = 100
+    # один слот на модель: второй запрос ждёт, пока ответят на первый
+    client = EvolutionClient(
+        base_url=fake_server.url,
+        concurrency=ConcurrencyController(initial=1, max_limit=1),
+    )
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(client.ui_aaa_for_requirement, [ui_requirement(1), ui_requirement(2)]))
+
+    entries = client.ledger.entries
+    assert len(entries) == 2
+    assert all(0.09 <= e.latency_s < 0.2 for e in entries)
+    assert max(e.wait_s for e in entries) >= 0.09
+    # SLO маршрутизации считается по задержке ответа, без ожидания слота
+    assert client.ledger.latencies("ui_aaa_for_requirement") == [e.latency_s for e in entries]
+
+
+def test_cost_from_price_table(monkeypatch):
+    monkeypatch.setenv("EVOLUTION_PRICES", "fake-gen=10:30,fake-review=2")
+    ledger = CallLedger()
+    ledger.record(LedgerEntry(method="m", model="fake-gen", prompt_tokens=1000, completion_tokens=500))
+    ledger.record(LedgerEntry(method="m", model="fake-review", prompt_tokens=1000, completion_tokens=1000))
+    ledger.record(LedgerEntry(method="m", model="fake-gen", source="cache", prompt_tokens=1000))
+    ledger.record(LedgerEntry(method="m", model="other", prompt_tokens=1000))
+
+    assert [e.cost for e in ledger.entries] == [0.025, 0.004, None, None]
+    assert ledger.summary()[0]["cost"] == 0.029
+    assert "total cost: 0.029" in ledger.format_summary()
+
+
+def test_chat_goes_through_ledger(fake_server):
+    client = EvolutionClient(base_url=fake_server.url, ledger=CallLedger(prices={"fake-gen": ModelPrice(1000)}))
+    assert client.chat([{"role": "user", "content": "Привет"}], temperature=0.0)
+
+    (entry,) = client.ledger.entries
+    assert (entry.method, entry.model, entry.source) == ("chat", "fake-gen", "api")
+    assert entry.prompt_tokens and entry.cost
+
+
+def test_async_chat_goes_through_ledger(fake_server):
+    client = AsyncEvolutionClient(base_url=fake_server.url)
+    assert asyncio.run(client.chat([{"role": "user", "content": "Привет"}], model="fake-review"))
+
+    (entry,) = client.ledger.entries
+    assert (entry.method, entry.model, entry.source) == ("chat", "fake-review", "api")
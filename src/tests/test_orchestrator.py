@@ -0,0 +1,10 @@
+from cloudru_agent.orchestrator.orchestrator import AgentOrchestrator
+
+
+def test_batch_aaa_is_opt_in(monkeypatch):
+    monkeypatch.delenv("EVOLUTION_BATCH_AAA", raising=False)
+    assert AgentOrchestrator().manual_generator.batch_aaa is False
+
+    monkeypatch.setenv("EVOLUTION_BATCH_AAA", "1")
+    assert AgentOrchestrator().manual_generator.batch_aaa is True
+    assert AgentOrchestrator(llm_batch_aaa=False).manual_generator.batch_aaa is False
@@ -0,0 +1,35 @@
+from cloudru_agent.llm.evolution_client import EvolutionClient
+from cloudru_agent.llm.output_budget import OutputBudget
+
+from conftest import ui_requirement
+
+
+def test_history_persists_between_runs(tmp_path):
+    path = tmp_path / "budget.sqlite"
+    first = OutputBudget(min_samples=3, window=5, path=path)
+    for tokens in (100, 120, 110):
+        first.observe("ui_aaa_for_requirement", "fake-gen", tokens, truncated=False)
+    assert first.cap_for("ui_aaa_for_requirement", "other-model") is None
+
+    second = OutputBudget(min_samples=3, window=5, path=path)
+    assert second.cap_for("ui_aaa_for_requirement", "fake-gen") == 256
+
+    # в файле остаются только последние window ответов метода
+    for tokens in range(1000, 1010):
+        second.observe("ui_aaa_for_requirement", "fake-gen", tokens, truncated=False)
+    third = OutputBudget(min_samples=3, window=5, path=path)
+    assert list(third._lengths[("ui_aaa_for_requirement", "fake-gen")]) == list(range(1005, 1010))
+
+
+def test_next_run_caps_first_request(fake_server):
+    # первый прогон набирает историю, второй (новый процесс — новый OutputBudget) сразу ставит лимит
+    first = EvolutionClient(base_url=fake_server.url, output_budget=OutputBudget.from_env())
+    for i in range(20):
+        first.ui_aaa_for_requirement(ui_requirement(i))
+    assert all(e.max_tokens is None for e in first.ledger.entries)
+
+    second = EvolutionClient(base_url=fake_server.url, output_budget=OutputBudget.from_env())
+    second.ui_aaa_for_requirement(ui_requirement(100))
+    (entry,) = second.ledger.entries
+    assert entry.max_tokens is not None and not entry.truncated
+    assert second.output_budget.stats()["capped"] == 1
@@ -0,0 +1,39 @@
+import time
+
+import openai
+import pytest
+
+from cloudru_agent.llm.evolution_client import EvolutionClient
+from cloudru_agent.llm.quota import ModelQuota, SharedQuota
+
+from conftest import ui_requirement
+
+
+def bucket_tokens(quota: SharedQuota, model: str) -> float:
+    with quota._lock:
+        return quota._refill(model, quota.quota_for(model), time.time())[1]
+
+
+@pytest.fixture
+def quota(tmp_path):
+    # 60 токенов в минуту: оценка запроса (сотни токенов) уводит корзину в долг на минуты
+    return SharedQuota({"fake-gen": ModelQuota(tpm=60)}, path=tmp_path / "quota.sqlite")
+
+
+def test_failed_request_refunds_estimate(fake_server, quota):
+    fake_server.config.error_rate = 1.0
+    client = EvolutionClient(base_url=fake_server.url, quota=quota, max_retries=0)
+    with pytest.raises(openai.InternalServerError):
+        client.ui_aaa_for_requirement(ui_requirement(1))
+    assert bucket_tokens(quota, "fake-gen") > 0
+
+
+def test_rate_limited_request_is_charged(fake_server, quota):
+    fake_server.config.rate_limit_rate = 1.0
+    fake_server.config.retry_after_s = 30
+    client = EvolutionClient(base_url=fake_server.url, quota=quota, max_retries=0)
+    with pytest.raises(openai.RateLimitError):
+        client.ui_aaa_for_requirement(ui_requirement(1))
+    # 429: корзина пуста на Retry-After и для других процессов
+    assert bucket_tokens(quota, "fake-gen") < -20
+    assert quota.stats()["fake-gen"]["throttled"] == 1
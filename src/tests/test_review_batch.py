@@ -0,0 +1,30 @@
+from cloudru_agent.orchestrator.benchmark import run_benchmark
+
+REVIEW_METHODS = ("review_ui_test", "review_ui_batch")
+
+
+def review_calls(server):
+    return {method: server.stats[method] for method in REVIEW_METHODS if server.stats[method]}
+
+
+def test_default_static_gate_leaves_nothing_to_batch(fake_server):
+    fake_server.config.bad_code_rate = 0.5
+    (result,) = run_benchmark(requirements=6, flows=("ui",), base_url=fake_server.url, llm_review_batch=True)
+
+    # по умолчанию ревизор-модель не вызывается: находки статики — сразу в refine, чистые приняты
+    assert result.errors == 0
+    assert review_calls(fake_server) == {}
+    assert fake_server.stats["refine_ui_test_with_feedback"] > 0
+
+
+def test_review_batch_without_static_gate(fake_server):
+    (result,) = run_benchmark(
+        requirements=6,
+        flows=("ui",),
+        base_url=fake_server.url,
+        llm_review_batch=True,
+        llm_static_gate=False,
+    )
+
+    assert result.errors == 0
+    assert review_calls(fake_server) == {"review_ui_batch": 1}
@@ -0,0 +1,16 @@
+import pytest
+
+from cloudru_agent.llm.routing import RoutingTable
+
+
+def test_model_from_environment(monkeypatch):
+    monkeypatch.setenv("REVIEW_MODEL_FOR_TEST", "big-review")
+    table = RoutingTable.from_dict({"review_ui_test": {"model": "$REVIEW_MODEL_FOR_TEST"}})
+    assert table.route_for("review_ui_test").model == "big-review"
+
+
+@pytest.mark.parametrize("value", ["$REVIEW_MODEL_FOR_TEST", "${REVIEW_MODEL_FOR_TEST}"])
+def test_unset_model_variable_is_config_error(monkeypatch, value):
+    monkeypatch.delenv("REVIEW_MODEL_FOR_TEST", raising=False)
+    with pytest.raises(ValueError, match="review_ui_test.fallback_model"):
+        RoutingTable.from_dict({"review_ui_test": {"model": "small", "fallback_model": value}})
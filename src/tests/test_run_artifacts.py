@@ -0,0 +1,70 @@
+import asyncio
+from collections import Counter
+
+from cloudru_agent.orchestrator.run_artifacts import AsyncRunScopedLlm, RunArtifacts
+
+from conftest import ui_requirement
+
+
+class RecordingLlm:
+    """
+    Клиент для AsyncRunScopedLlm: считает, какие требования ушли в запросы AAA.
+    """
+
+    def __init__(self, fail_batch: bool = False) -> None:
+        self.asked: Counter = Counter()
+        self.fail_batch = fail_batch
+
+    async def ui_aaa_for_requirement(self, requirement):
+        self.asked[requirement.id] += 1
+        await asyncio.sleep(0.01)
+        return {"arrange": requirement.id, "act": "", "assert": ""}
+
+    async def ui_aaa_batch(self, requirements):
+        for requirement in requirements:
+            self.asked[requirement.id] += 1
+        await asyncio.sleep(0.01)
+        if self.fail_batch:
+            raise RuntimeError("batch failed")
+        return {r.id: {"arrange": r.id, "act": "", "assert": ""} for r in requirements}
+
+
+def run(llm, coros):
+    artifacts = RunArtifacts()
+    scoped = AsyncRunScopedLlm(llm, artifacts)
+
+    async def main():
+        return await asyncio.gather(*(coro(scoped) for coro in coros), return_exceptions=True)
+
+    return artifacts, asyncio.run(main())
+
+
+def test_batch_and_single_requests_share_one_aaa_per_requirement():
+    requirements = [ui_requirement(i) for i in range(4)]
+    llm = RecordingLlm()
+    # поштучный запрос R0 уже в полёте, пакет стартует одновременно с поштучными R1 и R2
+    artifacts, results = run(
+        llm,
+        [lambda s: s.ui_aaa_for_requirement(requirements[0])]
+        + [lambda s: s.ui_aaa_batch(requirements)]
+        + [lambda s, r=r: s.ui_aaa_for_requirement(r) for r in requirements[1:3]],
+    )
+
+    assert llm.asked == Counter({r.id: 1 for r in requirements})
+    assert artifacts.requested["ui_aaa_for_requirement"] == len(requirements)
+    assert all(result["arrange"] == r.id for result, r in zip(results[2:], requirements[1:3]))
+
+
+def test_failed_batch_leaves_requirements_to_single_requests():
+    requirements = [ui_requirement(i) for i in range(3)]
+    llm = RecordingLlm(fail_batch=True)
+    artifacts, results = run(
+        llm,
+        [lambda s: s.ui_aaa_batch(requirements)] + [lambda s: s.ui_aaa_for_requirement(requirements[0])],
+    )
+
+    assert isinstance(results[0], RuntimeError)
+    assert results[1]["arrange"] == "R0"
+    # резервация закрыта: ожидающий запросил сам, остальные не зависли
+    assert llm.asked == Counter({"R0": 2, "R1": 1, "R2": 1})
+    assert not artifacts._tasks
@@ -0,0 +1,48 @@
+from cloudru_agent.analyzers.static_review import StaticReviewGate
+
+UI_TEST = """
+import allure
+from playwright.sync_api import Page, expect
+
+CALC_URL = "https://cloud.ru/calculator"
+
+
+def test_calculator_opens(page: Page):
+    with allure.step("Arrange: открыть калькулятор"):
+        page.goto(CALC_URL)
+    with allure.step("Act: дождаться загрузки"):
+        page.wait_for_load_state()
+{body}
+"""
+
+
+def check(body: str):
+    return StaticReviewGate("ui").check(UI_TEST.format(body=body))
+
+
+def test_string_methods_on_page_url_are_not_playwright():
+    result = check(
+        '    with allure.step("Assert: открыт калькулятор"):\n'
+        "        assert page.url.startswith(CALC_URL)\n"
+        '        assert page.viewport_size["width"] > 0\n'
+    )
+    assert result.ok, result.findings
+
+
+def test_variable_from_page_url_is_not_playwright():
+    result = check(
+        '    with allure.step("Assert: открыт калькулятор"):\n'
+        "        current = page.url\n"
+        "        assert current.rstrip('/').endswith('calculator')\n"
+    )
+    assert result.ok, result.findings
+
+
+def test_unknown_playwright_method_is_still_reported():
+    result = check(
+        '    with allure.step("Assert: открыт калькулятор"):\n'
+        '        page.locator("h1").click_twice()\n'
+        '        expect(page.locator("h1")).to_be_visible()\n'
+    )
+    assert [f.code for f in result.findings] == ["unknown_api"]
+    assert "click_twice" in result.findings[0].message